@@ -0,0 +1,118 @@
+"""
+Startup benchmark: sequential vs. parallel metaclass discovery.
+
+    PYTHONPATH=src:demo python demo/benchmarks/bench_clsutil_discovery.py [modules]
+
+A synthetic plugin package with hundreds of modules is generated under
+demo/benchmarks/synthetic_plugins/ (git-ignored); every tenth module defines
+classes with the plugin metaclass. Each strategy runs in a fresh interpreter
+so that it pays for the imports.
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PACKAGE_NAME = "synthetic_plugins"
+PACKAGE_DIR = os.path.join(HERE, PACKAGE_NAME)
+
+MODULE_TEMPLATE = '''\
+import json
+import decimal
+import dataclasses
+
+from .plugin_meta import PluginMeta
+{extra_import}
+
+TABLE = {{f"key_{{i}}": decimal.Decimal(i) / 7 for i in range(300)}}
+DOC = json.dumps({{k: str(v) for k, v in TABLE.items()}})
+
+
+@dataclasses.dataclass
+class Record{index}:
+    name: str
+    value: int = 0
+
+    def describe(self):
+        return f"{{self.name}}={{self.value}}"
+
+{plugin_classes}
+'''
+
+PLUGIN_CLASSES = '''\
+class Plugin{index}(metaclass=PluginMeta):
+    def run(self):
+        return {index}
+
+
+class DerivedPlugin{index}(Plugin{index}):
+    pass
+'''
+
+STRATEGIES = {
+    "sequential": "dict()",
+    "threads(8)": "dict(workers=8)",
+    "static_scan": "dict(static_scan=True)",
+    "static_scan+threads(8)": "dict(static_scan=True, workers=8)",
+    "subprocess_prescan": "dict(subprocess_prescan=True, static_scan=True)",
+    "warm index (cache_dir)": "dict(static_scan=True, cache_dir=CACHE_DIR)",
+}
+
+RUNNER = '''
+import time, importlib
+started = time.perf_counter()
+from apibean.core.utils.clsutil import find_classes_with_metaclass
+from {package}.plugin_meta import PluginMeta
+package = importlib.import_module("{package}")
+CACHE_DIR = {cache_dir!r}
+classes = find_classes_with_metaclass(package, PluginMeta, **{options})
+print(len(classes), time.perf_counter() - started)
+'''
+
+
+def generate_package(module_count):
+    shutil.rmtree(PACKAGE_DIR, ignore_errors=True)
+    os.makedirs(PACKAGE_DIR)
+    with open(os.path.join(PACKAGE_DIR, "__init__.py"), "w") as f:
+        f.write("")
+    with open(os.path.join(PACKAGE_DIR, "plugin_meta.py"), "w") as f:
+        f.write("class PluginMeta(type):\n    pass\n")
+    for index in range(module_count):
+        plugin = index % 10 == 0
+        with open(os.path.join(PACKAGE_DIR, f"module_{index:04d}.py"), "w") as f:
+            f.write(MODULE_TEMPLATE.format(index=index,
+                    extra_import="import statistics" if index % 3 else "import fractions",
+                    plugin_classes=PLUGIN_CLASSES.format(index=index) if plugin else ""))
+
+
+def run(options, cache_dir):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in [HERE] + sys.path if p))
+    code = RUNNER.format(package=PACKAGE_NAME, options=options, cache_dir=cache_dir)
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", code], env=env,
+            capture_output=True, text=True, check=True).stdout.split()
+    return int(output[0]), float(output[1]), time.perf_counter() - started
+
+
+def main():
+    module_count = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    generate_package(module_count)
+    cache_dir = tempfile.mkdtemp(prefix="clsutil-index-")
+    try:
+        run(STRATEGIES["sequential"], cache_dir)  # compile the .pyc files once
+        run(STRATEGIES["warm index (cache_dir)"], cache_dir)  # build the persisted index
+
+        print(f"{module_count} modules")
+        print(f"{'strategy':<26} {'classes':>7} {'discovery (ms)':>15} {'process (ms)':>13}")
+        for label, options in STRATEGIES.items():
+            found, discovery, total = run(options, cache_dir)
+            print(f"{label:<26} {found:>7} {discovery * 1000:>15.1f} {total * 1000:>13.1f}")
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
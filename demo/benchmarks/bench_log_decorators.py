@@ -0,0 +1,40 @@
+"""
+Benchmark: overhead of log_function/log_function_with vs. a bare function.
+
+    PYTHONPATH=src python demo/benchmarks/bench_log_decorators.py
+
+The sink is a no-op; "INFO" means the decorators' DEBUG records are disabled
+(fast path), "DEBUG" means they are formatted and emitted.
+"""
+import timeit
+
+from loguru import logger
+
+from apibean.core.commons.logging import log_function, log_function_with, get_caller_info
+
+NUMBER = 50000
+
+
+def bare(a, b=1):
+    return a + b
+
+
+decorated = log_function(bare)
+decorated_with = log_function_with(get_caller_info(), log_function_arguments=True)(bare)
+
+
+def main():
+    logger.remove()
+    for level in ("INFO", "DEBUG"):
+        handler_id = logger.add(lambda _: None, level=level, format="{message}")
+        print(f"sink level {level}:")
+        baseline = None
+        for label, fn in [("bare", bare), ("log_function", decorated), ("log_function_with", decorated_with)]:
+            elapsed = min(timeit.repeat(lambda: fn(1, b=2), number=NUMBER, repeat=5)) / NUMBER
+            baseline = baseline or elapsed
+            print(f"  {label:<20} {elapsed * 1e9:>10.0f} ns/call {elapsed / baseline:>8.1f}x")
+        logger.remove(handler_id)
+
+
+if __name__ == "__main__":
+    main()
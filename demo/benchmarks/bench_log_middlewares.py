@@ -0,0 +1,67 @@
+"""
+Throughput benchmark: BaseHTTPMiddleware vs. pure ASGI log middlewares.
+
+    PYTHONPATH=src python demo/benchmarks/bench_log_middlewares.py [requests]
+
+Each variant serves a local Starlette app through httpx.ASGITransport, so the
+numbers only reflect the in-process middleware overhead.
+"""
+import asyncio
+import sys
+import time
+
+import httpx
+from loguru import logger
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from apibean.core.commons.logging import (
+        DynaLogLevelMiddleware, DynaLogLevelASGIMiddleware,
+        DynaLogSinksMiddleware, DynaLogSinksASGIMiddleware)
+
+HEADERS = {"X-Log-Level": "INFO", "X-Log-Sinks": "stdout,file"}
+CONCURRENCY = 16
+
+
+async def _homepage(request):
+    return PlainTextResponse("ok")
+
+
+def build_app(middlewares):
+    return Starlette(routes=[Route("/", _homepage)],
+            middleware=[Middleware(m) for m in middlewares])
+
+
+async def measure(app, total):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def worker(count):
+            for _ in range(count):
+                await client.get("/", headers=HEADERS)
+
+        await worker(50)  # warm up
+        started = time.perf_counter()
+        await asyncio.gather(*[worker(total // CONCURRENCY) for _ in range(CONCURRENCY)])
+        return (total // CONCURRENCY * CONCURRENCY) / (time.perf_counter() - started)
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    logger.remove()
+
+    variants = [
+        ("no middleware", []),
+        ("DynaLogLevelMiddleware", [DynaLogLevelMiddleware]),
+        ("DynaLogLevelASGIMiddleware", [DynaLogLevelASGIMiddleware]),
+        ("DynaLogSinksMiddleware", [DynaLogSinksMiddleware]),
+        ("DynaLogSinksASGIMiddleware", [DynaLogSinksASGIMiddleware]),
+    ]
+    for label, middlewares in variants:
+        rps = asyncio.run(measure(build_app(middlewares), total))
+        print(f"{label:<28} {rps:>10.0f} req/s")
+
+
+if __name__ == "__main__":
+    main()
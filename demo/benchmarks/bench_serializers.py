@@ -0,0 +1,63 @@
+"""
+Micro-benchmark: log record serialization throughput (records per second).
+
+    PYTHONPATH=src python demo/benchmarks/bench_serializers.py
+
+"legacy" is the previous path (build a dict, stdlib json.dumps), "stdlib" and
+"orjson" are the two backends of RecordSerializer; "serialize=True" compares
+loguru's own JSON line output with serialized_format.
+"""
+import io
+import json
+import timeit
+
+from loguru import logger
+
+from apibean.core.commons.logging import serializers
+from apibean.core.commons.logging.serializers import RecordSerializer, serialized_format
+
+NUMBER = 50000
+
+
+def make_record():
+    captured = []
+    handler_id = logger.add(lambda m: captured.append(m.record), format="{message}")
+    logger.patch(lambda r: r.update(correlation_id="5f0c6a1e9d8b4c2a")).info(
+            "GET /api/v1/orders/42 completed in 12.5ms, user=nguyễn")
+    logger.remove(handler_id)
+    return captured[0]
+
+
+def rate(fn, number=NUMBER):
+    seconds = min(timeit.repeat(fn, number=number, repeat=3))
+    return number / seconds
+
+
+def main():
+    logger.remove()
+    record = make_record()
+    serializer = RecordSerializer(log_file_function=True)
+    orjson = serializers.orjson
+
+    results = dict()
+    results["legacy: dict + json.dumps"] = rate(lambda: json.dumps(
+            serializer.to_dict(record), ensure_ascii=False, default=str).encode())
+    serializers.orjson = None
+    results["RecordSerializer (stdlib)"] = rate(lambda: serializer.dumps(record))
+    serializers.orjson = orjson
+    if orjson is not None:
+        results["RecordSerializer (orjson)"] = rate(lambda: serializer.dumps(record))
+
+    for label, options in [("loguru serialize=True", dict(serialize=True)),
+                           ("serialized_format", dict(format=serialized_format))]:
+        handler_id = logger.add(io.StringIO(), **options)
+        results[label] = rate(lambda: logger.info("GET /api/v1/orders/42 completed"), number=NUMBER // 5)
+        logger.remove(handler_id)
+
+    print(f"orjson installed: {orjson is not None}")
+    for label, records_per_second in results.items():
+        print(f"{label:<28} {records_per_second:>12,.0f} records/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Micro-benchmark: per-record cost of the dynamic sink filters vs. number of sinks.
+
+    PYTHONPATH=src python demo/benchmarks/bench_sink_filters.py
+
+"legacy" reproduces the previous filters (correlation_id_filter and two
+logger.level() lookups per sink), "current" runs the shared patcher once
+and the numeric threshold check per sink.
+"""
+import timeit
+
+from loguru import logger
+
+from apibean.core.commons.logging import context as ctx
+from apibean.core.commons.logging.correlation import correlation_id_filter
+from apibean.core.commons.logging.dynamic_level import logging_support_patcher
+from apibean.core.commons.logging.dynamic_sinks import dyna_log_sinks_filter_of
+
+SINK_NAMES = list(ctx.AVAILABLE_SINKS.keys())
+NUMBER = 20000
+
+
+def legacy_filter_of(sink_name):
+    def filter_fn(record):
+        try:
+            correlation_id_filter(record)
+            sinks = ctx.request_set_sinks.get()
+            level = ctx.request_log_level.get()
+            return (
+                sink_name in sinks
+                and logger.level(record["level"].name).no >= logger.level(level).no
+            )
+        except Exception:
+            return True
+    return filter_fn
+
+
+def make_record():
+    captured = []
+    handler_id = logger.add(lambda m: captured.append(m.record), format="{message}")
+    logger.info("benchmark record")
+    logger.remove(handler_id)
+    return captured[0]
+
+
+def bench(n_sinks, record):
+    names = SINK_NAMES[:n_sinks]
+
+    legacy = [legacy_filter_of(name) for name in names]
+    def run_legacy():
+        for fn in legacy:
+            fn(record)
+
+    current = [dyna_log_sinks_filter_of(name) for name in names]
+    def run_current():
+        logging_support_patcher(record)
+        for fn in current:
+            fn(record)
+
+    t_legacy = min(timeit.repeat(run_legacy, number=NUMBER, repeat=5)) / NUMBER
+    t_current = min(timeit.repeat(run_current, number=NUMBER, repeat=5)) / NUMBER
+    return t_legacy, t_current
+
+
+def main():
+    logger.remove()
+    record = make_record()
+    ctx.request_set_sinks.set(set(SINK_NAMES))
+    print(f"{'sinks':>5} {'legacy (us)':>12} {'current (us)':>13} {'speedup':>8}")
+    for n_sinks in range(1, len(SINK_NAMES) + 1):
+        t_legacy, t_current = bench(n_sinks, record)
+        print(f"{n_sinks:>5} {t_legacy * 1e6:>12.3f} {t_current * 1e6:>13.3f} {t_legacy / t_current:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+from ..module_a import A
+
+class D(A):
+    pass
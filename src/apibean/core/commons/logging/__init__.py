@@ -6,8 +6,10 @@ from .decorators import (logger, get_caller_info,
         jsonify_func_arg)
 
 
-from .dynamic_level import setup_static_loggers, DynaLogLevelMiddleware
-from .dynamic_sinks import setup_dynamic_loggers, DynaLogSinksMiddleware
+from .dynamic_level import (setup_static_loggers,
+        DynaLogLevelMiddleware, DynaLogLevelASGIMiddleware)
+from .dynamic_sinks import (setup_dynamic_loggers,
+        DynaLogSinksMiddleware, DynaLogSinksASGIMiddleware)
 
 from .routes import router as logging_router
 
@@ -23,7 +25,9 @@ __all__ = [
     "jsonify_func_arg",
     "setup_static_loggers",
     "DynaLogLevelMiddleware",
+    "DynaLogLevelASGIMiddleware",
     "setup_dynamic_loggers",
     "DynaLogSinksMiddleware",
+    "DynaLogSinksASGIMiddleware",
     "logging_router",
 ]
@@ -0,0 +1,263 @@
+import abc
+import sys
+import asyncio
+import socket
+import threading
+import httpx
+from collections import deque
+from typing import Optional, Tuple
+
+from .dynamic_sinks import OpensearchSink
+from .serializers import JSON_HEADERS
+from .utils import format_time_pattern
+
+# Các sink dưới đây gửi record bằng asyncio mà không chặn luồng ghi log:
+# loguru gọi write() từ bất kỳ thread nào (event loop, threadpool, thread nền),
+# record được đưa vào hàng đợi có giới hạn và được gửi bởi các worker task
+# trên event loop của sink. Dùng với enqueue=False (mặc định khi "async" được
+# bật trong cấu hình sink).
+
+def _running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class _AsyncLoopSink(abc.ABC):
+    """
+    Base of the async sinks. `write()` queues the record (bounded, the
+    oldest record is dropped when full) and at most `concurrency` worker
+    tasks send the queue with `send()` on the sink's event loop: the loop
+    running when the sink is created or first used, or a private loop thread
+    when records arrive while no loop runs. `stop()` (the handler is removed)
+    sends the queued records, then closes the connection.
+    """
+    def __init__(self, capacity: int = 10000, concurrency: int = 1, stop_timeout: float = 10.0):
+        self.capacity = capacity
+        self.concurrency = concurrency
+        self.stop_timeout = stop_timeout
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._queue = deque()
+        self._workers = 0
+        self._tasks = set()
+        self._stopped = False
+        self._private_loop = None
+        self._loop = _running_loop()
+
+    @abc.abstractmethod
+    async def send(self, message):
+        """Send one formatted record."""
+
+    async def _close(self):
+        pass
+
+    def write(self, message):
+        with self._lock:
+            if self._stopped:
+                return
+            if len(self._queue) >= self.capacity:
+                self._queue.popleft()
+                self.dropped += 1
+            self._queue.append(message)
+            if self._workers >= self.concurrency:
+                return
+            loop = self._sink_loop()
+            self._workers += 1
+        if _running_loop() is loop:
+            self._start_worker()
+            return
+        try:
+            loop.call_soon_threadsafe(self._start_worker)
+        except RuntimeError:
+            with self._lock:
+                self._workers -= 1  # loop vừa bị đóng: record được gửi ở lần sau
+
+    def _sink_loop(self):
+        # Gọi khi đang giữ self._lock
+        loop = self._loop
+        if loop is not None and not loop.is_closed() and (loop.is_running() or loop is self._private_loop):
+            return loop
+        loop = _running_loop()
+        if loop is None:
+            loop = self._ensure_private_loop()
+        self._loop = loop
+        self._workers = 0  # worker của loop cũ không còn chạy
+        return loop
+
+    def _ensure_private_loop(self):
+        if self._private_loop is None or self._private_loop.is_closed():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="log-async-sink", daemon=True).start()
+            self._private_loop = loop
+        return self._private_loop
+
+    def _start_worker(self):
+        task = asyncio.get_running_loop().create_task(self._work())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _work(self):
+        while True:
+            with self._lock:
+                if not self._queue:
+                    self._workers -= 1
+                    return
+                message = self._queue.popleft()
+            try:
+                await self.send(message)
+            except Exception as e:
+                print(f"Async sink error: {e}", file=sys.stderr)
+
+    async def complete(self):
+        """Wait until the queued records are sent (awaited by `logger.complete()`)."""
+        while True:
+            with self._lock:
+                if not self._queue and not self._workers:
+                    return
+            await asyncio.sleep(0.005)
+
+    async def aclose(self):
+        """Send the queued records, then close the connection."""
+        with self._lock:
+            self._workers += 1
+        await self._work()  # cùng các worker đang chạy gửi nốt hàng đợi
+        await self.complete()
+        await self._close()
+
+    def stop(self):
+        # loguru gọi stop() khi handler bị remove / lúc thoát
+        with self._lock:
+            self._stopped = True
+            loop = self._loop
+            if loop is None or loop.is_closed() or not loop.is_running():
+                loop = self._ensure_private_loop()
+        if _running_loop() is loop:
+            # Không thể chờ trên chính event loop của sink
+            task = loop.create_task(self.aclose())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self.aclose(), loop).result(timeout=self.stop_timeout)
+        except Exception as e:
+            print(f"Async sink stop error: {e}", file=sys.stderr)
+        finally:
+            private_loop, self._private_loop = self._private_loop, None
+            if private_loop is not None:
+                private_loop.call_soon_threadsafe(private_loop.stop)
+
+
+# --- Async TCP network sink ---
+class AsyncNetworkSink(_AsyncLoopSink):
+    def __init__(self, host="localhost", port=9009, capacity: int = 10000):
+        super().__init__(capacity=capacity, concurrency=1)  # một worker: giữ thứ tự record
+        self.addr = (host, port)
+        self._writer_loop = None
+        self._writer = None
+
+    async def _ensure_writer(self):
+        loop = asyncio.get_running_loop()
+        if self._writer_loop is not loop:
+            # Stream gắn với event loop, tạo lại khi loop thay đổi
+            self._writer_loop = loop
+            self._writer = None
+        if self._writer is None or self._writer.is_closing():
+            _, self._writer = await asyncio.open_connection(*self.addr)
+        return self._writer
+
+    async def send(self, message):
+        try:
+            writer = await self._ensure_writer()
+            writer.write(message.encode())
+            await writer.drain()
+        except Exception as e:
+            self._writer = None
+            print(f"Network send error: {e}", file=sys.stderr)
+
+    async def _close(self):
+        writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+# --- Async Opensearch sink ---
+class AsyncOpensearchSink(_AsyncLoopSink, OpensearchSink):
+    def __init__(self, endpoint="http://localhost:9200/logs/_doc",
+            http_auth: Optional[Tuple] = None,
+            verify_certs: bool = True,
+            ssl_show_warn: bool = False,
+            log_file_function: bool = False,
+            log_proc_thread: bool = False,
+            timeout: float = 60,
+            transport: Optional[httpx.AsyncBaseTransport] = None,
+            capacity: int = 10000,
+            concurrency: int = 4):
+        _AsyncLoopSink.__init__(self, capacity=capacity, concurrency=concurrency)
+        OpensearchSink.__init__(self, endpoint, http_auth=http_auth,
+                verify_certs=verify_certs,
+                ssl_show_warn=ssl_show_warn,
+                log_file_function=log_file_function,
+                log_proc_thread=log_proc_thread)
+        self.timeout = timeout
+        self.transport = transport
+        self._client_loop = None
+        self._client = None
+
+    def _get_client(self):
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client_loop = loop
+            self._client = httpx.AsyncClient(auth=self.http_auth,
+                    verify=self.verify_certs, timeout=self.timeout,
+                    transport=self.transport)
+        return self._client
+
+    async def send(self, message):
+        try:
+            record = message.record
+            content = self.serializer.dumps(record)
+            endpoint = format_time_pattern(self.endpoint)
+            await self._get_client().post(endpoint, content=content, headers=JSON_HEADERS)
+        except Exception as e:
+            print(f"Opensearch error: {e}", file=sys.stderr)
+
+    async def _close(self):
+        client, self._client = self._client, None
+        if client is not None:
+            await client.aclose()
+
+# --- Async syslog sink ---
+class AsyncSyslogSink(_AsyncLoopSink):
+    def __init__(self, address="/dev/log", capacity: int = 10000):
+        super().__init__(capacity=capacity, concurrency=1)
+        self.address = address
+        self._transport_loop = None
+        self._transport = None
+
+    async def _ensure_transport(self):
+        loop = asyncio.get_running_loop()
+        if self._transport is None or self._transport_loop is not loop or self._transport.is_closing():
+            self._transport_loop = loop
+            self._transport, _ = await loop.create_datagram_endpoint(
+                    asyncio.DatagramProtocol,
+                    remote_addr=self.address,
+                    family=socket.AF_UNIX)
+        return self._transport
+
+    async def send(self, message):
+        try:
+            transport = await self._ensure_transport()
+            transport.sendto(message.encode())
+        except Exception as e:
+            self._transport = None
+            print(f"Syslog error: {e}", file=sys.stderr)
+
+    async def _close(self):
+        transport, self._transport = self._transport, None
+        if transport is not None:
+            transport.close()
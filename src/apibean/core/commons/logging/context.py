@@ -3,15 +3,27 @@ from contextvars import ContextVar
 from typing import Optional
 
 DEFAULT_LOG_LEVEL = "DEBUG"
+DEFAULT_LOG_LEVEL_NO = 10
 DEFAULT_STR_SINKS = "stdout"
 
 # --- ContextVars ---
 default_log_level: str = DEFAULT_LOG_LEVEL
 request_log_level: ContextVar[str] = ContextVar("request_log_level", default=default_log_level)
 
+# Ngưỡng dạng số của request_log_level, được resolve một lần cho mỗi request
+default_log_level_no: int = DEFAULT_LOG_LEVEL_NO
+request_log_level_no: ContextVar[int] = ContextVar("request_log_level_no", default=default_log_level_no)
+
 default_str_sinks: str = DEFAULT_STR_SINKS
-default_set_sinks: set = {DEFAULT_STR_SINKS}
-request_set_sinks: ContextVar[set] = ContextVar("request_set_sinks", default=default_set_sinks)
+default_set_sinks: frozenset = frozenset({DEFAULT_STR_SINKS})
+request_set_sinks: ContextVar[frozenset] = ContextVar("request_set_sinks", default=default_set_sinks)
+
+# Tỉ lệ head sampling theo correlation_id (None → dùng default_sample_rate)
+default_sample_rate: float = 1.0
+request_sample_rate: ContextVar[Optional[float]] = ContextVar("request_sample_rate", default=None)
+
+# Buffer "tail-based" của request hiện tại (None → không buffer)
+request_tail_buffer: ContextVar[Optional[object]] = ContextVar("request_tail_buffer", default=None)
 
 correlation_id: ContextVar[Optional[str]] = ContextVar('correlation_id', default=None)
 
@@ -31,6 +43,13 @@ AVAILABLE_SINKS = {
         "retention": "10 days",
         "compression": "tar.gz",
         "colorize": False,
+        # True → các worker gửi record tới một tiến trình ghi file duy nhất
+        "multiprocess": False,
+        "params": {
+            "socket_path": None,
+            "write_buffer": 1024 * 1024,
+            "flush_interval": 1.0,
+        },
     },
     "null": {
         "enabled": True,
@@ -39,23 +58,33 @@ AVAILABLE_SINKS = {
     },
     "network": {
         "enabled": False,
+        "async": False,
         "params": {
             "host": "localhost",
             "port": 9009,
+            "protocol": "tcp",
+            "framing": None,
+            "buffer_size": 10000,
         },
         "format": "{message}",
     },
     "opensearch": {
         "enabled": False,
+        "async": False,
         "params": {
             "url": "http://localhost:9200/logs/_doc",
             "username": None,
             "password": None,
+            "bulk": False,
+            "batch_size": 500,
+            "batch_bytes": 5 * 1024 * 1024,
+            "flush_interval": 2.0,
         },
         "format": "{time} {level.name[0]} [{correlation_id}] {name}:{line} - {message}",
     },
     "syslog": {
         "enabled": False,
+        "async": False,
         "address": "/dev/log",
         "format": "{level}: {message}",
     },
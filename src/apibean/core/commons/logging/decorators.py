@@ -1,139 +1,374 @@
 import inspect
-import json
+import sys
 
 from functools import wraps
+from time import perf_counter_ns
 from typing import Callable, Dict, Optional
 from loguru import logger
 from pydantic import BaseModel
 
+from . import context as ctx
+from .metrics import get_latency_histogram
+from .serializers import dumps_str
+from .tail_buffer import tail_config
+
 def log_function(func):
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        return log_function_wrapper(func, args, kwargs,
-                is_class_method=False)
-    return wrapper
+    return _make_wrapper(func, is_class_method=False)
 
 
-def log_function_with(caller_info: Optional[Dict],
+def log_function_with(caller_info: Optional[Dict]=None,
         arguments_extractor: Optional[Callable]=None,
         log_function_arguments: bool=False, 
         ignore_log_exception: bool=False,
+        auto_caller_info: bool=False,
         **log_kwargs):
+    if caller_info is None and auto_caller_info:
+        caller_info = _caller_info_of(sys._getframe(1))
     def internal_inject(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            return log_function_wrapper(func, args, kwargs,
+        # logger đã bind caller_info được tạo một lần cho mỗi hàm được decorate
+        bound_logger = _bind_caller_info(caller_info)
+        return _make_wrapper(func,
                 is_class_method=False,
                 arguments_extractor=arguments_extractor,
                 log_function_arguments=log_function_arguments,
                 ignore_log_exception=ignore_log_exception,
-                caller_info=caller_info,
+                bound_logger=bound_logger,
                 **log_kwargs)
-        return wrapper
     return internal_inject
 
 
 def log_method(func):
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        return log_function_wrapper(func, args, kwargs,
-                is_class_method=True)
-    return wrapper
+    return _make_wrapper(func, is_class_method=True)
 
 
-def log_method_with(caller_info: Optional[Dict],
+def log_method_with(caller_info: Optional[Dict]=None,
         arguments_extractor: Optional[Callable]=None,
         log_function_arguments: bool=False, 
         ignore_log_exception: bool=False,
+        auto_caller_info: bool=False,
         **log_kwargs):
+    if caller_info is None and auto_caller_info:
+        caller_info = _caller_info_of(sys._getframe(1))
     def internal_inject(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            return log_function_wrapper(func, args, kwargs,
+        bound_logger = _bind_caller_info(caller_info)
+        return _make_wrapper(func,
                 is_class_method=True,
                 arguments_extractor=arguments_extractor,
                 log_function_arguments=log_function_arguments,
                 ignore_log_exception=ignore_log_exception,
-                caller_info=caller_info,
+                bound_logger=bound_logger,
                 **log_kwargs)
-        return wrapper
     return internal_inject
 
 
+def _caller_info_of(frame):
+    # Đọc tên module từ globals của frame, nhanh hơn nhiều so với inspect.getmodule()
+    return dict(name=frame.f_globals.get('__name__', '__main__'), line=frame.f_lineno)
+
+
 def get_caller_info():
-    frame = inspect.currentframe().f_back
-    module = inspect.getmodule(frame)
-    module_name = module.__name__ if module else '__main__'
-    lineno = frame.f_lineno
-    return dict(name=module_name, line=lineno)
+    return _caller_info_of(sys._getframe(1))
 
 
-def log_function_wrapper(func, args, kwargs,
-        is_class_method: bool=True,
-        log_function_arguments: bool=False,
-        arguments_extractor: Optional[Callable]=None,
-        return_values_extractor: Optional[Callable]=None,
-        ignore_log_begin: bool=False, ignore_log_end: bool=False,
-        ignore_log_exception: bool=False,
-        logging_level: str='DEBUG',
-        caller_info: Optional[Dict]=None):
-    xlogger = logger if caller_info is None else logger.bind(caller_info=caller_info)
+def _bind_caller_info(caller_info: Optional[Dict]):
+    return logger if caller_info is None else logger.bind(caller_info=caller_info)
 
-    if ignore_log_begin is not True:
-        if callable(arguments_extractor):
-            try:
-                args_str = arguments_extractor(args[1:] if is_class_method else args, kwargs)
-            except Exception as exc:
-                args_str = f"<arguments_extractor-error: {str(exc)}>"
 
-            if not isinstance(args_str, str):
-                args_str = str(args_str)
+_level_no_cache: Dict[str, int] = {}
 
-            xlogger.log(logging_level, f"{func.__qualname__} function started with: { args_str }")
+def _level_no_of(level) -> Optional[int]:
+    if isinstance(level, int):
+        return level
+    level_no = _level_no_cache.get(level)
+    if level_no is None:
+        try:
+            level_no = logger.level(level).no
+        except ValueError:
+            return None
+        _level_no_cache[level] = level_no
+    return level_no
 
-        elif log_function_arguments:
-            try:
-                if is_class_method:
-                    xlogger.log(logging_level, f"{func.__qualname__} method started with args={args[1:]}, kwargs={kwargs}")
-                else:
-                    xlogger.log(logging_level, f"{func.__qualname__} function started with args={args}, kwargs={kwargs}")
-            except: ...
-        else:
+
+def is_log_level_enabled(level) -> bool:
+    """
+    Cheap check whether a record at `level` could reach any sink: it must pass
+    the lowest level of the registered handlers and either the request level
+    or, when the request has a tail buffer, the tail buffer level.
+    """
+    level_no = _level_no_of(level)
+    if level_no is None:
+        return True  # level chưa đăng ký → để logger.log() báo lỗi như cũ
+    # Level thấp nhất trong các handler đang có: loguru không có API công khai,
+    # thiếu thuộc tính (phiên bản loguru khác) → không loại record nào ở bước này
+    min_level = getattr(getattr(logger, "_core", None), "min_level", None)
+    if min_level is not None and level_no < min_level:
+        return False
+    if level_no >= ctx.request_log_level_no.get():
+        return True
+    # Record dưới level của request vẫn cần được tạo để tail buffer giữ lại
+    buffer = ctx.request_tail_buffer.get()
+    return buffer is not None and not buffer.closed and level_no >= tail_config.level_no
+
+
+def _make_wrapper(func, **options):
+    # Các tuỳ chọn được resolve một lần khi decorate, mỗi lần gọi chỉ kiểm tra level
+    logging = _FunctionLogging(func, **options)
+
+    # Chọn wrapper theo loại callable: coroutine, async generator, generator, hàm thường
+    if inspect.iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            return await logging.acall(args, kwargs)
+        return async_wrapper
+
+    if inspect.isasyncgenfunction(func):
+        @wraps(func)
+        def asyncgen_wrapper(*args, **kwargs):
+            return logging.agen(args, kwargs)
+        return asyncgen_wrapper
+
+    if inspect.isgeneratorfunction(func):
+        @wraps(func)
+        def generator_wrapper(*args, **kwargs):
+            return logging.gen(args, kwargs)
+        return generator_wrapper
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        return logging.call(args, kwargs)
+    return wrapper
+
+
+def _log_begin(xlogger, func, args, kwargs,
+        is_class_method: bool,
+        log_function_arguments: bool,
+        arguments_extractor: Optional[Callable],
+        logging_level: str):
+    if callable(arguments_extractor):
+        try:
+            args_str = arguments_extractor(args[1:] if is_class_method else args, kwargs)
+        except Exception as exc:
+            args_str = f"<arguments_extractor-error: {str(exc)}>"
+
+        if not isinstance(args_str, str):
+            args_str = str(args_str)
+
+        xlogger.log(logging_level, f"{func.__qualname__} function started with: { args_str }")
+
+    elif log_function_arguments:
+        try:
             if is_class_method:
-                xlogger.log(logging_level, f"{func.__qualname__} method started")
+                xlogger.log(logging_level, f"{func.__qualname__} method started with args={args[1:]}, kwargs={kwargs}")
             else:
-                xlogger.log(logging_level, f"{func.__qualname__} function started")
+                xlogger.log(logging_level, f"{func.__qualname__} function started with args={args}, kwargs={kwargs}")
+        except: ...
+    else:
+        if is_class_method:
+            xlogger.log(logging_level, f"{func.__qualname__} method started")
+        else:
+            xlogger.log(logging_level, f"{func.__qualname__} function started")
 
-    if ignore_log_exception is not True:
+
+def _log_end(xlogger, func, result,
+        return_values_extractor: Optional[Callable],
+        logging_level: str):
+    if callable(return_values_extractor):
+        try:
+            return_values = return_values_extractor(result)
+        except Exception as exc:
+            return_values = f"<return_values_extractor-error: {str(exc)}>"
+
+        if not isinstance(return_values, str):
+            return_values = str(return_values)
+
+        xlogger.log(logging_level, f"{func.__qualname__} return with values '{return_values}'")
+    else:
+        xlogger.log(logging_level, f"{func.__qualname__} ... done")
+
+
+def _log_exception(xlogger, func, error):
+    xlogger.exception(f"{func.__qualname__} failed with exception", exc_info=error)
+
+
+class _FunctionLogging:
+    """
+    Logging options of one decorated function, resolved at decoration time.
+    The logger is only bound when a record is actually written.
+    """
+    __slots__ = ("func", "is_class_method", "log_function_arguments",
+            "arguments_extractor", "return_values_extractor", "ignore_log_begin",
+            "ignore_log_end", "log_exception", "logging_level", "caller_info", "bound_logger",
+            "histogram")
+
+    def __init__(self, func,
+            is_class_method: bool=True,
+            log_function_arguments: bool=False,
+            arguments_extractor: Optional[Callable]=None,
+            return_values_extractor: Optional[Callable]=None,
+            ignore_log_begin: bool=False, ignore_log_end: bool=False,
+            ignore_log_exception: bool=False,
+            logging_level: str='DEBUG',
+            caller_info: Optional[Dict]=None,
+            bound_logger=None,
+            timing: bool=False):
+        self.func = func
+        self.is_class_method = is_class_method
+        self.log_function_arguments = log_function_arguments
+        self.arguments_extractor = arguments_extractor
+        self.return_values_extractor = return_values_extractor
+        self.ignore_log_begin = ignore_log_begin is True
+        self.ignore_log_end = ignore_log_end is True
+        self.log_exception = ignore_log_exception is not True
+        self.logging_level = logging_level
+        self.caller_info = caller_info
+        self.bound_logger = bound_logger
+        # timing=True: đo thời gian mỗi lần gọi, đưa vào histogram theo __qualname__
+        self.histogram = get_latency_histogram(func.__qualname__) if timing else None
+
+    @property
+    def xlogger(self):
+        if self.bound_logger is None:
+            self.bound_logger = _bind_caller_info(self.caller_info)
+        return self.bound_logger
+
+    def begin(self, args, kwargs):
+        if not self.ignore_log_begin:
+            _log_begin(self.xlogger, self.func, args, kwargs,
+                    self.is_class_method,
+                    self.log_function_arguments,
+                    self.arguments_extractor,
+                    self.logging_level)
+
+    def end(self, result, elapsed_ns: Optional[int]=None):
+        if not self.ignore_log_end:
+            xlogger = self.xlogger
+            if elapsed_ns is not None:
+                xlogger = xlogger.bind(elapsed_ns=elapsed_ns)
+            _log_end(xlogger, self.func, result,
+                    self.return_values_extractor,
+                    self.logging_level)
+
+    def observe(self, started_ns: Optional[int]) -> Optional[int]:
+        if started_ns is None:
+            return None
+        elapsed_ns = perf_counter_ns() - started_ns
+        self.histogram.observe(elapsed_ns)
+        return elapsed_ns
+
+    def start(self) -> Optional[int]:
+        return perf_counter_ns() if self.histogram is not None else None
+
+    def failed(self, error):
+        if self.log_exception:
+            _log_exception(self.xlogger, self.func, error)
+
+    def call(self, args, kwargs):
+        func = self.func
+        enabled = is_log_level_enabled(self.logging_level)
+        if not enabled and self.histogram is None:
+            # Fast path: không record begin/end nào được ghi → bỏ qua format và bind
+            if not self.log_exception:
+                return func(*args, **kwargs)
+            try:
+                return func(*args, **kwargs)
+            except Exception as error:
+                self.failed(error)
+                raise error
+
+        if enabled:
+            self.begin(args, kwargs)
+        started_ns = self.start()
         try:
             result = func(*args, **kwargs)
         except Exception as error:
-            xlogger.exception(f"{func.__qualname__} failed with exception", exc_info=error)
+            self.observe(started_ns)
+            self.failed(error)
             raise error
-    else:
-        result = func(*args, **kwargs)
+        elapsed_ns = self.observe(started_ns)
+        if enabled:
+            self.end(result, elapsed_ns)
+        return result
+
+    async def acall(self, args, kwargs):
+        enabled = is_log_level_enabled(self.logging_level)
+        if enabled:
+            self.begin(args, kwargs)
+        started_ns = self.start()
+        try:
+            result = await self.func(*args, **kwargs)
+        except Exception as error:
+            self.observe(started_ns)
+            self.failed(error)
+            raise error
+        elapsed_ns = self.observe(started_ns)
+        if enabled:
+            self.end(result, elapsed_ns)
+        return result
+
+    def gen(self, args, kwargs):
+        enabled = is_log_level_enabled(self.logging_level)
+        if enabled:
+            self.begin(args, kwargs)
+        started_ns = self.start()
+        try:
+            # yield from chuyển tiếp cả send()/throw()/close() tới generator gốc
+            result = yield from self.func(*args, **kwargs)
+        except Exception as error:
+            self.observe(started_ns)
+            self.failed(error)
+            raise error
+        elapsed_ns = self.observe(started_ns)
+        if enabled:
+            self.end(result, elapsed_ns)
+        return result
 
-    if ignore_log_end is not True:
-        if callable(return_values_extractor):
+    async def agen(self, args, kwargs):
+        enabled = is_log_level_enabled(self.logging_level)
+        if enabled:
+            self.begin(args, kwargs)
+        started_ns = self.start()
+        agen = self.func(*args, **kwargs)
+        try:
             try:
-                return_values = return_values_extractor(result)
-            except Exception as exc:
-                return_values = f"<return_values_extractor-error: {str(exc)}>"
+                item = await agen.__anext__()
+            except StopAsyncIteration:
+                item = _EXHAUSTED
+            while item is not _EXHAUSTED:
+                try:
+                    sent = yield item
+                except GeneratorExit:
+                    await agen.aclose()
+                    raise
+                except BaseException as exc:
+                    try:
+                        item = await agen.athrow(exc)
+                    except StopAsyncIteration:
+                        item = _EXHAUSTED
+                else:
+                    try:
+                        item = await agen.asend(sent)
+                    except StopAsyncIteration:
+                        item = _EXHAUSTED
+        except Exception as error:
+            self.observe(started_ns)
+            self.failed(error)
+            raise error
+        elapsed_ns = self.observe(started_ns)
+        if enabled:
+            self.end(None, elapsed_ns)
 
-            if not isinstance(return_values, str):
-                return_values = str(return_values)
 
-            xlogger.log(logging_level, f"{func.__qualname__} return with values '{return_values}'")
-        else:
-            xlogger.log(logging_level, f"{func.__qualname__} ... done")
+_EXHAUSTED = object()
+
 
-    return result
+def log_function_wrapper(func, args, kwargs, **options):
+    return _FunctionLogging(func, **options).call(args, kwargs)
 
 
 def jsonify_func_arg(arg):
     if isinstance(arg, BaseModel):
         return arg.model_dump_json(exclude_none=True)
     try:
-        return json.dumps(arg, ensure_ascii=False, default=str)
+        return dumps_str(arg)
     except:
         return None
@@ -1,54 +1,220 @@
 import sys
+import threading
+
+from datetime import datetime, timezone
+from typing import Optional
 
 from fastapi import Request
 from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
 from loguru import logger
 
 from .context import DEFAULT_LOG_LEVEL
 from . import context as ctx
+from .serializers import resolve_format
+from .sampling import sample_record, KEY_SAMPLED_OUT
+from .tail_buffer import tail_buffer_record, KEY_TAIL_REPLAY
+from .correlation import correlation_id_filter, KEY_CORRELATION_ID
+
+def ensure_correlation_id(record):
+    # Patcher chưa được cài (filter dùng riêng, hoặc app đã thay patcher)
+    if KEY_CORRELATION_ID not in record:
+        correlation_id_filter(record)
+
 
 # Hàm filter theo mức log trong ContextVar
 def dyna_log_level_filter(record):
+    ensure_correlation_id(record)
+    return (
+        (record["level"].no >= ctx.request_log_level_no.get() or KEY_TAIL_REPLAY in record)
+        and KEY_SAMPLED_OUT not in record
+    )
+
+
+def set_default_log_level(level: str):
+    level = level.upper()
+    level_no = logger.level(level).no  # ValueError nếu level không hợp lệ
+    ctx.default_log_level = level
+    ctx.default_log_level_no = level_no
+
+
+def set_request_log_level(header_level: Optional[str]):
+    level = (header_level or ctx.default_log_level).upper()
     try:
-        level = ctx.request_log_level.get()
-        return logger.level(record["level"].name).no >= logger.level(level).no
-    except Exception:
-        return True  # fallback nếu có lỗi
+        # Kiểm tra tính hợp lệ của log level và resolve ngưỡng dạng số một lần
+        level_no = logger.level(level).no
+    except ValueError:
+        logger.warning(f"Invalid X-Log-Level: {level} — fallback to {ctx.default_log_level}")
+        level, level_no = ctx.default_log_level, ctx.default_log_level_no
+    ctx.request_log_level.set(level)
+    ctx.request_log_level_no.set(level_no)
 
 
 class DynaLogLevelMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
-        header_level = request.headers.get("X-Log-Level", ctx.default_log_level).upper()
-        try:
-            # Kiểm tra tính hợp lệ của log level
-            logger.level(header_level)
-            ctx.request_log_level.set(header_level)
-        except ValueError:
-            logger.warning(f"Invalid X-Log-Level: {header_level} — fallback to {ctx.default_log_level}")
-            ctx.request_log_level.set(ctx.default_log_level)
+        set_request_log_level(request.headers.get("X-Log-Level"))
 
         response = await call_next(request)
         return response
 
 
-from .correlation import correlation_id_filter
+HEADER_LOG_LEVEL = b"x-log-level"
+
+def find_scope_header(scope: Scope, header_name: bytes) -> Optional[str]:
+    for name, value in scope["headers"]:
+        if name == header_name:
+            return value.decode("latin-1")
+    return None
+
+
+class DynaLogLevelASGIMiddleware:
+    """
+    Pure ASGI version of DynaLogLevelMiddleware: reads X-Log-Level straight
+    from scope["headers"] and sets the ContextVars before calling the app.
+    """
+    def __init__(self, app: ASGIApp):
+        self.app = app
 
-def _logging_support_filter(record):
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] in ("http", "websocket"):
+            set_request_log_level(find_scope_header(scope, HEADER_LOG_LEVEL))
+        await self.app(scope, receive, send)
+
+
+def logging_support_patcher(record):
+    # Chạy một lần cho mỗi record (patcher của loguru), trước filter của các sink
     correlation_id_filter(record)
-    return dyna_log_level_filter(record)
+    if KEY_TAIL_REPLAY in record["extra"]:
+        return  # record phát lại từ tail buffer: đã qua sampling/buffer lúc ghi
+    if sample_record(record):
+        tail_buffer_record(record)
+
+logging_support_patcher.apibean_support = True
+
+
+def install_logging_support_patcher():
+    """
+    Install `logging_support_patcher` as the loguru patcher, chained after
+    the patcher already installed by the application (if any).
+
+    `logger.configure(patcher=...)` replaces the patcher: an application that
+    installs its own patcher afterwards must call this again, otherwise the
+    records are neither sampled nor tail-buffered (the filters still add
+    `correlation_id`).
+    """
+    # loguru không có API đọc patcher hiện tại: thiếu thuộc tính → coi như chưa có
+    previous = getattr(getattr(logger, "_core", None), "patcher", None)
+    if getattr(previous, "apibean_support", False):
+        return  # đã cài (có thể đã nối sau patcher của app)
+    if previous is None:
+        logger.configure(patcher=logging_support_patcher)
+        return
+
+    def chained_patcher(record):
+        previous(record)
+        logging_support_patcher(record)
+
+    chained_patcher.apibean_support = True
+    logger.configure(patcher=chained_patcher)
+
+
+class HandlerSwitch:
+    """
+    Hands a sink over from its old handler to a new one without losing or
+    duplicating records. The new handler is added with the next generation,
+    `switch()` makes it current, then the old handler is removed.
+
+    A record created before the switch may reach only the old handler (the
+    handlers snapshot was taken before the add) or only the new one (taken
+    after the remove). Every handler of the switch marks the records it
+    accepts and skips the marked ones, so a record is written once even when
+    the switch happens between two filters. The old handler is removed
+    after HANDLER_RETIRE_DELAY (`retire_handler`) so that the records it has
+    accepted are written before it stops.
+    """
+    __slots__ = ("generation", "marker", "_ended")
+
+    # Số generation cũ được nhớ thời điểm kết thúc
+    MAX_RETIRED = 64
+
+    def __init__(self, name: str):
+        self.generation = 0
+        self.marker = f"_emitted_by_{name}"
+        self._ended = dict()
+
+    def switch(self, generation: int):
+        ended = self._ended
+        ended[self.generation] = datetime.now(timezone.utc)
+        if len(ended) > self.MAX_RETIRED:
+            del ended[next(iter(ended))]
+        self.generation = generation
+
+    def admits(self, generation: int, record) -> bool:
+        marker = self.marker
+        if marker in record:
+            return False
+        if generation != self.generation:
+            # Handler cũ: chỉ nhận record tạo trước khi generation của nó kết thúc
+            ended_at = self._ended.get(generation)
+            if ended_at is None or record["time"] > ended_at:
+                return False
+        record[marker] = True
+        return True
+
+
+# Thời gian handler cũ còn được giữ sau khi chuyển (giây)
+HANDLER_RETIRE_DELAY = 0.5
+
+
+def remove_handler(handler_id: int):
+    try:
+        logger.remove(handler_id)  # chờ queue của handler (enqueue) được xử lý hết
+    except ValueError:
+        pass  # handler đã bị xoá từ bên ngoài (logger.remove())
+
+
+def retire_handler(handler_id: int):
+    """Remove a switched-out handler once its in-flight records are written."""
+    timer = threading.Timer(HANDLER_RETIRE_DELAY, remove_handler, (handler_id,))
+    timer.daemon = True
+    timer.start()
+
+
+# Handler của lần cấu hình trước (None → chưa cấu hình lần nào)
+_static_handler_ids = None
+# Mỗi handler một switch: marker của switch chỉ dùng cho các generation của nó
+_static_switches = dict(stdout=HandlerSwitch("static_stdout"), file=HandlerSwitch("static_file"))
+
+def _static_filter_of(switch: HandlerSwitch, generation: int):
+    def filter_fn(record):
+        return dyna_log_level_filter(record) and switch.admits(generation, record)
+    return filter_fn
 
 
 def setup_static_loggers(configs = dict()):
-    logger.remove()
+    """
+    Install the stdout/file handlers. The first call removes the handlers
+    installed before; later calls add the new handlers, switch to them and
+    only then retire the previous ones, so no record is lost.
+
+    Installs the logging support patcher (correlation id, sampling, tail
+    buffer) after the application's patcher, see
+    `install_logging_support_patcher`.
+    """
+    global _static_handler_ids
+    if _static_handler_ids is None:
+        logger.remove()
+    install_logging_support_patcher()
+    generations = {name: switch.generation + 1 for name, switch in _static_switches.items()}
 
     stdout_logger_id = None
     config = configs.get("stdout", {})
     if config.get("enabled", False):
         opts1 = dict(level=config.get("level", DEFAULT_LOG_LEVEL),
             colorize=config.get("colorize", True),
-            filter=_logging_support_filter)
+            filter=_static_filter_of(_static_switches["stdout"], generations["stdout"]))
         if "format" in config:
-            opts1.update(format=config.get("format"))
+            opts1.update(format=resolve_format(config.get("format")))
         stdout_logger_id = logger.add(sys.stdout, **opts1)
 
     file_logger_id = None
@@ -56,9 +222,9 @@ def setup_static_loggers(configs = dict()):
     if config.get("enabled", False):
         opts2 = dict(level=config.get("level", DEFAULT_LOG_LEVEL),
             colorize=config.get("colorize", True),
-            filter=_logging_support_filter)
+            filter=_static_filter_of(_static_switches["file"], generations["file"]))
         if "format" in config:
-            opts2.update(format=config.get("format"))
+            opts2.update(format=resolve_format(config.get("format")))
         if "rotation" in config:
             opts2.update(rotation=config.get("rotation"))
         if "retention" in config:
@@ -70,4 +236,11 @@ def setup_static_loggers(configs = dict()):
         if log_file:
             file_logger_id = logger.add(log_file, **opts2)
 
+    previous_ids = _static_handler_ids or ()
+    for name, switch in _static_switches.items():
+        switch.switch(generations[name])
+    for handler_id in previous_ids:
+        retire_handler(handler_id)
+    _static_handler_ids = tuple(i for i in (stdout_logger_id, file_logger_id) if i is not None)
+
     return (stdout_logger_id, file_logger_id)
@@ -1,42 +1,225 @@
 import sys
 import socket
+import struct
+import threading
+import time
 import httpx
+from collections import deque
 from datetime import datetime
-from typing import Optional, Dict, Tuple
+from typing import Callable, Optional, Dict, Tuple
 
 from fastapi import Request
 from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
 from loguru import logger
 
-from .correlation import correlation_id_filter
+from .dynamic_level import install_logging_support_patcher, ensure_correlation_id, HEADER_LOG_LEVEL
+from .dynamic_level import set_default_log_level, set_request_log_level
+from .dynamic_level import HandlerSwitch, remove_handler, retire_handler
 
 from .context import DEFAULT_LOG_LEVEL
 from .context import DEFAULT_STR_SINKS, AVAILABLE_SINKS, CURRENT_SINKS
 from . import context as ctx
 
+from .shipping import configure_log_shipper, get_log_shipper, ShippedSink
+from .sampling import KEY_SAMPLED_OUT, HEADER_LOG_SAMPLE_RATE, set_request_sample_rate
+from .tail_buffer import KEY_TAIL_REPLAY, start_tail_buffer, finish_tail_buffer
+from .serializers import RecordSerializer, JSON_HEADERS, resolve_format
 from .utils import format_time_pattern
 
 # --- TCP/UDP network sink ---
-class NetworkSink:
-    def __init__(self, host="localhost", port=9009):
-        self.addr = (host, port)
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        try:
-            self.sock.connect(self.addr)
-        except Exception as e:
-            print(f"Network sink error: {e}", file=sys.stderr)
+_LENGTH_PREFIX = struct.Struct(">I")
 
-    def __call__(self, message):
+class NetworkSink:
+    """
+    TCP/UDP/Unix socket sink with a background writer thread (for
+    `protocol="unix"`, `host` is the socket path). Records are framed
+    (`framing`: None, "newline" or "length") and kept in a bounded ring
+    buffer; the writer coalesces up to `max_batch` records into one vectored
+    `sendmsg` call and reconnects with exponential backoff when the peer is
+    unreachable. When the buffer is full the oldest records are dropped.
+    """
+    # write() chỉ đưa record vào buffer: không cần enqueue hay LogShipper
+    buffered = True
+
+    def __init__(self, host="localhost", port=9009,
+            protocol: str = "tcp",
+            framing: Optional[str] = None,
+            buffer_size: int = 10000,
+            max_batch: int = 512,
+            connect_timeout: float = 5.0,
+            backoff_initial: float = 0.5,
+            backoff_max: float = 30.0):
+        if protocol not in ("tcp", "udp", "unix"):
+            raise ValueError(f"Unsupported network protocol: {protocol}")
+        if framing not in (None, "newline", "length"):
+            raise ValueError(f"Unsupported network framing: {framing}")
+
+        self.addr = host if protocol == "unix" else (host, port)
+        self.protocol = protocol
+        self.framing = framing
+        self.max_batch = max_batch
+        self.connect_timeout = connect_timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+
+        self.sock = None
+        self._buffer = deque(maxlen=buffer_size)
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._counters = dict(sent=0, dropped=0, connects=0, errors=0)
+
+        self._writer = threading.Thread(target=self._run,
+                name=f"network-sink-{host}:{port}", daemon=True)
+        self._writer.start()
+
+    def _frame(self, message) -> bytes:
+        data = str(message).encode()
+        if self.framing == "newline":
+            return data.rstrip(b"\n") + b"\n"
+        if self.framing == "length":
+            return _LENGTH_PREFIX.pack(len(data)) + data
+        return data
+
+    def write(self, message):
+        frame = self._frame(message)
+        with self._cond:
+            if len(self._buffer) == self._buffer.maxlen:
+                self._counters["dropped"] += 1
+            self._buffer.append(frame)
+            self._cond.notify()
+
+    __call__ = write
+
+    def stop(self, timeout: float = 5.0):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._writer is not threading.current_thread():
+            self._writer.join(timeout=timeout)
+        self._disconnect()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return dict(self._counters, buffered=len(self._buffer),
+                    connected=self.sock is not None)
+
+    def _connect(self):
+        family = socket.AF_UNIX if self.protocol == "unix" else socket.AF_INET
+        kind = socket.SOCK_DGRAM if self.protocol == "udp" else socket.SOCK_STREAM
+        sock = socket.socket(family, kind)
         try:
-            self.sock.sendall(message.encode())
-        except Exception as e:
-            print(f"Network send error: {e}", file=sys.stderr)
+            sock.settimeout(self.connect_timeout)
+            sock.connect(self.addr)
+            sock.settimeout(None)
+            if self.protocol == "tcp":
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except Exception:
+            sock.close()
+            raise
+        self.sock = sock
+        self._counters["connects"] += 1
+
+    def _disconnect(self):
+        sock, self.sock = self.sock, None
+        if sock is not None:
+            try:
+                sock.close()
+            except Exception:
+                pass
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._buffer and not self._stopped:
+                self._cond.wait()
+            batch = []
+            while self._buffer and len(batch) < self.max_batch:
+                batch.append(self._buffer.popleft())
+            return batch
+
+    def _give_back(self, frames):
+        with self._cond:
+            # Trả lại các record chưa gửi vào đầu buffer (giữ nguyên thứ tự)
+            for frame in reversed(frames):
+                if len(self._buffer) == self._buffer.maxlen:
+                    self._counters["dropped"] += 1
+                    break
+                self._buffer.appendleft(frame)
+
+    def _send(self, frames):
+        sock = self.sock
+        if self.protocol == "udp":
+            # Mỗi record là một datagram riêng
+            for i, frame in enumerate(frames):
+                try:
+                    sock.send(frame)
+                except Exception:
+                    self._give_back(frames[i:])
+                    raise
+            return
+
+        if not hasattr(sock, "sendmsg"):
+            sock.sendall(b"".join(frames))
+            return
+
+        pending = frames
+        while pending:
+            try:
+                sent = sock.sendmsg(pending)
+            except Exception:
+                self._give_back(pending)
+                raise
+            # Gửi một phần: bỏ các frame đã gửi hết, cắt frame đang dở
+            while pending and sent >= len(pending[0]):
+                sent -= len(pending[0])
+                pending = pending[1:]
+            if pending and sent:
+                pending = [pending[0][sent:]] + pending[1:]
+
+    def _run(self):
+        backoff = self.backoff_initial
+        final_attempt = False
+        while True:
+            if self.sock is None:
+                with self._cond:
+                    if self._stopped:
+                        # Đã dừng: chỉ thử kết nối thêm một lần để gửi nốt buffer
+                        if final_attempt or not self._buffer:
+                            return
+                        final_attempt = True
+                try:
+                    self._connect()
+                    backoff = self.backoff_initial
+                except Exception as e:
+                    if backoff == self.backoff_initial:
+                        print(f"Network sink error: {e}", file=sys.stderr)
+                    with self._cond:
+                        self._cond.wait_for(lambda: self._stopped, timeout=backoff)
+                    backoff = min(backoff * 2, self.backoff_max)
+                    continue
+
+            frames = self._take_batch()
+            if not frames:
+                return  # stopped và buffer đã rỗng
+
+            try:
+                self._send(frames)
+                with self._cond:
+                    self._counters["sent"] += len(frames)
+            except Exception as e:
+                print(f"Network send error: {e}", file=sys.stderr)
+                with self._cond:
+                    self._counters["errors"] += 1
+                    stopped = self._stopped
+                self._disconnect()
+                if stopped:
+                    return
 
 # --- Opensearch sink ---
 class OpensearchSink:
     def __init__(self, endpoint="http://localhost:9200/logs/_doc",
             http_auth: Optional[Tuple] = None,
-            verify_certs: bool = False,
+            verify_certs: bool = True,
             ssl_show_warn: bool = False,
             log_file_function: bool = False,
             log_proc_thread: bool = False):
@@ -46,43 +229,229 @@ class OpensearchSink:
         self.ssl_show_warn = ssl_show_warn
         self.log_file_function = log_file_function
         self.log_proc_thread = log_proc_thread
+        self.serializer = RecordSerializer(log_file_function=log_file_function,
+                log_proc_thread=log_proc_thread)
+
+    def build_document(self, record):
+        return self.serializer.to_dict(record)
 
     def __call__(self, message):
         try:
             record = message.record #loguru._handler.Message
+            content = self.serializer.dumps(record)
+            endpoint = format_time_pattern(self.endpoint)
+            httpx.post(endpoint, auth=self.http_auth, content=content,
+                    headers=JSON_HEADERS, timeout=60)
+        except Exception as e:
+            print(f"Opensearch error: {e}", file=sys.stderr)
 
-            log = {
-                "requestId": record.get("correlation_id"),
-                "timestamp": record["time"].isoformat(),
-                "level": record["level"].name,
-                "message": record["message"],
-                "logger": record["name"],
-                "line": record["line"],
-            }
-
-            if self.log_file_function:
-                log.update({
-                    "file": record["file"].name,
-                    "function": record["function"],
-                })
+# --- Opensearch bulk sink ---
+_BULK_ACTION_LINE = b'{"index":{}}\n'
 
-            if self.log_proc_thread:
-                log.update({
-                    "process": record["process"].id,
-                    "thread": record["thread"].id,
-                })
+def _bulk_endpoint_of(endpoint: str) -> str:
+    endpoint = endpoint.rstrip("/")
+    if endpoint.endswith("/_bulk"):
+        return endpoint
+    if endpoint.endswith("/_doc"):
+        return endpoint[:-len("/_doc")] + "/_bulk"
+    return endpoint + "/_bulk"
 
-            if record["exception"]:
-                log["exception"] = {
-                    "type": record["exception"].type.__name__,
-                    "value": str(record["exception"].value),
-                    "traceback": record["exception"].traceback.format()
-                }
 
-            endpoint = format_time_pattern(self.endpoint)
-            httpx.post(endpoint, auth=self.http_auth, json=log, timeout=60)
+class OpensearchBulkSink(OpensearchSink):
+    """
+    Buffers the documents and ships them through the `_bulk` API with a pooled
+    `httpx.Client`. A batch is sent when it reaches `batch_size` documents,
+    `batch_bytes` bytes, or is older than `flush_interval` seconds.
+
+    With a `flush_interval`, the batches are sent by a background flusher
+    thread: `write()` never waits for Opensearch, and at most `max_pending`
+    full batches wait for the flusher (the oldest is dropped beyond that).
+    Such a sink is `buffered` and is not wrapped by the LogShipper.
+
+    The sink exposes `write()`/`stop()` so that loguru flushes the pending
+    documents when the handler is removed or the interpreter exits.
+    """
+    def __init__(self, endpoint="http://localhost:9200/logs/_doc",
+            http_auth: Optional[Tuple] = None,
+            verify_certs: bool = True,
+            ssl_show_warn: bool = False,
+            log_file_function: bool = False,
+            log_proc_thread: bool = False,
+            batch_size: int = 500,
+            batch_bytes: int = 5 * 1024 * 1024,
+            flush_interval: float = 2.0,
+            timeout: float = 10.0,
+            max_pending: int = 8,
+            on_flush: Optional[Callable[[Dict], None]] = None,
+            transport: Optional[httpx.BaseTransport] = None):
+        super().__init__(endpoint, http_auth=http_auth,
+                verify_certs=verify_certs,
+                ssl_show_warn=ssl_show_warn,
+                log_file_function=log_file_function,
+                log_proc_thread=log_proc_thread)
+        self.batch_size = batch_size
+        self.batch_bytes = batch_bytes
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.on_flush = on_flush
+
+        self.client = httpx.Client(auth=http_auth, verify=verify_certs,
+                timeout=timeout, transport=transport)
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._send_lock = threading.Lock()
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._buffer_endpoint = None
+        self._pending = deque()  # batch đầy chờ thread flush gửi
+
+        self._counters = dict(batches=0, documents=0,
+                failed_batches=0, failed_documents=0, dropped_documents=0,
+                last_latency_ms=None, max_latency_ms=0.0, total_latency_ms=0.0)
+
+        self._stopped = False
+        self._flusher = None
+        if flush_interval and flush_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_periodically,
+                    name="opensearch-bulk-flusher", daemon=True)
+            self._flusher.start()
+        self.buffered = self._flusher is not None
+
+    def write(self, message):
+        try:
+            record = message.record
+            line = self.serializer.dumps(record) + b"\n"
+            endpoint = _bulk_endpoint_of(format_time_pattern(self.endpoint))
         except Exception as e:
             print(f"Opensearch error: {e}", file=sys.stderr)
+            return
+
+        batch = None
+        with self._lock:
+            # Không trộn document của hai index (vd. khi qua ngày mới) trong một batch
+            if self._buffer and endpoint != self._buffer_endpoint:
+                batch = self._take_batch()
+            self._buffer_endpoint = endpoint
+            self._buffer.append(_BULK_ACTION_LINE)
+            self._buffer.append(line)
+            self._buffer_bytes += len(_BULK_ACTION_LINE) + len(line)
+            if batch is None and (len(self._buffer) // 2 >= self.batch_size
+                    or self._buffer_bytes >= self.batch_bytes):
+                batch = self._take_batch()
+            if batch is not None and self._flusher is not None and not self._stopped:
+                self._queue_batch(batch)
+                batch = None
+
+        if batch is not None:
+            self._send_batch(*batch)
+
+    __call__ = write
+
+    def flush_buffer(self):
+        with self._lock:
+            batches = self._take_all()
+        for batch in batches:
+            self._send_batch(*batch)
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            self._wakeup.notify_all()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join(timeout=self.flush_interval + 1)
+        self.flush_buffer()
+        self.client.close()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            pending = (len(self._buffer) + sum(len(lines) for _, lines in self._pending)) // 2
+        return dict(self._counters, pending_documents=pending)
+
+    def _take_batch(self):
+        if not self._buffer:
+            return None
+        batch = (self._buffer_endpoint, self._buffer)
+        self._buffer = []
+        self._buffer_bytes = 0
+        return batch
+
+    def _take_all(self):
+        # Gọi khi đang giữ self._lock: các batch đầy (cũ hơn) trước, rồi tới buffer
+        batches = list(self._pending)
+        self._pending.clear()
+        batch = self._take_batch()
+        if batch is not None:
+            batches.append(batch)
+        return batches
+
+    def _queue_batch(self, batch):
+        # Gọi khi đang giữ self._lock
+        if len(self._pending) >= self.max_pending:
+            _, lines = self._pending.popleft()
+            self._counters["dropped_documents"] += len(lines) // 2
+        self._pending.append(batch)
+        self._wakeup.notify()
+
+    def _flush_periodically(self):
+        while True:
+            with self._lock:
+                if not self._pending and not self._stopped:
+                    self._wakeup.wait(self.flush_interval)
+                if self._stopped:
+                    return  # stop() gửi nốt phần còn lại
+                # Có batch đầy: chỉ gửi các batch đó; hết thời gian chờ: gửi cả buffer
+                batches = self._take_all() if not self._pending else list(self._pending)
+                self._pending.clear()
+            for batch in batches:
+                try:
+                    self._send_batch(*batch)
+                except Exception as e:
+                    print(f"Opensearch bulk flush error: {e}", file=sys.stderr)
+
+    def _send_batch(self, endpoint, lines):
+        documents = len(lines) // 2
+        failed = 0
+        error = None
+        with self._send_lock:
+            started = time.perf_counter()
+            try:
+                response = self.client.post(endpoint, content=b"".join(lines),
+                        headers={"Content-Type": "application/x-ndjson"})
+                if response.status_code >= 300:
+                    failed = documents
+                    error = f"HTTP {response.status_code}"
+                else:
+                    result = response.json()
+                    if result.get("errors"):
+                        failed = sum(1 for item in result.get("items", [])
+                                if next(iter(item.values()), {}).get("status", 500) >= 300)
+            except Exception as e:
+                failed = documents
+                error = str(e)
+            latency_ms = (time.perf_counter() - started) * 1000
+
+            counters = self._counters
+            counters["batches"] += 1
+            counters["documents"] += documents
+            counters["last_latency_ms"] = latency_ms
+            counters["total_latency_ms"] += latency_ms
+            if latency_ms > counters["max_latency_ms"]:
+                counters["max_latency_ms"] = latency_ms
+            if failed:
+                counters["failed_batches"] += 1
+                counters["failed_documents"] += failed
+
+        report = dict(endpoint=endpoint, documents=documents, failed=failed,
+                latency_ms=latency_ms, error=error)
+        if error is not None:
+            print(f"Opensearch bulk error: {error} ({documents} documents)", file=sys.stderr)
+        if callable(self.on_flush):
+            try:
+                self.on_flush(report)
+            except Exception as e:
+                print(f"Opensearch bulk on_flush error: {e}", file=sys.stderr)
+        return report
 
 # --- Syslog sink ---
 class SyslogSink:
@@ -97,18 +466,49 @@ class SyslogSink:
             print(f"Syslog error: {e}", file=sys.stderr)
 
 # --- Filter factory ---
-def dyna_log_sinks_filter_of(sink_name: str):
+# correlation_id_filter chạy một lần cho mỗi record qua logging_support_patcher
+# (filter chỉ gọi lại khi patcher chưa được cài), mỗi sink chỉ còn so sánh tên sink và ngưỡng level (dạng số) của request.
+class _SinkState(HandlerSwitch):
+    """Level threshold and handler switch of a sink, read by its filters."""
+    __slots__ = ("level_no",)
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.level_no = 0
+
+
+_sink_states: Dict[str, _SinkState] = {}
+
+
+def _sink_state_of(sink_name: str) -> _SinkState:
+    state = _sink_states.get(sink_name)
+    if state is None:
+        state = _sink_states.setdefault(sink_name, _SinkState(sink_name))
+    return state
+
+
+def dyna_log_sinks_filter_of(sink_name: str, generation: Optional[int] = None):
+    state = _sink_state_of(sink_name)
+    if generation is None:
+        generation = state.generation
+    marker = state.marker
+
     def filter_fn(record):
-        try:
-            correlation_id_filter(record)
-            sinks = ctx.request_set_sinks.get()
-            level = ctx.request_log_level.get()
-            return (
-                sink_name in sinks
-                and logger.level(record["level"].name).no >= logger.level(level).no
-            )
-        except Exception:
+        ensure_correlation_id(record)
+        level_no = record["level"].no
+        if not (
+            sink_name in ctx.request_set_sinks.get()
+            and (level_no >= ctx.request_log_level_no.get() or KEY_TAIL_REPLAY in record)
+            and level_no >= state.level_no
+            and KEY_SAMPLED_OUT not in record
+        ):
+            return False
+        if marker in record:
+            return False
+        if state.generation == generation:
+            record[marker] = True  # switch có thể xảy ra trước filter của handler mới
             return True
+        return state.admits(generation, record)  # handler cũ trong lúc chuyển
     return filter_fn
 
 
@@ -122,82 +522,394 @@ def deep_merge_inplace(dict1, dict2):
         ):
             deep_merge_inplace(dict1[key], value)
         else:
-            dict1[key] = value
+            # Bản sao: các thay đổi sau này không được sửa vào dict2 (vd. AVAILABLE_SINKS)
+            dict1[key] = _copy_conf(value)
 
 
-def setup_dynamic_loggers(options: Optional[Dict]):
-    logger.remove()
+def merge_defaults_inplace(dict1, dict2):
+    """Add the keys of `dict2` missing from `dict1` (copied), keeping the values of `dict1`."""
+    for key, value in dict2.items():
+        if key not in dict1:
+            dict1[key] = _copy_conf(value)
+        elif isinstance(dict1[key], dict) and isinstance(value, dict):
+            merge_defaults_inplace(dict1[key], value)
+
+
+# Các sink gửi log ra ngoài: mặc định dùng chung một LogShipper thay vì enqueue riêng
+REMOTE_SINKS = ("network", "opensearch", "syslog")
+
+# Handler loguru đang chạy của từng sink: name → dict(id, generation, signature, level_no, sink)
+_live_handlers: Dict[str, Dict] = {}
+_live_lock = threading.RLock()
+_shipping_enabled = True
+_default_handlers_removed = False
+
+
+def setup_dynamic_loggers(options: Optional[Dict], shipping: Optional[Dict] = None):
+    """
+    Configure the loguru handlers from CURRENT_SINKS merged with `options`
+    (AVAILABLE_SINKS only fills in the missing sinks and keys).
+
+    The first call removes the handlers installed before (e.g. loguru's
+    default stderr handler); later calls only add, replace or remove the
+    sinks whose configuration changed (see `apply_sinks_config`).
+
+    The remote sinks (REMOTE_SINKS, unless "async" or an explicit "enqueue" is
+    set in their config) are shipped by the shared LogShipper, except the
+    `buffered` sinks that already send from their own thread; `shipping`
+    tunes it (capacity, overflow, keep_level, block_timeout) and
+    `shipping=False` restores one enqueue queue per sink.
+
+    Installs the logging support patcher (correlation id, sampling, tail
+    buffer) after the application's patcher, see
+    `install_logging_support_patcher`.
+    """
+    global _default_handlers_removed, _shipping_enabled
+    with _live_lock:
+        if not _default_handlers_removed:
+            logger.remove()
+            _default_handlers_removed = True
+        install_logging_support_patcher()
+
+        # Mặc định chỉ bổ sung các khoá còn thiếu: không ghi đè thay đổi lúc chạy
+        merge_defaults_inplace(CURRENT_SINKS, AVAILABLE_SINKS)
+        deep_merge_inplace(CURRENT_SINKS, options or {})
+
+        if shipping is not False:
+            configure_log_shipper(**(shipping or {}))
+        if _shipping_enabled != (shipping is not False):
+            _shipping_enabled = shipping is not False
+            # Đổi cách ship → các sink từ xa phải được tạo lại
+            for name in REMOTE_SINKS:
+                if name in _live_handlers:
+                    _live_handlers[name]["signature"] = None
+
+        return apply_sinks_config()
+
+
+def apply_sinks_config() -> Dict[str, str]:
+    """
+    Reconcile the live handlers with CURRENT_SINKS and return the action
+    taken per sink ("added", "replaced", "level", "removed", "unchanged").
+
+    A level change only moves the sink's threshold when the handler already
+    accepts that level; any other change adds the new handler, switches the
+    sink's generation (the old filter starts rejecting, the new one
+    accepting) and then retires the old handler, which drains its queue.
+
+    Only the handlers registered in `_live_handlers` are tracked: remove a
+    sink with `remove_sink()` rather than `logger.remove(handler_id)`.
+    """
+    actions = dict()
+    with _live_lock:
+        invalidate_sinks_header_cache()
+
+        for name in list(_live_handlers):
+            conf = CURRENT_SINKS.get(name)
+            if conf is None or not conf.get("enabled", True):
+                _remove_live_handler(name)
+                actions[name] = "removed"
+
+        # Kiểm tra level của mọi sink trước khi thay đổi bất kỳ handler nào
+        levels = {name: _level_no_of(conf) for name, conf in CURRENT_SINKS.items()
+                if conf.get("enabled", True)}
+
+        for name, level_no in levels.items():
+            conf = CURRENT_SINKS[name]
+            signature = _signature_of(conf)
+            live = _live_handlers.get(name)
+
+            if live is not None and live["signature"] == signature:
+                if level_no == _sink_state_of(name).level_no:
+                    actions[name] = "unchanged"
+                    continue
+                if level_no >= live["level_no"]:
+                    _sink_state_of(name).level_no = level_no
+                    actions[name] = "level"
+                    continue
+
+            _add_live_handler(name, conf, signature, level_no)
+            actions[name] = "added" if live is None else "replaced"
+    return actions
+
+
+def update_sink_config(name: str, changes: Dict) -> str:
+    """Merge `changes` into the sink configuration (creating it) and apply it."""
+    if "level" in changes:
+        _level_no_of(changes)  # ValueError nếu level không hợp lệ
+    with _live_lock:
+        previous = _copy_conf(CURRENT_SINKS.get(name))
+        deep_merge_inplace(CURRENT_SINKS.setdefault(name, {}), changes)
+        try:
+            return apply_sinks_config().get(name, "unchanged")
+        except Exception:
+            # Không tạo được handler mới: handler cũ vẫn chạy, khôi phục cấu hình
+            if previous is None:
+                del CURRENT_SINKS[name]
+            else:
+                CURRENT_SINKS[name] = previous
+            invalidate_sinks_header_cache()
+            raise
+
+
+def remove_sink(name: str) -> bool:
+    """Disable the sink and remove its handler; the configuration is kept."""
+    with _live_lock:
+        conf = CURRENT_SINKS.get(name)
+        if conf is None:
+            return False
+        conf["enabled"] = False
+        apply_sinks_config()
+        return True
+
+
+def live_sinks() -> Dict[str, Dict]:
+    with _live_lock:
+        return {
+            name: dict(handler_id=live["id"], generation=live["generation"],
+                    level=str(CURRENT_SINKS[name].get("level", "DEBUG")).upper(),
+                    sink=type(_unshipped(live["sink"])).__name__,
+                    type=live["type"], target=live["target"],
+                    enqueue=live["enqueue"], shipped=isinstance(live["sink"], ShippedSink))
+            for name, live in _live_handlers.items()
+        }
+
+
+def _unshipped(target):
+    return target.target if isinstance(target, ShippedSink) else target
+
+
+def describe_sink(target) -> Tuple[str, str]:
+    """Type and destination of a sink target (a path, a stream, a sink object or a function)."""
+    target = _unshipped(target)
+    if isinstance(target, str):
+        return "file", target
+    if target is sys.stdout:
+        return "stream", "stdout"
+    if target is sys.stderr:
+        return "stream", "stderr"
+    # Sink object: đọc nơi nhận log từ thuộc tính của nó (không có thông tin đăng nhập)
+    path = getattr(target, "path", None)
+    if path is not None:
+        return "file", str(path)
+    endpoint = getattr(target, "endpoint", None)
+    if endpoint is not None:
+        return "opensearch", str(endpoint)
+    addr = getattr(target, "addr", None)
+    if addr is not None:
+        return "network", addr if isinstance(addr, str) else ":".join(map(str, addr))
+    address = getattr(target, "address", None)
+    if address is not None:
+        return "syslog", str(address)
+    if callable(target):
+        return "function", getattr(target, "__name__", type(target).__name__)
+    return "unknown", str(target)
+
+
+def _copy_conf(value):
+    if isinstance(value, dict):
+        return {k: _copy_conf(v) for k, v in value.items()}
+    return value
+
+
+def _level_no_of(conf: Dict) -> int:
+    return logger.level(str(conf.get("level", "DEBUG")).upper()).no
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _signature_of(conf: Dict):
+    # Mọi thay đổi (trừ level/enabled) cần một handler mới
+    return _freeze({k: v for k, v in conf.items() if k not in ("level", "enabled")})
+
+
+def _add_live_handler(name: str, conf: Dict, signature, level_no: int):
+    state = _sink_state_of(name)
+    generation = state.generation + 1
+    target, options = _build_sink(name, conf)
+
+    # Handler mới chưa nhận record nào cho tới khi generation được chuyển
+    handler_id = logger.add(target, level=level_no,
+            filter=dyna_log_sinks_filter_of(name, generation), **options)
+
+    old = _live_handlers.get(name)
+    state.level_no = level_no
+    state.switch(generation)
+    kind, destination = describe_sink(target)
+    _live_handlers[name] = dict(id=handler_id, generation=generation,
+            signature=signature, level_no=level_no, sink=target,
+            type=kind, target=destination, enqueue=options["enqueue"])
+    if old is not None:
+        retire_handler(old["id"])
+
+
+def _remove_live_handler(name: str):
+    live = _live_handlers.pop(name)
+    remove_handler(live["id"])
+
+
+def _discard(_):
+    pass
+
+
+def _build_sink(name: str, conf: Dict):
+    """Create the sink object of a sink configuration and its logger.add() options."""
+    more = dict()
+
+    # "async": True → dùng sink asyncio (async_sinks), không chặn event loop
+    use_async = conf.get("async", False)
+    if use_async:
+        from . import async_sinks
+
+    target = conf.get("target", None)
+    enqueue = conf.get("enqueue", not use_async)
+
+    if name == "null":
+        target = _discard
 
-    deep_merge_inplace(CURRENT_SINKS, AVAILABLE_SINKS)
-    deep_merge_inplace(CURRENT_SINKS, options)
+    elif name == "network":
+        if not target:
+            params = conf.get("params", {})
+            myargs = dict()
+
+            host = params.get("host", None)
+            if host:
+                myargs.update(host=host)
+
+            port = params.get("port", None)
+            if port:
+                myargs.update(port=port)
+
+            if not use_async:
+                myargs.update({
+                    k: params[k] for k in ["protocol", "framing", "buffer_size", "max_batch",
+                            "backoff_initial", "backoff_max"] if k in params
+                })
 
-    for name, conf in CURRENT_SINKS.items():
-        more = dict()
+            if use_async:
+                target = async_sinks.AsyncNetworkSink(**myargs)
+            else:
+                target = NetworkSink(**myargs)
+
+    elif name == "opensearch":
+        if not target:
+            params = conf.get("params", {})
+            myargs = dict()
+
+            endpoint = params.get("url", None)
+            if endpoint:
+                myargs.update(endpoint=endpoint)
+
+            username = params.get("username", None)
+            password = params.get("password", None)
+            if username and password:
+                myargs.update(http_auth=(username,password))
+
+            if use_async:
+                target = async_sinks.AsyncOpensearchSink(**myargs)
+            elif params.get("bulk", False):
+                myargs.update({
+                    k: params[k] for k in ["batch_size", "batch_bytes", "flush_interval", "timeout",
+                            "max_pending"] if k in params
+                })
+                target = OpensearchBulkSink(**myargs)
+            else:
+                target = OpensearchSink(**myargs)
 
-        if not conf.get("enabled", True):
-            continue
+    elif name == "syslog":
+        if not target:
+            params = conf.get("params", {})
+            myargs = dict()
 
-        if name == "null":
-            conf.update(target = lambda _: None)
+            address = params.get("address", None)
+            if address:
+                myargs.update(address=address)
 
-        elif name == "network":
-            if not conf.get("target", None):
-                params = conf.get("params", {})
-                myargs = dict()
+            if use_async:
+                target = async_sinks.AsyncSyslogSink(**myargs)
+            else:
+                target = SyslogSink(**myargs)
+
+    elif conf.get("multiprocess", False):
+        # Một tiến trình ghi file chung cho mọi worker (rotation/nén chỉ một lần)
+        from .file_writer import MultiprocessFileSink
+        params = conf.get("params", {})
+        target = MultiprocessFileSink(target,
+                rotation=conf.get("rotation"),
+                retention=conf.get("retention"),
+                compression=conf.get("compression"),
+                **{k: params[k] for k in ["socket_path", "buffer_size", "write_buffer",
+                        "flush_interval", "idle_timeout"] if k in params})
+        enqueue = conf.get("enqueue", False)
+        more.update(colorize=conf.get("colorize", False))
+
+    else:
+        more.update({
+            k: conf[k] for k in ["colorize", "rotation", "retention", "compression"] if k in conf
+        })
+
+    if _shipping_enabled and name in REMOTE_SINKS and not use_async and "enqueue" not in conf:
+        # Sink có buffer và thread gửi riêng (vd. NetworkSink): không bọc thêm LogShipper
+        if not getattr(target, "buffered", False):
+            target = get_log_shipper().wrap(name, target)
+        enqueue = False
+
+    more.update(format=resolve_format(conf.get("format", "{message}")), enqueue=enqueue)
+    return target, more
 
-                host = params.get("host", None)
-                if host:
-                    myargs.update(host=host)
 
-                port = params.get("port", None)
-                if port:
-                    myargs.update(port=port)
+def _convert_str_to_set(value):
+    return {t.strip() for t in value.split(",")} if isinstance(value, str) else None
 
-                conf["target"] = NetworkSink(**myargs)
+# --- X-Log-Sinks header cache ---
+# Giá trị header → frozenset các sink hợp lệ. Cache bị xoá khi CURRENT_SINKS
+# hoặc bộ sink mặc định thay đổi; khi đầy thì xoá toàn bộ (client chỉ dùng
+# một vài giá trị header khác nhau).
+SINKS_HEADER_CACHE_SIZE = 256
+_sinks_header_cache: Dict[str, frozenset] = {}
 
-        elif name == "opensearch":
-            if not conf.get("target", None):
-                params = conf.get("params", {})
-                myargs = dict()
 
-                endpoint = params.get("url", None)
-                if endpoint:
-                    myargs.update(endpoint=endpoint)
+def invalidate_sinks_header_cache():
+    _sinks_header_cache.clear()
 
-                username = params.get("username", None)
-                password = params.get("password", None)
-                if username and password:
-                    myargs.update(http_auth=(username,password))
 
-                conf["target"] = OpensearchSink(**myargs)
+def _parse_sinks_header(sinks_header_value: str) -> frozenset:
+    requested_sinks = _convert_str_to_set(sinks_header_value)
+    if requested_sinks == ctx.default_set_sinks:
+        return ctx.default_set_sinks
+    valid_requested_sinks = requested_sinks & (CURRENT_SINKS or AVAILABLE_SINKS).keys()
+    if not valid_requested_sinks:
+        return ctx.default_set_sinks
+    return frozenset(valid_requested_sinks)
 
-        elif name == "syslog":
-            if not conf.get("target", None):
-                params = conf.get("params", {})
-                myargs = dict()
 
-                address = params.get("address", None)
-                if address:
-                    myargs.update(address=address)
+def resolve_sinks_header(sinks_header_value: str) -> frozenset:
+    sinks = _sinks_header_cache.get(sinks_header_value)
+    if sinks is None:
+        sinks = _parse_sinks_header(sinks_header_value)
+        if len(_sinks_header_cache) >= SINKS_HEADER_CACHE_SIZE:
+            _sinks_header_cache.clear()
+        _sinks_header_cache[sinks_header_value] = sinks
+    return sinks
 
-                conf["target"] = SyslogSink(**myargs)
 
-        else:
-            more.update({
-                k: conf[k] for k in ["colorize", "rotation", "retention", "compression"] if k in conf
-            })
-
-        logger.add(
-            conf.get("target"),
-            level=conf.get("level", "DEBUG"),
-            filter=dyna_log_sinks_filter_of(name),
-            format=conf.get("format", "{message}"),
-            enqueue=conf.get("enqueue", True),
-            **more,
-        )
+def set_request_log_sinks(sinks_header_value: Optional[str]):
+    if sinks_header_value is None:
+        ctx.request_set_sinks.set(ctx.default_set_sinks)
+    else:
+        ctx.request_set_sinks.set(resolve_sinks_header(sinks_header_value))
 
-def _convert_str_to_set(value):
-    return {t.strip() for t in value.split(",")} if isinstance(value, str) else None
+
+def set_default_log_sinks(default_sinks: str):
+    ctx.default_str_sinks = default_sinks
+    ctx.default_set_sinks = frozenset(_convert_str_to_set(ctx.default_str_sinks))
+    invalidate_sinks_header_cache()
 
 # --- Middleware ---
 class DynaLogSinksMiddleware(BaseHTTPMiddleware):
@@ -205,36 +917,79 @@ class DynaLogSinksMiddleware(BaseHTTPMiddleware):
             default_sinks: str = DEFAULT_STR_SINKS, **kwargs):
         super().__init__(*args, **kwargs)
 
-        ctx.default_log_level = default_level
-
-        ctx.default_str_sinks = default_sinks
-        ctx.default_set_sinks = _convert_str_to_set(ctx.default_str_sinks)
+        set_default_log_level(default_level)
+        set_default_log_sinks(default_sinks)
 
     async def dispatch(self, request: Request, call_next):
-        level = request.headers.get("X-Log-Level", ctx.default_log_level).upper()
+        set_request_log_level(request.headers.get("X-Log-Level"))
+        set_request_log_sinks(request.headers.get("X-Log-Sinks",
+                request.headers.get("X-Log-Targets", None)))
+        set_request_sample_rate(request.headers.get("X-Log-Sample-Rate"))
+
+        tail_buffer = start_tail_buffer()
+        if tail_buffer is None:
+            return await call_next(request)
         try:
-            logger.level(level)
-            ctx.request_log_level.set(level)
-        except ValueError:
-            logger.warning(f"Invalid log level: {level}, fallback to {ctx.default_log_level}")
-            ctx.request_log_level.set(ctx.default_log_level)
-
-        sinks_header_value = request.headers.get("X-Log-Sinks",
-                request.headers.get("X-Log-Targets", None))
-
-        if sinks_header_value is None:
-            ctx.request_set_sinks.set(ctx.default_set_sinks)
-        elif sinks_header_value == ctx.default_str_sinks:
-            ctx.request_set_sinks.set(ctx.default_set_sinks)
-        else:
-            requested_sinks = _convert_str_to_set(sinks_header_value)
-            if requested_sinks == ctx.default_set_sinks:
-                ctx.request_set_sinks.set(ctx.default_set_sinks)
-            else:
-                valid_requested_sinks = requested_sinks & AVAILABLE_SINKS.keys()
-                if not valid_requested_sinks:
-                    valid_requested_sinks = ctx.default_set_sinks
-                ctx.request_set_sinks.set(valid_requested_sinks)
-
-        response = await call_next(request)
+            response = await call_next(request)
+        except BaseException:
+            finish_tail_buffer(tail_buffer, failed=True)
+            raise
+        finish_tail_buffer(tail_buffer, failed=response.status_code >= 500)
         return response
+
+
+_HEADER_LOG_SINKS = b"x-log-sinks"
+_HEADER_LOG_TARGETS = b"x-log-targets"
+
+class DynaLogSinksASGIMiddleware:
+    """
+    Pure ASGI version of DynaLogSinksMiddleware: reads X-Log-Level,
+    X-Log-Sinks/X-Log-Targets and X-Log-Sample-Rate straight from scope["headers"], without the
+    BaseHTTPMiddleware task hop, so streaming responses pass through untouched.
+    """
+    def __init__(self, app: ASGIApp, default_level: str = DEFAULT_LOG_LEVEL,
+            default_sinks: str = DEFAULT_STR_SINKS):
+        self.app = app
+
+        set_default_log_level(default_level)
+        set_default_log_sinks(default_sinks)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] in ("http", "websocket"):
+            level = sinks = targets = sample_rate = None
+            for name, value in scope["headers"]:
+                # Giống request.headers.get(): lấy giá trị đầu tiên của mỗi header
+                if name == HEADER_LOG_LEVEL and level is None:
+                    level = value.decode("latin-1")
+                elif name == _HEADER_LOG_SINKS and sinks is None:
+                    sinks = value.decode("latin-1")
+                elif name == _HEADER_LOG_TARGETS and targets is None:
+                    targets = value.decode("latin-1")
+                elif name == HEADER_LOG_SAMPLE_RATE and sample_rate is None:
+                    sample_rate = value.decode("latin-1")
+
+            set_request_log_level(level)
+            set_request_log_sinks(sinks if sinks is not None else targets)
+            set_request_sample_rate(sample_rate)
+
+            tail_buffer = start_tail_buffer()
+            if tail_buffer is not None:
+                await self._call_with_tail_buffer(tail_buffer, scope, receive, send)
+                return
+
+        await self.app(scope, receive, send)
+
+    async def _call_with_tail_buffer(self, tail_buffer, scope: Scope, receive: Receive, send: Send):
+        status = [200]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException:
+            finish_tail_buffer(tail_buffer, failed=True)
+            raise
+        finish_tail_buffer(tail_buffer, failed=status[0] >= 500)
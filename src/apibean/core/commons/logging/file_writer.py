@@ -0,0 +1,347 @@
+import fcntl
+import glob
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional, Union
+
+from .dynamic_sinks import NetworkSink, _LENGTH_PREFIX
+
+# Ghi log từ nhiều worker (uvicorn/gunicorn) vào cùng một file: các worker gửi
+# record qua Unix socket tới MỘT tiến trình ghi duy nhất, tiến trình này gom
+# buffer lớn, xoay vòng (rotation) và nén file ở thread nền.
+
+_SIZE_UNITS = {"B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+_SIZE_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([KMG]?B)\s*$", re.IGNORECASE)
+_DAYS_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*days?\s*$", re.IGNORECASE)
+
+
+def parse_size(value: Union[int, str, None]) -> Optional[int]:
+    """"100 MB" → bytes; int is taken as bytes."""
+    if value is None or isinstance(value, int):
+        return value
+    match = _SIZE_PATTERN.match(value)
+    if not match:
+        raise ValueError(f"Unsupported rotation size: {value}")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).upper()])
+
+
+COMPRESSIONS = (None, "gz", "tar.gz", "zip")
+
+
+def check_retention(value: Union[int, str, None]) -> Union[int, str, None]:
+    """Number of rotated files (int) or "N days"; raises ValueError otherwise."""
+    if value is None or (isinstance(value, int) and not isinstance(value, bool)):
+        return value
+    if isinstance(value, str) and _DAYS_PATTERN.match(value):
+        return value
+    raise ValueError(f"Unsupported retention: {value}")
+
+
+def check_compression(value: Optional[str]) -> Optional[str]:
+    if value not in COMPRESSIONS:
+        raise ValueError(f"Unsupported compression: {value}")
+    return value
+
+
+def default_socket_path(path: str) -> str:
+    digest = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f"apibean-log-{digest}.sock")
+
+
+# --- Writer (chạy trong tiến trình ghi) ---
+class FileWriter:
+    """Buffered appender with size-based rotation; compression/retention run in a background thread."""
+    def __init__(self, path: str,
+            rotation: Union[int, str, None] = None,
+            retention: Union[int, str, None] = None,
+            compression: Optional[str] = None,
+            write_buffer: int = 1024 * 1024):
+        self.path = os.path.abspath(path)
+        self.rotation = parse_size(rotation)
+        self.retention = check_retention(retention)
+        self.compression = check_compression(compression)
+        self.write_buffer = write_buffer
+
+        self._lock = threading.Lock()
+        self._closed = False
+        self._buffer = bytearray()
+        self._file = open(self.path, "ab")
+        self._size = self._file.tell()
+        self._finisher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="log-compress")
+
+    def append(self, data: bytes):
+        with self._lock:
+            if self._closed:
+                raise ValueError("FileWriter is closed")
+            self._buffer += data
+            if len(self._buffer) >= self.write_buffer:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            if not self._closed:
+                self._flush_locked()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._flush_locked()
+            self._file.close()
+            self._closed = True
+        self._finisher.shutdown(wait=True)
+
+    def _flush_locked(self):
+        if not self._buffer:
+            return
+        if self.rotation and self._size and self._size + len(self._buffer) > self.rotation:
+            self._rotate_locked()
+        self._file.write(self._buffer)
+        self._file.flush()
+        self._size += len(self._buffer)
+        self._buffer.clear()
+
+    def _rotate_locked(self):
+        self._file.close()
+        root, ext = os.path.splitext(self.path)
+        rotated = f"{root}.{datetime.now().strftime('%Y-%m-%d_%H-%M-%S_%f')}{ext}"
+        os.rename(self.path, rotated)
+        self._file = open(self.path, "ab")
+        self._size = 0
+        # Nén và dọn file cũ ngoài hot path
+        self._finisher.submit(self._finish_rotation, rotated)
+
+    def _finish_rotation(self, rotated: str):
+        try:
+            if self.compression:
+                compress_file(rotated, self.compression)
+            if self.retention is not None:
+                self._apply_retention()
+        except Exception as e:
+            print(f"Log rotation error: {e}", file=sys.stderr)
+
+    def _apply_retention(self):
+        root, ext = os.path.splitext(self.path)
+        rotated_files = [f for f in glob.glob(f"{glob.escape(root)}.*{ext}*") if f != self.path]
+        rotated_files.sort(key=os.path.getmtime, reverse=True)
+
+        if isinstance(self.retention, int):
+            expired = rotated_files[self.retention:]
+        else:
+            match = _DAYS_PATTERN.match(str(self.retention))
+            if not match:
+                raise ValueError(f"Unsupported retention: {self.retention}")
+            deadline = time.time() - float(match.group(1)) * 86400
+            expired = [f for f in rotated_files if os.path.getmtime(f) < deadline]
+
+        for f in expired:
+            os.remove(f)
+
+
+def compress_file(source: str, compression: str) -> str:
+    target = f"{source}.{compression}"
+    if compression == "gz":
+        with open(source, "rb") as src, gzip.open(target, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+    elif compression == "tar.gz":
+        with tarfile.open(target, "w:gz") as tar:
+            tar.add(source, arcname=os.path.basename(source))
+    elif compression == "zip":
+        with zipfile.ZipFile(target, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.write(source, arcname=os.path.basename(source))
+    os.remove(source)
+    return target
+
+
+class FileWriterServer:
+    """Accepts length-framed records on a Unix socket and appends them to a FileWriter."""
+    def __init__(self, writer: FileWriter, socket_path: str,
+            flush_interval: float = 1.0,
+            idle_timeout: float = 60.0):
+        self.writer = writer
+        self.socket_path = socket_path
+        self.flush_interval = flush_interval
+        self.idle_timeout = idle_timeout
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)  # socket cũ của writer đã chết (ta đang giữ lock)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(socket_path)
+        self.sock.listen(128)
+
+        self._lock = threading.Lock()
+        self._connections = 0
+        self._idle_since = time.monotonic()
+        self._closing = False
+        self._receivers = dict()  # thread → connection
+
+    def serve(self):
+        threading.Thread(target=self._accept, name="log-writer-accept", daemon=True).start()
+        try:
+            while True:
+                time.sleep(self.flush_interval)
+                self.writer.flush()
+                with self._lock:
+                    if self._connections == 0 and time.monotonic() - self._idle_since > self.idle_timeout:
+                        self._closing = True  # từ đây không nhận kết nối mới
+                        break
+        finally:
+            with self._lock:
+                self._closing = True
+                receivers = list(self._receivers.items())
+            self.sock.close()
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+            # Chờ các thread nhận ghi xong trước khi đóng file
+            for thread, conn in receivers:
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                thread.join()
+            self.writer.close()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            with self._lock:
+                if self._closing:
+                    conn.close()  # worker sẽ kết nối lại tới writer mới
+                    continue
+                self._connections += 1
+                thread = threading.Thread(target=self._receive, args=(conn,), daemon=True)
+                self._receivers[thread] = conn
+            thread.start()
+
+    def _receive(self, conn):
+        pending = b""
+        try:
+            with conn:
+                while True:
+                    chunk = conn.recv(256 * 1024)
+                    if not chunk:
+                        return
+                    pending += chunk
+                    # Chỉ ghi các frame đầy đủ: record của các worker không bị trộn lẫn
+                    records, position = [], 0
+                    while len(pending) - position >= _LENGTH_PREFIX.size:
+                        (length,) = _LENGTH_PREFIX.unpack_from(pending, position)
+                        end = position + _LENGTH_PREFIX.size + length
+                        if end > len(pending):
+                            break
+                        records.append(pending[position + _LENGTH_PREFIX.size:end])
+                        position = end
+                    pending = pending[position:]
+                    if records:
+                        self.writer.append(b"".join(records))
+        finally:
+            with self._lock:
+                self._connections -= 1
+                self._idle_since = time.monotonic()
+                self._receivers.pop(threading.current_thread(), None)
+
+
+def _writer_main():
+    config = json.loads(sys.stdin.read())
+    lock_fd = config.pop("lock_fd")  # giữ mở tới khi thoát: các worker khác thấy writer còn sống
+    writer = FileWriter(config["path"],
+            rotation=config.get("rotation"),
+            retention=config.get("retention"),
+            compression=config.get("compression"),
+            write_buffer=config.get("write_buffer", 1024 * 1024))
+    FileWriterServer(writer, config["socket_path"],
+            flush_interval=config.get("flush_interval", 1.0),
+            idle_timeout=config.get("idle_timeout", 60.0)).serve()
+    os.close(lock_fd)
+
+
+def spawn_file_writer(path: str, socket_path: str, **options) -> Optional[subprocess.Popen]:
+    """
+    Start the writer process for `socket_path` unless another process holds
+    its lock file (flock); returns the new process, or None.
+    """
+    lock_fd = os.open(f"{socket_path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+        config = dict(options, path=os.path.abspath(path), socket_path=socket_path, lock_fd=lock_fd)
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+        # Tiến trình con kế thừa fd (cùng open file description) nên giữ luôn lock
+        process = subprocess.Popen(
+                [sys.executable, "-c", "from apibean.core.commons.logging.file_writer import _writer_main; _writer_main()"],
+                stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, env=env,
+                pass_fds=(lock_fd,), start_new_session=True)
+        process.stdin.write(json.dumps(config).encode())
+        process.stdin.close()
+        return process
+    finally:
+        os.close(lock_fd)
+
+
+# --- Sink (chạy trong mỗi worker) ---
+class MultiprocessFileSink(NetworkSink):
+    """
+    File sink for multi-process servers: records are sent (length-framed)
+    over a Unix socket to a single writer process, spawned on demand by the
+    first worker that gets the lock. The writer does the buffered writes,
+    rotation, retention and compression for all workers.
+
+    Only size-based `rotation` ("100 MB" or bytes), `retention` as a number
+    of files or "N days", and `compression` in COMPRESSIONS are supported;
+    other values (e.g. time-based rotation) raise ValueError.
+    """
+    def __init__(self, path: str,
+            socket_path: Optional[str] = None,
+            rotation: Union[int, str, None] = None,
+            retention: Union[int, str, None] = None,
+            compression: Optional[str] = None,
+            buffer_size: int = 10000,
+            write_buffer: int = 1024 * 1024,
+            flush_interval: float = 1.0,
+            idle_timeout: float = 60.0):
+        # Kiểm tra ngay trong worker: cấu hình sai khiến tiến trình ghi thoát lúc
+        # khởi động và bị spawn lại liên tục
+        parse_size(rotation)
+        check_retention(retention)
+        check_compression(compression)
+        self.path = path
+        self.socket_path = socket_path or default_socket_path(path)
+        self.writer_options = dict(rotation=rotation, retention=retention,
+                compression=compression, write_buffer=write_buffer,
+                flush_interval=flush_interval, idle_timeout=idle_timeout)
+        self.writer_process = None
+        super().__init__(host=self.socket_path, protocol="unix", framing="length",
+                buffer_size=buffer_size, backoff_initial=0.05, backoff_max=2.0)
+
+    def _connect(self):
+        # Writer chưa có hoặc đã thoát → worker nào lấy được lock sẽ khởi động lại
+        process = spawn_file_writer(self.path, self.socket_path, **self.writer_options)
+        if process is not None:
+            self.writer_process = process
+        # Chờ writer (của tiến trình này hoặc worker khác) mở socket
+        deadline = time.monotonic() + self.connect_timeout
+        while (not os.path.exists(self.socket_path) and time.monotonic() < deadline
+                and (process is None or process.poll() is None)):
+            time.sleep(0.01)
+        super()._connect()
@@ -0,0 +1,108 @@
+import math
+import threading
+from typing import Dict
+
+# --- Latency histograms ---
+# Bucket log-tuyến tính: 8 bucket con cho mỗi luỹ thừa của 2 (nanosecond),
+# sai số tương đối của percentile ≤ 12.5%. Mảng bucket được cấp phát một lần.
+_SUB_BUCKETS = 8
+_BUCKET_COUNT = _SUB_BUCKETS * 62
+
+
+def _bucket_index(value_ns: int) -> int:
+    if value_ns < _SUB_BUCKETS:
+        return value_ns if value_ns > 0 else 0
+    shift = value_ns.bit_length() - 4
+    return _SUB_BUCKETS * (shift + 1) + (value_ns >> shift) - _SUB_BUCKETS
+
+
+def _bucket_upper_bound(index: int) -> int:
+    if index < _SUB_BUCKETS:
+        return index
+    shift = index // _SUB_BUCKETS - 1
+    mantissa = index % _SUB_BUCKETS + _SUB_BUCKETS
+    return ((mantissa + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    __slots__ = ("_lock", "_buckets", "count", "sum_ns", "max_ns")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = [0] * _BUCKET_COUNT
+        self.count = 0
+        self.sum_ns = 0
+        self.max_ns = 0
+
+    def observe(self, value_ns: int):
+        index = _bucket_index(value_ns)
+        with self._lock:
+            self._buckets[index] += 1
+            self.count += 1
+            self.sum_ns += value_ns
+            if value_ns > self.max_ns:
+                self.max_ns = value_ns
+
+    def reset(self):
+        with self._lock:
+            self._buckets = [0] * _BUCKET_COUNT
+            self.count = 0
+            self.sum_ns = 0
+            self.max_ns = 0
+
+    def percentiles(self, *quantiles: float) -> Dict[float, int]:
+        with self._lock:
+            buckets = list(self._buckets)
+            count, max_ns = self.count, self.max_ns
+
+        result = {}
+        if count == 0:
+            return {q: 0 for q in quantiles}
+
+        ranks = sorted((max(1, math.ceil(q * count)), q) for q in quantiles)
+        seen, pos = 0, 0
+        for index, bucket_count in enumerate(buckets):
+            if not bucket_count:
+                continue
+            seen += bucket_count
+            while pos < len(ranks) and ranks[pos][0] <= seen:
+                result[ranks[pos][1]] = min(_bucket_upper_bound(index), max_ns)
+                pos += 1
+            if pos == len(ranks):
+                break
+        return result
+
+    def snapshot(self) -> Dict:
+        p = self.percentiles(0.5, 0.95, 0.99)
+        count, sum_ns = self.count, self.sum_ns
+        return dict(
+            count=count,
+            sum_ms=sum_ns / 1e6,
+            mean_ms=(sum_ns / count / 1e6) if count else 0.0,
+            p50_ms=p[0.5] / 1e6,
+            p95_ms=p[0.95] / 1e6,
+            p99_ms=p[0.99] / 1e6,
+            max_ms=self.max_ns / 1e6,
+        )
+
+
+_histograms: Dict[str, LatencyHistogram] = {}
+_histograms_lock = threading.Lock()
+
+
+def get_latency_histogram(name: str) -> LatencyHistogram:
+    histogram = _histograms.get(name)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(name, LatencyHistogram())
+    return histogram
+
+
+def latency_snapshot() -> Dict[str, Dict]:
+    return {name: histogram.snapshot() for name, histogram in list(_histograms.items())}
+
+
+def reset_latency_histograms():
+    # Các hàm đã decorate giữ tham chiếu tới histogram → chỉ đặt lại số liệu
+    for histogram in list(_histograms.values()):
+        histogram.reset()
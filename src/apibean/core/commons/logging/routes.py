@@ -2,13 +2,18 @@ import sys
 
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from typing import List
-
-from loguru import logger
+from typing import Any, Dict, List, Optional
 
 from .context import DEFAULT_LOG_LEVEL
 from .context import CURRENT_SINKS
 from . import context as ctx
+from .dynamic_level import set_default_log_level
+from .dynamic_sinks import set_default_log_sinks
+from .dynamic_sinks import update_sink_config, remove_sink, live_sinks, describe_sink
+from .metrics import latency_snapshot, reset_latency_histograms
+from .shipping import log_shipping_stats
+from .sampling import configure_sampling, sampling_stats
+from .tail_buffer import configure_tail_buffer, tail_buffer_stats
 
 router = APIRouter(prefix="/loggers", tags=["loggers"])
 
@@ -16,32 +21,26 @@ def _transform_sink_conf_to_info(name, config):
     active = ctx.request_set_sinks.get()
     sink_info = {
         "name": name,
-        "level": DEFAULT_LOG_LEVEL,
-        "enqueue": True,
+        "level": config.get("level", DEFAULT_LOG_LEVEL),
+        "enqueue": config.get("enqueue", True),
+        "enabled": config.get("enabled", True),
         "enabled_for_current_request": name in active
     }
 
+    live = live_sinks().get(name)
+    if live:
+        # Sink đang chạy: lấy loại, nơi nhận log và enqueue thực tế từ handler
+        sink_info["handler"] = live
+        sink_info["enqueue"] = live["enqueue"]
+        sink_info["type"] = live["type"]
+        sink_info["target"] = live["target"]
+    else:
+        sink_info["type"], sink_info["target"] = describe_sink(config.get("target"))
+
     fmt = config.get("format")
     if fmt:
         sink_info["format"] = fmt
 
-    target = config.get("target")
-    if isinstance(target, str):
-        sink_info["type"] = "file"
-        sink_info["target"] = target
-    elif target == sys.stdout:
-        sink_info["type"] = "stream"
-        sink_info["target"] = "stdout"
-    elif target == sys.stderr:
-        sink_info["type"] = "stream"
-        sink_info["target"] = "stderr"
-    elif callable(target):
-        sink_info["type"] = "function"
-        sink_info["target"] = getattr(target, "__name__", str(target))
-    else:
-        sink_info["type"] = "unknown"
-        sink_info["target"] = str(target)
-
     return sink_info
 
 @router.get("")
@@ -61,6 +60,139 @@ async def get_loggers():
     }
 
 
+@router.get("/metrics/latency")
+async def get_latency_metrics():
+    histograms = latency_snapshot()
+    return {
+        "count": len(histograms),
+        "histograms": histograms,
+    }
+
+
+@router.delete("/metrics/latency")
+async def reset_latency_metrics():
+    reset_latency_histograms()
+    return {"message": "Latency histograms have been reset"}
+
+
+@router.get("/shipping/stats")
+async def get_shipping_stats():
+    return log_shipping_stats()
+
+
+@router.get("/sampling")
+async def get_sampling():
+    return sampling_stats()
+
+
+class SamplingConfigRequest(BaseModel):
+    sample_rate: Optional[float] = None
+    rate_limit: Optional[float] = None
+    burst: Optional[float] = None
+    exempt_level: Optional[str] = None
+    report_interval: Optional[float] = None
+
+
+@router.put("/sampling")
+async def configure_log_sampling(config: SamplingConfigRequest):
+    try:
+        return configure_sampling(**config.model_dump(exclude_none=True))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/tail")
+async def get_tail_buffer():
+    return tail_buffer_stats()
+
+
+class TailBufferConfigRequest(BaseModel):
+    enabled: Optional[bool] = None
+    level: Optional[str] = None
+    flush_level: Optional[str] = None
+    max_records: Optional[int] = None
+    max_total_records: Optional[int] = None
+
+
+@router.put("/tail")
+async def configure_log_tail_buffer(config: TailBufferConfigRequest):
+    try:
+        return configure_tail_buffer(**config.model_dump(exclude_none=True))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/sinks")
+async def get_live_sinks():
+    sinks = live_sinks()
+    return {
+        "count": len(sinks),
+        "sinks": sinks,
+    }
+
+
+# Các target được phép khi tạo/sửa sink qua API
+API_SINK_TARGETS = ("stdout", "stderr")
+
+# Các "params" được phép sửa qua API: chỉ tham số hiệu năng, không phải nơi
+# nhận log (url, host/port, address, socket_path) hay thông tin đăng nhập
+API_SINK_PARAMS = {
+    "network": ("framing", "buffer_size", "max_batch", "backoff_initial", "backoff_max"),
+    "opensearch": ("bulk", "batch_size", "batch_bytes", "flush_interval", "timeout", "max_pending"),
+    "file": ("buffer_size", "write_buffer", "flush_interval", "idle_timeout"),
+}
+
+
+class SinkConfigRequest(BaseModel):
+    enabled: Optional[bool] = None
+    level: Optional[str] = None
+    format: Optional[str] = None
+    target: Optional[str] = None
+    enqueue: Optional[bool] = None
+    colorize: Optional[bool] = None
+    rotation: Optional[str] = None
+    retention: Optional[str] = None
+    compression: Optional[str] = None
+    params: Optional[Dict[str, Any]] = None
+
+
+@router.put("/sinks/{name}")
+async def configure_sink(name: str, config: SinkConfigRequest):
+    changes = config.model_dump(exclude_none=True)
+    if name not in CURRENT_SINKS and not changes.get("target"):
+        raise HTTPException(status_code=404, detail=f"Sink '{name}' not found")
+    if "level" in changes:
+        changes["level"] = changes["level"].upper()
+    if "params" in changes:
+        allowed = API_SINK_PARAMS.get(name, ())
+        rejected = sorted(key for key in changes["params"] if key not in allowed)
+        if rejected:
+            raise HTTPException(status_code=400,
+                    detail=f"Sink params cannot be changed: {', '.join(rejected)}")
+    if "target" in changes:
+        # Không cho phép ghi log ra một đường dẫn tuỳ ý lấy từ request
+        if changes["target"] not in API_SINK_TARGETS:
+            raise HTTPException(status_code=400,
+                    detail=f"Sink target must be one of {', '.join(API_SINK_TARGETS)}")
+        changes["target"] = getattr(sys, changes["target"])
+    try:
+        action = update_sink_config(name, changes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "message": f"Sink '{name}': {action}",
+        "sink": _transform_sink_conf_to_info(name, CURRENT_SINKS[name]),
+    }
+
+
+@router.delete("/sinks/{name}")
+async def delete_sink(name: str):
+    if not remove_sink(name):
+        raise HTTPException(status_code=404, detail=f"Sink '{name}' not found")
+    return {"message": f"Sink '{name}' removed"}
+
+
 @router.get("/{name}")
 async def get_logger_detail(name: str):
     config = CURRENT_SINKS.get(name)
@@ -78,8 +210,7 @@ class LoggerConfigRequest(BaseModel):
 @router.post("/")
 async def configure_logging(config: LoggerConfigRequest):
     try:
-        logger.level(config.level.upper())
-        ctx.default_log_level = config.level.upper()
+        set_default_log_level(config.level)
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid log level")
 
@@ -87,8 +218,7 @@ async def configure_logging(config: LoggerConfigRequest):
     if not valid_targets:
         raise HTTPException(status_code=400, detail="No valid sinks provided")
 
-    ctx.default_set_sinks = valid_targets
-    ctx.default_str_sinks = ",".join(ctx.default_set_sinks)
+    set_default_log_sinks(",".join(sorted(valid_targets)))
 
     return {
         "message": "Logger configuration applied for current request",
@@ -0,0 +1,188 @@
+import threading
+import time
+import zlib
+from typing import Dict, Optional, Tuple
+
+from loguru import logger
+
+from . import context as ctx
+from .tail_buffer import tail_config
+
+# --- Log sampling ---
+# Quyết định được đưa ra một lần cho mỗi record trong patcher; các filter của
+# sink chỉ đọc record[KEY_SAMPLED_OUT].
+KEY_SAMPLED_OUT = "sampled_out"
+KEY_SAMPLING_REPORT = "_sampling_report"
+
+HEADER_LOG_SAMPLE_RATE = b"x-log-sample-rate"
+
+_HASH_SPACE = float(1 << 32)
+
+
+def head_sampled(correlation_id: str, rate: float) -> bool:
+    """Deterministic per request (and across processes): same id → same decision."""
+    return zlib.crc32(correlation_id.encode()) / _HASH_SPACE < rate
+
+
+class LogSampler:
+    """
+    Two sampling layers, both skipped for records at `exempt_level` or above:
+
+    - head sampling: a request (correlation_id) is logged entirely with
+      probability `sample rate` (default_sample_rate, or X-Log-Sample-Rate);
+    - rate limiting: a token bucket of `rate_limit` records/second (with
+      `burst`) per call site (module name, line).
+
+    Suppressed counts are logged every `report_interval` seconds.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[Tuple, list] = dict()
+        self._suppressed: Dict[Tuple, int] = dict()
+        self._totals = dict(head=0, rate_limit=0)
+        self._reporter = None
+        self.rate_limit: Optional[float] = None
+        self.burst: float = 10
+        self.exempt_level = "WARNING"
+        self.exempt_level_no = 30
+        self.report_interval: float = 60.0
+
+    def configure(self, rate_limit: Optional[float] = None,
+            burst: Optional[float] = None,
+            exempt_level: Optional[str] = None,
+            report_interval: Optional[float] = None):
+        exempt_level_no = logger.level(exempt_level.upper()).no if exempt_level else None
+        with self._lock:
+            if rate_limit is not None:
+                self.rate_limit = rate_limit or None  # 0 → tắt rate limit
+                self._buckets.clear()
+            if burst is not None:
+                self.burst = max(1.0, burst)
+                self._buckets.clear()
+            if exempt_level_no is not None:
+                self.exempt_level, self.exempt_level_no = exempt_level.upper(), exempt_level_no
+            if report_interval is not None:
+                self.report_interval = report_interval
+        self._ensure_reporter()
+
+    def decide(self, record) -> bool:
+        level_no = record["level"].no
+        if level_no >= self.exempt_level_no or KEY_SAMPLING_REPORT in record["extra"]:
+            return True
+        if level_no < ctx.request_log_level_no.get() and not _tail_buffered(level_no):
+            return True  # bị filter của sink loại bỏ: không tốn token, không đếm
+
+        rate = ctx.request_sample_rate.get()
+        if rate is None:
+            rate = ctx.default_sample_rate
+        if rate < 1.0:
+            correlation_id = record.get("correlation_id")
+            if correlation_id and not head_sampled(correlation_id, rate):
+                with self._lock:
+                    self._totals["head"] += 1
+                return False
+
+        rate_limit = self.rate_limit
+        if rate_limit:
+            site = (record["name"], record["line"])
+            now = time.monotonic()
+            with self._lock:
+                bucket = self._buckets.get(site)
+                if bucket is None:
+                    bucket = self._buckets[site] = [self.burst, now]
+                else:
+                    bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * rate_limit)
+                    bucket[1] = now
+                if bucket[0] < 1.0:
+                    self._suppressed[site] = self._suppressed.get(site, 0) + 1
+                    self._totals["rate_limit"] += 1
+                    return False
+                bucket[0] -= 1.0
+        return True
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(
+                rate_limit=self.rate_limit,
+                burst=self.burst,
+                exempt_level=self.exempt_level,
+                report_interval=self.report_interval,
+                default_sample_rate=ctx.default_sample_rate,
+                suppressed=dict(self._totals),
+                pending_call_sites={f"{name}:{line}": count
+                        for (name, line), count in self._suppressed.items()},
+            )
+
+    def report(self) -> Dict[str, int]:
+        """Log and reset the per call site suppressed counts."""
+        with self._lock:
+            suppressed, self._suppressed = self._suppressed, dict()
+        if suppressed:
+            counts = {f"{name}:{line}": count for (name, line), count in suppressed.items()}
+            logger.bind(**{KEY_SAMPLING_REPORT: True}).warning(
+                    f"Log sampling suppressed {sum(counts.values())} records: {counts}")
+        return suppressed
+
+    def _ensure_reporter(self):
+        with self._lock:
+            if self._reporter is not None or not self.report_interval:
+                return
+            self._reporter = threading.Thread(target=self._report_periodically,
+                    name="log-sampling-reporter", daemon=True)
+            self._reporter.start()
+
+    def _report_periodically(self):
+        while True:
+            time.sleep(self.report_interval or 60.0)
+            try:
+                self.report()
+            except Exception:
+                pass
+
+
+def _tail_buffered(level_no: int) -> bool:
+    buffer = ctx.request_tail_buffer.get()
+    return buffer is not None and not buffer.closed and level_no >= tail_config.level_no
+
+
+log_sampler = LogSampler()
+
+
+def sample_record(record) -> bool:
+    # Gọi từ patcher: chỉ đánh dấu record bị loại, record được giữ không đổi
+    if not log_sampler.decide(record):
+        record[KEY_SAMPLED_OUT] = True
+        return False
+    return True
+
+
+def configure_sampling(**options) -> Dict:
+    """Options: rate_limit, burst, exempt_level, report_interval, sample_rate (default head rate)."""
+    sample_rate = options.pop("sample_rate", None)
+    if sample_rate is not None:
+        set_default_sample_rate(sample_rate)
+    log_sampler.configure(**options)
+    return log_sampler.stats()
+
+
+def sampling_stats() -> Dict:
+    return log_sampler.stats()
+
+
+def _parse_sample_rate(value) -> Optional[float]:
+    try:
+        rate = float(value)
+    except (TypeError, ValueError):
+        return None
+    return rate if 0.0 <= rate <= 1.0 else None
+
+
+def set_default_sample_rate(rate: float):
+    parsed = _parse_sample_rate(rate)
+    if parsed is None:
+        raise ValueError(f"Invalid sample rate: {rate}")
+    ctx.default_sample_rate = parsed
+
+
+def set_request_sample_rate(header_value: Optional[str]):
+    ctx.request_sample_rate.set(_parse_sample_rate(header_value) if header_value is not None else None)
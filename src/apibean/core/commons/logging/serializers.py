@@ -0,0 +1,195 @@
+import json
+import traceback
+from json.encoder import encode_basestring
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import orjson  # optional: pip install apibean-core[orjson]
+except ImportError:
+    orjson = None
+
+# Giá trị "format" của một sink để ghi record dạng JSON (tương thích serialize=True của loguru)
+JSON_FORMAT = "json"
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Khoá của record giữ dòng JSON do serialized_format tạo ra
+KEY_SERIALIZED = "_serialized"
+
+
+# --- Generic JSON encoding ---
+def _stdlib_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str).encode()
+
+
+if orjson is not None:
+    def dumps(obj: Any) -> bytes:
+        """Serialize `obj` to compact JSON bytes (orjson when installed)."""
+        try:
+            return orjson.dumps(obj, default=str)
+        except TypeError:
+            # vd. key không phải str, số nguyên > 64 bit
+            return _stdlib_dumps(obj)
+else:
+    dumps = _stdlib_dumps
+
+
+def dumps_str(obj: Any) -> str:
+    return dumps(obj).decode()
+
+
+# --- Loguru record → document ---
+# Giá trị JSON của tên level được tính sẵn (các level thêm sau được cache khi gặp)
+_level_json_cache: Dict[str, str] = {
+    name: encode_basestring(name)
+    for name in ("TRACE", "DEBUG", "INFO", "SUCCESS", "WARNING", "ERROR", "CRITICAL")
+}
+
+def _level_json(name: str) -> str:
+    encoded = _level_json_cache.get(name)
+    if encoded is None:
+        encoded = _level_json_cache[name] = encode_basestring(name)
+    return encoded
+
+
+def _exception_of(record) -> Optional[Dict]:
+    exception = record["exception"]
+    if not exception:
+        return None
+    return {
+        "type": exception.type.__name__ if exception.type else None,
+        "value": str(exception.value),
+        "traceback": "".join(traceback.format_tb(exception.traceback)) if exception.traceback else None,
+    }
+
+
+_DOCUMENT_FIELDS: List[Tuple[str, Callable]] = [
+    ("requestId", lambda r: r.get("correlation_id")),
+    ("timestamp", lambda r: r["time"].isoformat()),
+    ("level", lambda r: r["level"].name),
+    ("message", lambda r: r["message"]),
+    ("logger", lambda r: r["name"]),
+    ("line", lambda r: r["line"]),
+]
+
+_FILE_FUNCTION_FIELDS: List[Tuple[str, Callable]] = [
+    ("file", lambda r: r["file"].name),
+    ("function", lambda r: r["function"]),
+]
+
+_PROC_THREAD_FIELDS: List[Tuple[str, Callable]] = [
+    ("process", lambda r: r["process"].id),
+    ("thread", lambda r: r["thread"].id),
+]
+
+
+class RecordSerializer:
+    """
+    Converts a loguru record into the flat log document shipped to remote
+    sinks, encoded to JSON bytes once per record. Field names and their JSON
+    prefixes are computed when the serializer is created.
+    """
+    __slots__ = ("fields", "_prefixes")
+
+    def __init__(self, log_file_function: bool = False, log_proc_thread: bool = False):
+        fields = list(_DOCUMENT_FIELDS)
+        if log_file_function:
+            fields += _FILE_FUNCTION_FIELDS
+        if log_proc_thread:
+            fields += _PROC_THREAD_FIELDS
+        self.fields = fields
+        self._prefixes = [("{" if i == 0 else ",") + encode_basestring(key) + ":"
+                for i, (key, _) in enumerate(fields)]
+
+    def to_dict(self, record) -> Dict:
+        log = {key: getter(record) for key, getter in self.fields}
+        exception = _exception_of(record)
+        if exception is not None:
+            log["exception"] = exception
+        return log
+
+    def dumps(self, record) -> bytes:
+        if orjson is not None:
+            return dumps(self.to_dict(record))
+
+        # stdlib: ghép các mảnh JSON đã tính sẵn thay vì json.dumps(dict)
+        parts = []
+        for prefix, (key, getter) in zip(self._prefixes, self.fields):
+            value = getter(record)
+            parts.append(prefix)
+            if value is None:
+                parts.append("null")
+            elif key == "level":
+                parts.append(_level_json(value))
+            elif isinstance(value, str):
+                parts.append(encode_basestring(value))
+            elif isinstance(value, int) and not isinstance(value, bool):
+                parts.append(str(value))
+            else:
+                parts.append(json.dumps(value, ensure_ascii=False, default=str))
+        exception = _exception_of(record)
+        if exception is not None:
+            parts.append(',"exception":')
+            parts.append(json.dumps(exception, ensure_ascii=False, separators=(",", ":"), default=str))
+        parts.append("}")
+        return "".join(parts).encode()
+
+
+# --- loguru serialize=True compatible output ---
+def serialize_record(record, text: Optional[str] = None) -> bytes:
+    """
+    Same structure as the lines written by `logger.add(..., serialize=True)`:
+    {"text": ..., "record": {...}}. `text` defaults to the message.
+    """
+    exception = record["exception"]
+    if exception is not None:
+        exception = {
+            "type": None if exception.type is None else exception.type.__name__,
+            "value": exception.value,
+            "traceback": bool(exception.traceback),
+        }
+
+    serializable = {
+        "text": record["message"] if text is None else text,
+        "record": {
+            "elapsed": {
+                "repr": str(record["elapsed"]),
+                "seconds": record["elapsed"].total_seconds(),
+            },
+            "exception": exception,
+            "extra": record["extra"],
+            "file": {"name": record["file"].name, "path": record["file"].path},
+            "function": record["function"],
+            "level": {
+                "icon": record["level"].icon,
+                "name": record["level"].name,
+                "no": record["level"].no,
+            },
+            "line": record["line"],
+            "message": record["message"],
+            "module": record["module"],
+            "name": record["name"],
+            "process": {"id": record["process"].id, "name": record["process"].name},
+            "thread": {"id": record["thread"].id, "name": record["thread"].name},
+            "time": {"repr": str(record["time"]), "timestamp": record["time"].timestamp()},
+        },
+    }
+    return dumps(serializable)
+
+
+def serialized_format(record) -> str:
+    """
+    Format function for file/stdout sinks: one JSON object per line.
+
+        logger.add(sys.stdout, format=serialized_format)
+    """
+    # Đặt ở khoá riêng của record, không phải "extra": các handler khác (vd.
+    # format "{extra}") không thấy payload, và JSON không bị parse như format
+    record.pop(KEY_SERIALIZED, None)
+    record[KEY_SERIALIZED] = serialize_record(record).decode()
+    return "{" + KEY_SERIALIZED + "}\n"
+
+
+def resolve_format(fmt):
+    """Map the `JSON_FORMAT` keyword of a sink config to `serialized_format`."""
+    return serialized_format if fmt == JSON_FORMAT else fmt
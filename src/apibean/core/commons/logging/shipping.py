@@ -0,0 +1,222 @@
+import sys
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+from loguru import logger
+
+# --- Shared log shipping engine ---
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP_OLDEST = "drop-oldest"
+OVERFLOW_DROP_NEWEST = "drop-newest"
+OVERFLOW_SAMPLE = "sample"
+
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST, OVERFLOW_SAMPLE)
+
+DEFAULT_SHIPPING = {
+    "capacity": 10000,
+    "overflow": OVERFLOW_DROP_OLDEST,
+    "keep_level": "WARNING",
+    "block_timeout": 1.0,
+}
+
+
+class LogShipper:
+    """
+    One background worker shipping the records of several sinks through a
+    bounded ring buffer. When the buffer is full, `overflow` decides:
+
+    - "block": wait up to `block_timeout` seconds for room, then drop the record;
+    - "drop-oldest": evict the oldest queued record;
+    - "drop-newest": reject the incoming record;
+    - "sample": only records at `keep_level` or above are admitted, evicting
+      the oldest queued record.
+
+    At most `max_batch` records are in flight outside of the buffer.
+    """
+    def __init__(self, capacity: int = 10000,
+            overflow: str = OVERFLOW_DROP_OLDEST,
+            keep_level: str = "WARNING",
+            block_timeout: float = 1.0,
+            max_batch: int = 256):
+        self.max_batch = max_batch
+        self._cond = threading.Condition()
+        self._buffer = deque()
+        self._sinks: Dict[str, "ShippedSink"] = dict()
+        self._worker = None
+        self._busy = False
+        self._counters = dict(enqueued=0, shipped=0, dropped=0, errors=0, high_watermark=0)
+        self.reconfigure(capacity=capacity, overflow=overflow,
+                keep_level=keep_level, block_timeout=block_timeout)
+
+    def reconfigure(self, capacity: Optional[int] = None,
+            overflow: Optional[str] = None,
+            keep_level: Optional[str] = None,
+            block_timeout: Optional[float] = None):
+        if overflow is not None and overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unsupported overflow policy: {overflow}")
+        if capacity is not None and capacity < 1:
+            raise ValueError(f"Invalid shipping capacity: {capacity}")
+        keep_level_no = logger.level(keep_level).no if keep_level is not None else None
+
+        with self._cond:
+            if capacity is not None:
+                self.capacity = capacity
+            if overflow is not None:
+                self.overflow = overflow
+            if keep_level is not None:
+                self.keep_level = keep_level
+                self.keep_level_no = keep_level_no
+            if block_timeout is not None:
+                self.block_timeout = block_timeout
+            self._cond.notify_all()
+
+    def wrap(self, name: str, target) -> "ShippedSink":
+        """Return a sink for `logger.add(..., enqueue=False)` that ships to `target`."""
+        sink = ShippedSink(self, name, target)
+        with self._cond:
+            self._sinks[name] = sink
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run,
+                        name="log-shipper", daemon=True)
+                self._worker.start()
+        return sink
+
+    def put(self, sink: "ShippedSink", message) -> bool:
+        with self._cond:
+            if len(self._buffer) >= self.capacity and not self._make_room(message):
+                self._counters["dropped"] += 1
+                sink.dropped += 1
+                return False
+            self._buffer.append((sink, message))
+            sink.pending += 1
+            counters = self._counters
+            counters["enqueued"] += 1
+            if len(self._buffer) > counters["high_watermark"]:
+                counters["high_watermark"] = len(self._buffer)
+            self._cond.notify_all()
+            return True
+
+    def _make_room(self, message) -> bool:
+        # Gọi khi đang giữ self._cond và buffer đã đầy
+        overflow = self.overflow
+        if overflow == OVERFLOW_BLOCK:
+            # Worker tự log (vd. sink lỗi) không được chờ chính nó
+            if threading.current_thread() is not self._worker:
+                self._cond.wait_for(lambda: len(self._buffer) < self.capacity,
+                        timeout=self.block_timeout)
+            return len(self._buffer) < self.capacity
+        if overflow == OVERFLOW_DROP_NEWEST:
+            return False
+        if overflow == OVERFLOW_SAMPLE and message.record["level"].no < self.keep_level_no:
+            return False
+        while len(self._buffer) >= self.capacity:
+            evicted, _ = self._buffer.popleft()
+            evicted.pending -= 1
+            evicted.dropped += 1
+            self._counters["dropped"] += 1
+        return True
+
+    def drain(self, sink: Optional["ShippedSink"] = None, timeout: Optional[float] = None) -> bool:
+        """Wait until the queued records (of `sink`, or all) have been shipped."""
+        if threading.current_thread() is self._worker:
+            return False
+        with self._cond:
+            if sink is None:
+                return self._cond.wait_for(lambda: not self._buffer and not self._busy, timeout=timeout)
+            return self._cond.wait_for(lambda: sink.pending == 0, timeout=timeout)
+
+    def detach(self, sink: "ShippedSink"):
+        with self._cond:
+            if self._sinks.get(sink.name) is sink:
+                del self._sinks[sink.name]
+            self._cond.notify_all()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return dict(self._counters,
+                    capacity=self.capacity,
+                    overflow=self.overflow,
+                    keep_level=self.keep_level,
+                    queued=len(self._buffer),
+                    sinks={name: sink.stats() for name, sink in self._sinks.items()})
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+                while not self._buffer:
+                    if not self._sinks:
+                        self._worker = None
+                        return  # không còn sink nào → worker kết thúc
+                    self._cond.wait()
+                buffer = self._buffer
+                batch = [buffer.popleft() for _ in range(min(len(buffer), self.max_batch))]
+                self._busy = True
+                self._cond.notify_all()  # giải phóng các producer đang chờ (block)
+
+            shipped = dict()
+            errors = 0
+            for sink, message in batch:
+                try:
+                    sink.target(message)
+                except Exception as e:
+                    errors += 1
+                    print(f"Log shipping error ({sink.name}): {e}", file=sys.stderr)
+                shipped[sink] = shipped.get(sink, 0) + 1
+
+            with self._cond:
+                for sink, count in shipped.items():
+                    sink.pending -= count
+                    sink.shipped += count
+                self._counters["shipped"] += len(batch)
+                self._counters["errors"] += errors
+
+
+class ShippedSink:
+    """Loguru sink handing the records over to a `LogShipper`."""
+    def __init__(self, shipper: LogShipper, name: str, target):
+        self.shipper = shipper
+        self.name = name
+        self.target = target
+        self.pending = 0
+        self.shipped = 0
+        self.dropped = 0
+
+    def write(self, message):
+        self.shipper.put(self, message)
+
+    def stop(self):
+        # loguru gọi stop() khi handler bị remove / lúc thoát: ship nốt rồi dừng target
+        self.shipper.drain(self, timeout=10)
+        self.shipper.detach(self)
+        stop = getattr(self.target, "stop", None)
+        if callable(stop):
+            stop()
+
+    def stats(self) -> Dict:
+        return dict(pending=self.pending, shipped=self.shipped, dropped=self.dropped)
+
+
+_shipper: Optional[LogShipper] = None
+_shipper_lock = threading.Lock()
+
+
+def get_log_shipper() -> LogShipper:
+    global _shipper
+    if _shipper is None:
+        with _shipper_lock:
+            if _shipper is None:
+                _shipper = LogShipper(**DEFAULT_SHIPPING)
+    return _shipper
+
+
+def configure_log_shipper(**options) -> LogShipper:
+    shipper = get_log_shipper()
+    shipper.reconfigure(**{k: v for k, v in options.items() if k in DEFAULT_SHIPPING})
+    return shipper
+
+
+def log_shipping_stats() -> Dict:
+    return get_log_shipper().stats()
@@ -0,0 +1,156 @@
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+from asgi_correlation_id.context import correlation_id
+from loguru import logger
+
+from . import context as ctx
+from .serializers import KEY_SERIALIZED
+
+# --- Tail-based logging ---
+# Các record dưới ngưỡng level của request (vd. DEBUG khi chạy INFO) được giữ
+# trong một ring buffer riêng của request: bỏ đi khi request thành công, phát
+# lại tới các sink khi request lỗi (exception, 5xx) hoặc log ở mức ERROR.
+KEY_TAIL_REPLAY = "tail_replay"
+
+
+class TailBufferConfig:
+    def __init__(self):
+        self.enabled = False
+        self.level = "DEBUG"
+        self.level_no = 10
+        self.flush_level = "ERROR"
+        self.flush_level_no = 40
+        self.max_records = 1000
+        self.max_total_records = 100000
+
+
+tail_config = TailBufferConfig()
+
+_lock = threading.Lock()
+_counters = dict(buffered=0, dropped=0, flushed=0, discarded=0, active_requests=0)
+
+
+class TailBuffer:
+    """Bounded ring of the records of one request (drop-oldest)."""
+    __slots__ = ("correlation_id", "records", "triggered", "closed")
+
+    def __init__(self, correlation_id: Optional[str], max_records: int):
+        self.correlation_id = correlation_id
+        self.records = deque(maxlen=max_records)
+        self.triggered = False
+        self.closed = False
+
+    def append(self, record):
+        with _lock:
+            if len(self.records) == self.records.maxlen:
+                _counters["dropped"] += 1  # ring đầy: record cũ nhất bị đẩy ra
+            elif _counters["buffered"] >= tail_config.max_total_records:
+                _counters["dropped"] += 1
+                return
+            else:
+                _counters["buffered"] += 1
+            self.records.append(record)
+
+    def take(self):
+        with _lock:
+            records = list(self.records)
+            self.records.clear()
+            _counters["buffered"] -= len(records)
+        return records
+
+
+def configure_tail_buffer(enabled: Optional[bool] = None,
+        level: Optional[str] = None,
+        flush_level: Optional[str] = None,
+        max_records: Optional[int] = None,
+        max_total_records: Optional[int] = None) -> Dict:
+    level_no = logger.level(level.upper()).no if level else None
+    flush_level_no = logger.level(flush_level.upper()).no if flush_level else None
+    if enabled is not None:
+        tail_config.enabled = enabled
+    if level_no is not None:
+        tail_config.level, tail_config.level_no = level.upper(), level_no
+    if flush_level_no is not None:
+        tail_config.flush_level, tail_config.flush_level_no = flush_level.upper(), flush_level_no
+    if max_records is not None:
+        tail_config.max_records = max_records
+    if max_total_records is not None:
+        tail_config.max_total_records = max_total_records
+    return tail_buffer_stats()
+
+
+def tail_buffer_stats() -> Dict:
+    with _lock:
+        return dict(_counters,
+                enabled=tail_config.enabled,
+                level=tail_config.level,
+                flush_level=tail_config.flush_level,
+                max_records=tail_config.max_records,
+                max_total_records=tail_config.max_total_records)
+
+
+# --- Patcher / filter support ---
+def tail_buffer_record(record):
+    """Called from the patcher, after sampling: buffer, trigger or pass the record."""
+    buffer = ctx.request_tail_buffer.get()
+    if buffer is None or buffer.closed:
+        return
+
+    level_no = record["level"].no
+    if buffer.triggered:
+        # Request đã lỗi: các record chi tiết còn lại được ghi thẳng
+        if level_no >= tail_config.level_no:
+            record[KEY_TAIL_REPLAY] = True
+        return
+    if level_no >= tail_config.flush_level_no:
+        flush_tail_buffer(buffer)  # phát lại trước record ERROR
+        return
+    if tail_config.level_no <= level_no < ctx.request_log_level_no.get():
+        buffer.append(record)
+
+
+def _restore_record(saved, record):
+    record.update(saved)
+    record.pop(KEY_SERIALIZED, None)  # dòng JSON cũ: được tạo lại cho record phát lại
+    record[KEY_TAIL_REPLAY] = True
+
+
+def flush_tail_buffer(buffer: TailBuffer):
+    buffer.triggered = True
+    records = buffer.take()
+    with _lock:
+        _counters["flushed"] += len(records)
+    # "extra" mang dấu replay để patcher bỏ qua sampling/buffer; patch khôi
+    # phục nguyên trạng record gốc (thời điểm, vị trí, exception, ...)
+    replayer = logger.bind(**{KEY_TAIL_REPLAY: True})
+    for saved in records:
+        replayer.patch(lambda record, saved=saved: _restore_record(saved, record)).log(
+                saved["level"].name, saved["message"])
+
+
+# --- Request lifecycle ---
+def start_tail_buffer() -> Optional[TailBuffer]:
+    if not tail_config.enabled:
+        if ctx.request_tail_buffer.get() is not None:
+            ctx.request_tail_buffer.set(None)
+        return None
+    buffer = TailBuffer(correlation_id.get(), tail_config.max_records)
+    ctx.request_tail_buffer.set(buffer)
+    with _lock:
+        _counters["active_requests"] += 1
+    return buffer
+
+
+def finish_tail_buffer(buffer: Optional[TailBuffer], failed: bool):
+    """Flush the buffered records if the request failed, discard them otherwise."""
+    if buffer is None or buffer.closed:
+        return
+    if failed and not buffer.triggered:
+        flush_tail_buffer(buffer)
+    buffer.closed = True
+    records = buffer.take()
+    with _lock:
+        _counters["discarded"] += len(records)
+        _counters["active_requests"] -= 1
@@ -1,36 +1,64 @@
 from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
 import re
+import time
 
-_cached_date = None
-_cached_result = None
+_TIME_PLACEHOLDER = re.compile(r"\{time:(.+?)\}")
+
+# Cache theo từng template: template → (plan, chu kỳ, hết hạn lúc (epoch giây), kết quả)
+_time_pattern_cache: Dict[str, Tuple[Optional[str], int, float, str]] = dict()
 
 def format_time_pattern(template: str) -> str:
-    global _cached_date, _cached_result
+    entry = _time_pattern_cache.get(template)
+    now = time.time()
+
+    # Chưa qua mốc thời gian (ngày/giờ/...) → dùng kết quả đã cache
+    if entry is not None and now < entry[2]:
+        return entry[3]
+
+    if entry is None:
+        plan, period = compile_time_pattern(template)
+    else:
+        plan, period = entry[0], entry[1]
 
     # Nếu template không chứa {time:...} → không cần xử lý
-    if "{time:" not in template:
+    if plan is None:
+        _time_pattern_cache[template] = (None, 0, float("inf"), template)
         return template
 
-    now = datetime.now(timezone.utc)
-    today = now.date()
-
-    # Nếu ngày không đổi, dùng cache
-    if _cached_date == today and _cached_result is not None:
-        return _cached_result
+    result = datetime.fromtimestamp(now, timezone.utc).strftime(plan)
+    valid_until = (now // period + 1) * period
+    _time_pattern_cache[template] = (plan, period, valid_until, result)
+    return result
 
-    # Nếu ngày đã thay đổi → xử lý lại
-    pattern = re.compile(r"\{time:(.+?)\}")
+def compile_time_pattern(template: str) -> Tuple[Optional[str], int]:
+    """
+    Compile a template with {time:YYYY.MM.DD} placeholders into a single
+    strftime format and the length (seconds) of the period it changes with.
+    """
+    if "{time:" not in template:
+        return None, 0
 
-    def replacer(match):
-        fmt = match.group(1)
+    parts = []
+    position = 0
+    for match in _TIME_PLACEHOLDER.finditer(template):
+        parts.append(template[position:match.start()].replace("%", "%%"))
+        fmt = match.group(1).replace("%", "%%")
         fmt = fmt.replace("YYYY", "%Y").replace("MM", "%m").replace("DD", "%d")
         fmt = fmt.replace("HH", "%H").replace("mm", "%M").replace("ss", "%S")
-        return now.strftime(fmt)
+        parts.append(fmt)
+        position = match.end()
+    parts.append(template[position:].replace("%", "%%"))
 
-    result = pattern.sub(replacer, template)
+    plan = "".join(parts)
+    return plan, _period_of(plan)
 
-    # Cập nhật cache
-    _cached_date = today
-    _cached_result = result
-
-    return result
+def _period_of(plan: str) -> int:
+    # Thời điểm đổi kết quả: epoch căn theo UTC nên chia hết cho chu kỳ
+    if "%S" in plan:
+        return 1
+    if "%M" in plan:
+        return 60
+    if "%H" in plan:
+        return 3600
+    return 86400
@@ -1,5 +1,11 @@
+import asyncio
+import atexit
+import hashlib
+import inspect
+import threading
+import time
 from functools import wraps
-from typing import Callable
+from typing import Callable, Dict, Optional, Tuple
 
 from apibean.core.commons.logging import logger
 
@@ -44,6 +50,354 @@ async def get_or_set_default_async(redis_client, key: str, default_value: int, e
     return value
 
 
+def _to_int(value) -> int:
+    # redis trả về bytes/str, chuyển về int trước khi so sánh
+    return int(value)
+
+
+# --- TTL cache cho các giá trị limit (hiếm khi thay đổi) ---
+class TTLCache:
+    def __init__(self, ttl_seconds: float, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: Dict[str, Tuple[float, int]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[int]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._entries.pop(key, None)
+            return None
+        return value
+
+    def set(self, key: str, value: int):
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+
+    def invalidate(self, key: Optional[str] = None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+def read_limit_and_count(redis_client, entrypoint_limit: str, entrypoint_count: str,
+        default_limit_value: int, default_count_value: int,
+        limit_cache: Optional[TTLCache] = None) -> Tuple[int, int]:
+    """
+    Đọc limit và count trong một round trip (MGET, hoặc GET count khi limit
+    đã có trong cache). Chỉ khi key chưa tồn tại mới cần thêm một pipeline
+    SETNX + MGET để khởi tạo giá trị mặc định.
+    """
+    limit_value = limit_cache.get(entrypoint_limit) if limit_cache is not None else None
+    if limit_value is not None:
+        count_value = redis_client.get(entrypoint_count)
+        missing_limit = False
+    else:
+        limit_value, count_value = redis_client.mget(entrypoint_limit, entrypoint_count)
+        missing_limit = limit_value is None
+
+    if missing_limit or count_value is None:
+        pipe = redis_client.pipeline()
+        if missing_limit:
+            pipe.setnx(entrypoint_limit, default_limit_value)
+        if count_value is None:
+            pipe.setnx(entrypoint_count, default_count_value)
+        pipe.mget(entrypoint_limit, entrypoint_count)
+        fetched_limit, count_value = pipe.execute()[-1]
+        if missing_limit:
+            limit_value = fetched_limit
+
+    limit_value = _to_int(limit_value)
+    if limit_cache is not None:
+        limit_cache.set(entrypoint_limit, limit_value)
+    return limit_value, _to_int(count_value)
+
+
+async def read_limit_and_count_async(redis_client, entrypoint_limit: str, entrypoint_count: str,
+        default_limit_value: int, default_count_value: int,
+        limit_cache: Optional[TTLCache] = None) -> Tuple[int, int]:
+    limit_value = limit_cache.get(entrypoint_limit) if limit_cache is not None else None
+    if limit_value is not None:
+        count_value = await redis_client.get(entrypoint_count)
+        missing_limit = False
+    else:
+        limit_value, count_value = await redis_client.mget(entrypoint_limit, entrypoint_count)
+        missing_limit = limit_value is None
+
+    if missing_limit or count_value is None:
+        pipe = redis_client.pipeline()
+        if missing_limit:
+            pipe.setnx(entrypoint_limit, default_limit_value)
+        if count_value is None:
+            pipe.setnx(entrypoint_count, default_count_value)
+        pipe.mget(entrypoint_limit, entrypoint_count)
+        fetched_limit, count_value = (await pipe.execute())[-1]
+        if missing_limit:
+            limit_value = fetched_limit
+
+    limit_value = _to_int(limit_value)
+    if limit_cache is not None:
+        limit_cache.set(entrypoint_limit, limit_value)
+    return limit_value, _to_int(count_value)
+
+
+# --- Đặt chỗ nguyên tử bằng Lua script ---
+# KEYS[1]: limit key, KEYS[2]: count key
+# ARGV[1]: limit mặc định, ARGV[2]: count mặc định, ARGV[3]: số slot cần đặt
+# Trả về {số slot được cấp, count sau khi cấp, limit}
+RESERVE_SLOTS_SCRIPT = """
+local limit = redis.call('GET', KEYS[1])
+if not limit then
+  redis.call('SETNX', KEYS[1], ARGV[1])
+  limit = redis.call('GET', KEYS[1])
+end
+local count = redis.call('GET', KEYS[2])
+if not count then
+  redis.call('SETNX', KEYS[2], ARGV[2])
+  count = redis.call('GET', KEYS[2])
+end
+limit = tonumber(limit)
+count = tonumber(count)
+local available = limit - count
+if available <= 0 then
+  return {0, count, limit}
+end
+local granted = math.min(available, tonumber(ARGV[3]))
+count = redis.call('INCRBY', KEYS[2], granted)
+return {granted, count, limit}
+"""
+
+
+class RedisScript:
+    """
+    A Lua script called through EVALSHA; the SHA is computed once and the
+    script is (re)loaded only when the server answers NOSCRIPT.
+    """
+    def __init__(self, source: str):
+        self.source = source
+        self.sha = hashlib.sha1(source.encode()).hexdigest()
+
+    @staticmethod
+    def _is_noscript_error(error: Exception) -> bool:
+        return type(error).__name__ == "NoScriptError" or str(error).startswith("NOSCRIPT")
+
+    def __call__(self, redis_client, keys, args):
+        try:
+            return redis_client.evalsha(self.sha, len(keys), *keys, *args)
+        except Exception as error:
+            if not self._is_noscript_error(error):
+                raise
+        redis_client.script_load(self.source)
+        return redis_client.evalsha(self.sha, len(keys), *keys, *args)
+
+    async def call_async(self, redis_client, keys, args):
+        try:
+            return await redis_client.evalsha(self.sha, len(keys), *keys, *args)
+        except Exception as error:
+            if not self._is_noscript_error(error):
+                raise
+        await redis_client.script_load(self.source)
+        return await redis_client.evalsha(self.sha, len(keys), *keys, *args)
+
+
+reserve_slots_script = RedisScript(RESERVE_SLOTS_SCRIPT)
+
+
+def reserve_slots(redis_client, entrypoint_limit: str, entrypoint_count: str,
+        default_limit_value: int, default_count_value: int,
+        slots: int = 1) -> Tuple[int, int, int]:
+    granted, count_value, limit_value = reserve_slots_script(redis_client,
+            [entrypoint_limit, entrypoint_count],
+            [default_limit_value, default_count_value, slots])
+    return _to_int(granted), _to_int(count_value), _to_int(limit_value)
+
+
+async def reserve_slots_async(redis_client, entrypoint_limit: str, entrypoint_count: str,
+        default_limit_value: int, default_count_value: int,
+        slots: int = 1) -> Tuple[int, int, int]:
+    granted, count_value, limit_value = await reserve_slots_script.call_async(redis_client,
+            [entrypoint_limit, entrypoint_count],
+            [default_limit_value, default_count_value, slots])
+    return _to_int(granted), _to_int(count_value), _to_int(limit_value)
+
+
+# --- Cấp phát slot theo lô (chế độ xấp xỉ) ---
+class _Lease:
+    __slots__ = ("redis_client", "remaining", "leased_at", "loop")
+
+    def __init__(self, redis_client, loop=None):
+        self.redis_client = redis_client
+        self.remaining = 0
+        self.leased_at = time.monotonic()
+        self.loop = loop  # event loop của client bất đồng bộ (None: client đồng bộ)
+
+
+class SlotLeases:
+    """
+    Approximate quota mode: blocks of `lease_size` slots are reserved from
+    Redis with one RESERVE_SLOTS_SCRIPT call and handed out from process
+    memory. Unused slots are given back (DECRBY) once a lease is older than
+    `flush_interval` seconds and at shutdown, so the over-allocation per
+    process and (tenant, model_type) is at most `lease_size - 1`.
+
+    A background thread flushes the expired leases; those of async clients
+    are returned on the event loop they were leased from. At interpreter
+    exit that loop has usually stopped: applications using an async client
+    should `await leases.aclose()` on shutdown (e.g. in the FastAPI lifespan).
+    A lease whose slots cannot be returned is kept for the next flush.
+    """
+    def __init__(self, lease_size: int, flush_interval: float = 5.0):
+        self.lease_size = lease_size
+        self.flush_interval = flush_interval
+        self._leases: Dict[str, _Lease] = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+        atexit.register(self._flush_at_exit)
+
+    def _take(self, entrypoint_count: str) -> bool:
+        with self._lock:
+            lease = self._leases.get(entrypoint_count)
+            if lease is not None and lease.remaining > 0:
+                lease.remaining -= 1
+                return True
+        return False
+
+    def _add(self, redis_client, entrypoint_count: str, granted: int, loop=None):
+        with self._lock:
+            lease = self._leases.get(entrypoint_count)
+            if lease is None:
+                lease = self._leases[entrypoint_count] = _Lease(redis_client, loop)
+            lease.leased_at = time.monotonic()
+            lease.remaining += granted - 1  # một slot dùng ngay cho lần gọi hiện tại
+
+    def release(self, entrypoint_count: str):
+        with self._lock:
+            lease = self._leases.get(entrypoint_count)
+            if lease is not None:
+                lease.remaining += 1
+                return True
+        return False
+
+    def _pop(self, only_expired: bool, returnable: Callable):
+        deadline = time.monotonic() - self.flush_interval
+        with self._lock:
+            popped = [(key, lease) for key, lease in self._leases.items()
+                    if (not only_expired or lease.leased_at <= deadline) and returnable(lease)]
+            for key, _ in popped:
+                del self._leases[key]
+        return [(key, lease) for key, lease in popped if lease.remaining > 0]
+
+    def _restore(self, key: str, lease: _Lease):
+        # Chưa trả được: giữ lại lease (gộp với lease mới nếu đã có)
+        with self._lock:
+            current = self._leases.get(key)
+            if current is None:
+                self._leases[key] = lease
+            else:
+                current.remaining += lease.remaining
+
+    def acquire(self, redis_client, entrypoint_limit: str, entrypoint_count: str,
+            default_limit_value: int, default_count_value: int) -> Tuple[bool, Optional[int], Optional[int]]:
+        if self._take(entrypoint_count):
+            return True, None, None
+        self._ensure_flusher()
+        granted, count_value, limit_value = reserve_slots(redis_client,
+                entrypoint_limit, entrypoint_count,
+                default_limit_value, default_count_value, self.lease_size)
+        if granted:
+            self._add(redis_client, entrypoint_count, granted)
+        return granted > 0, count_value, limit_value
+
+    async def acquire_async(self, redis_client, entrypoint_limit: str, entrypoint_count: str,
+            default_limit_value: int, default_count_value: int) -> Tuple[bool, Optional[int], Optional[int]]:
+        if self._take(entrypoint_count):
+            return True, None, None
+        self._ensure_flusher()
+        await self.flush_async()
+        granted, count_value, limit_value = await reserve_slots_async(redis_client,
+                entrypoint_limit, entrypoint_count,
+                default_limit_value, default_count_value, self.lease_size)
+        if granted:
+            self._add(redis_client, entrypoint_count, granted, asyncio.get_running_loop())
+        return granted > 0, count_value, limit_value
+
+    def flush(self, only_expired: bool = False):
+        """Return the unused slots; those of async clients are returned on their event loop."""
+        current = asyncio._get_running_loop()
+
+        def returnable(lease):
+            # Không thể chờ event loop của chính thread đang gọi
+            return lease.loop is None or (lease.loop.is_running() and lease.loop is not current)
+
+        for key, lease in self._pop(only_expired, returnable):
+            if lease.loop is None:
+                self._return_slots(key, lease)
+                continue
+            future = asyncio.run_coroutine_threadsafe(self._return_slots_async(key, lease), lease.loop)
+            try:
+                future.result(timeout=max(self.flush_interval, 1.0))
+            except Exception as e:
+                logger.warning(f"cannot return {lease.remaining} leased slots of [{key}]: {e}")
+
+    async def flush_async(self, only_expired: bool = True):
+        loop = asyncio.get_running_loop()
+        for key, lease in self._pop(only_expired, lambda lease: lease.loop in (None, loop)):
+            await self._return_slots_async(key, lease)
+
+    async def aclose(self):
+        """Return every unused slot leased from the current event loop (call on shutdown)."""
+        await self.flush_async(only_expired=False)
+
+    def _return_slots(self, key: str, lease: _Lease):
+        try:
+            result = lease.redis_client.decrby(key, lease.remaining)
+        except Exception as e:
+            logger.warning(f"cannot return {lease.remaining} leased slots of [{key}]: {e}")
+            self._restore(key, lease)
+            return
+        if inspect.isawaitable(result):
+            # Client bất đồng bộ dùng trong hàm đồng bộ: lệnh chỉ chạy khi được await
+            getattr(result, "close", lambda: None)()
+            logger.warning(f"cannot return {lease.remaining} leased slots of [{key}]: async client, use aclose()")
+            self._restore(key, lease)
+
+    async def _return_slots_async(self, key: str, lease: _Lease):
+        try:
+            result = lease.redis_client.decrby(key, lease.remaining)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logger.warning(f"cannot return {lease.remaining} leased slots of [{key}]: {e}")
+            self._restore(key, lease)
+
+    def _flush_at_exit(self):
+        self.flush()
+        with self._lock:
+            pending = sum(lease.remaining for lease in self._leases.values())
+        if pending:
+            logger.warning(f"{pending} leased slots were not returned: await leases.aclose() on shutdown")
+
+    def _ensure_flusher(self):
+        if self._flusher is None:
+            with self._lock:
+                if self._flusher is None:
+                    self._flusher = threading.Thread(target=self._flush_periodically,
+                            name="slot-leases-flusher", daemon=True)
+                    self._flusher.start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush(only_expired=True)
+
+
 def track_creations_on_service(model_type: str,
         tenant_code_key: str = "tenant_code",
         api_invoker_key: str = "api_invoker",
@@ -52,39 +406,104 @@ def track_creations_on_service(model_type: str,
         redis_client = None,
         default_limit_value: int = 10000,
         default_count_value: int = 0,
+        pipelined: bool = False,
+        limit_cache_ttl: Optional[float] = None,
+        atomic: bool = False,
+        lease_size: Optional[int] = None,
+        lease_flush_interval: float = 5.0,
 ):
     """
     Decorator để tăng biến đếm Redis khi POST thành công.
+
+    - pipelined: đọc limit và count trong một round trip (MGET) thay vì
+      get_or_set_default cho từng key.
+    - limit_cache_ttl: giữ giá trị limit trong bộ nhớ tiến trình (giây),
+      khi đó chỉ còn GET count + INCR cho mỗi lần tạo.
+    - atomic: kiểm tra và tăng count nguyên tử bằng một lệnh EVALSHA, trả lại
+      slot (DECR) nếu hàm được decorate raise exception.
+
+    - lease_size: chế độ xấp xỉ, đặt trước một lô slot bằng một lệnh Redis và
+      cấp phát dần trong bộ nhớ; slot chưa dùng được trả lại sau
+      lease_flush_interval giây và khi tiến trình kết thúc (xem SlotLeases).
+      Với client bất đồng bộ, gọi `await create.leases.aclose()` khi ứng
+      dụng dừng.
+
+    Với hàm `async def`, redis_client phải là client bất đồng bộ
+    (vd. redis.asyncio.Redis) và mọi lệnh Redis đều được await.
     """
+    limit_cache = TTLCache(limit_cache_ttl) if limit_cache_ttl else None
+    leases = SlotLeases(lease_size, lease_flush_interval) if lease_size else None
+    pipelined = pipelined or limit_cache is not None
+
+    def entrypoints_of(args, kwargs):
+        api_invoker = pick_api_invoker(api_invoker_key, *args, **kwargs)
+        tenant_code = getattr(api_invoker, tenant_code_key, "unknown")
+
+        logger.debug(f"tenant_code: [{ tenant_code }]")
+        logger.debug(f"model_type: [{ model_type }]")
+
+        redis_entrypoint = restrict_key_pattern.format(model_type=model_type, tenant_code=tenant_code)
+        return redis_entrypoint, redis_entrypoint + "_limit", redis_entrypoint + "_count"
+
+    def check_limit(count_value, limit_value):
+        if count_value >= limit_value:
+            raise LimitExceededError(f"total record [{count_value}] has exceeded [{limit_value}]")
+
     def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            return _async_decorator(func)
+
         @wraps(func)
         def wrapper(*args, **kwargs):
-            api_invoker = pick_api_invoker(api_invoker_key, *args, **kwargs)
-            tenant_code = getattr(api_invoker, tenant_code_key, "unknown")
+            redis_entrypoint, entrypoint_limit, entrypoint_count = entrypoints_of(args, kwargs)
 
-            logger.debug(f"tenant_code: [{ tenant_code }]")
-            logger.debug(f"model_type: [{ model_type }]")
+            if redis_client and leases is not None:
+                granted, count_value, limit_value = leases.acquire(redis_client,
+                        entrypoint_limit, entrypoint_count,
+                        default_limit_value, default_count_value)
+                if not granted:
+                    raise LimitExceededError(f"total record [{count_value}] has exceeded [{limit_value}]")
+                try:
+                    return func(*args, **kwargs)
+                except BaseException:
+                    # kể cả KeyboardInterrupt/CancelledError: slot không được giữ mãi
+                    if not leases.release(entrypoint_count):
+                        redis_client.decr(entrypoint_count)
+                    raise
 
-            redis_entrypoint = restrict_key_pattern.format(model_type=model_type, tenant_code=tenant_code)
-            entrypoint_count = redis_entrypoint + "_count"
-            entrypoint_limit = redis_entrypoint + "_limit"
+            if redis_client and atomic:
+                granted, count_value, limit_value = reserve_slots(redis_client,
+                        entrypoint_limit, entrypoint_count,
+                        default_limit_value, default_count_value)
+                logger.log(DEFAULT_LEVEL, f"reserved a slot in [{redis_entrypoint}]: {count_value}/{limit_value}")
+                if not granted:
+                    raise LimitExceededError(f"total record [{count_value}] has exceeded [{limit_value}]")
+                try:
+                    return func(*args, **kwargs)
+                except BaseException:
+                    # kể cả KeyboardInterrupt: slot không được giữ mãi
+                    logger.log(DEFAULT_LEVEL, "release the reserved slot with redis_client.decr")
+                    redis_client.decr(entrypoint_count)
+                    raise
 
             limit_value = default_limit_value
-            if redis_client:
-                limit_value = get_or_set_default(redis_client, entrypoint_limit, default_limit_value)
+            count_value = default_count_value
+            if redis_client and pipelined:
+                limit_value, count_value = read_limit_and_count(redis_client,
+                        entrypoint_limit, entrypoint_count,
+                        default_limit_value, default_count_value,
+                        limit_cache=limit_cache)
+                logger.log(DEFAULT_LEVEL, f"read the limit/count values from [{redis_entrypoint}] are: {limit_value}/{count_value}")
+            elif redis_client:
+                limit_value = _to_int(get_or_set_default(redis_client, entrypoint_limit, default_limit_value))
                 logger.log(DEFAULT_LEVEL, f"read the limit value from [{entrypoint_limit}] is: {limit_value}")
-            else:
-                logger.log(DEFAULT_LEVEL, "the redis_client is not available")
 
-            count_value = default_count_value
-            if redis_client:
-                count_value = get_or_set_default(redis_client, entrypoint_count, default_count_value)
+                count_value = _to_int(get_or_set_default(redis_client, entrypoint_count, default_count_value))
                 logger.log(DEFAULT_LEVEL, f"read the count value from [{entrypoint_count}] is: {count_value}")
             else:
                 logger.log(DEFAULT_LEVEL, "the redis_client is not available")
 
-            if count_value >= limit_value:
-                raise LimitExceededError(f"total record [{count_value}] has exceeded [{limit_value}]")
+            check_limit(count_value, limit_value)
 
             response = func(*args, **kwargs)
 
@@ -96,7 +515,79 @@ def track_creations_on_service(model_type: str,
                 logger.log(DEFAULT_LEVEL, "the redis_client is not available")
 
             return response
+        wrapper.limit_cache = limit_cache
+        wrapper.leases = leases
+        return wrapper
+
+    def _async_decorator(func):
+        # redis_client phải là client bất đồng bộ (vd. redis.asyncio.Redis)
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            redis_entrypoint, entrypoint_limit, entrypoint_count = entrypoints_of(args, kwargs)
+
+            if redis_client and leases is not None:
+                granted, count_value, limit_value = await leases.acquire_async(redis_client,
+                        entrypoint_limit, entrypoint_count,
+                        default_limit_value, default_count_value)
+                if not granted:
+                    raise LimitExceededError(f"total record [{count_value}] has exceeded [{limit_value}]")
+                try:
+                    return await func(*args, **kwargs)
+                except BaseException:
+                    # kể cả KeyboardInterrupt/CancelledError: slot không được giữ mãi
+                    if not leases.release(entrypoint_count):
+                        await redis_client.decr(entrypoint_count)
+                    raise
+
+            if redis_client and atomic:
+                granted, count_value, limit_value = await reserve_slots_async(redis_client,
+                        entrypoint_limit, entrypoint_count,
+                        default_limit_value, default_count_value)
+                logger.log(DEFAULT_LEVEL, f"reserved a slot in [{redis_entrypoint}]: {count_value}/{limit_value}")
+                if not granted:
+                    raise LimitExceededError(f"total record [{count_value}] has exceeded [{limit_value}]")
+                try:
+                    return await func(*args, **kwargs)
+                except BaseException:
+                    # kể cả CancelledError (client ngắt kết nối): slot không được giữ mãi
+                    logger.log(DEFAULT_LEVEL, "release the reserved slot with redis_client.decr")
+                    await redis_client.decr(entrypoint_count)
+                    raise
+
+            limit_value = default_limit_value
+            count_value = default_count_value
+            if redis_client and pipelined:
+                limit_value, count_value = await read_limit_and_count_async(redis_client,
+                        entrypoint_limit, entrypoint_count,
+                        default_limit_value, default_count_value,
+                        limit_cache=limit_cache)
+                logger.log(DEFAULT_LEVEL, f"read the limit/count values from [{redis_entrypoint}] are: {limit_value}/{count_value}")
+            elif redis_client:
+                # Đọc limit và count đồng thời
+                limit_value, count_value = await asyncio.gather(
+                        get_or_set_default_async(redis_client, entrypoint_limit, default_limit_value),
+                        get_or_set_default_async(redis_client, entrypoint_count, default_count_value))
+                limit_value, count_value = _to_int(limit_value), _to_int(count_value)
+                logger.log(DEFAULT_LEVEL, f"read the limit/count values from [{redis_entrypoint}] are: {limit_value}/{count_value}")
+            else:
+                logger.log(DEFAULT_LEVEL, "the redis_client is not available")
+
+            check_limit(count_value, limit_value)
+
+            response = await func(*args, **kwargs)
+
+            # increase the count entry in redis
+            if redis_client:
+                logger.log(DEFAULT_LEVEL, "call the redis_client.incr")
+                await redis_client.incr(entrypoint_count)
+            else:
+                logger.log(DEFAULT_LEVEL, "the redis_client is not available")
+
+            return response
+        wrapper.limit_cache = limit_cache
+        wrapper.leases = leases
         return wrapper
+
     return decorator
 
 
@@ -1,24 +1,390 @@
+import ast
+import hashlib
 import importlib
 import inspect
+import json
+import os
 import pkgutil
+import subprocess
+import sys
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+# Cache trong tiến trình: (package, metaclass, tuỳ chọn) → (chữ ký file, class paths)
+_discovery_cache: Dict[Tuple, Tuple[Dict[str, int], List[str]]] = dict()
+
+# Thời gian tối đa (giây) chờ pre-scan ở tiến trình con: một import bị treo
+# không được chặn lúc khởi động
+PRESCAN_TIMEOUT = 60.0
+
+_CACHE_FORMAT_VERSION = 3  # 3: import tương đối ra ngoài package được coi là bên ngoài
+
+
+def find_classes_with_metaclass(package, meta,
+        recursive: bool = False,
+        static_scan: bool = False,
+        cached: bool = False,
+        cache_dir: Optional[str] = None,
+        raise_import_errors: bool = False,
+        workers: int = 0,
+        subprocess_prescan: bool = False,
+        prescan_timeout: float = PRESCAN_TIMEOUT):
+    """
+    Find the classes defined in the modules of `package` whose type is `meta`.
+
+    - recursive: also walk the subpackages.
+    - static_scan: parse the module sources with `ast` first and import only
+      the modules that may define such classes (they mention the metaclass
+      name, subclass a candidate class of the package, or subclass a class
+      imported from outside the package).
+    - cached / cache_dir: remember the result per package, keyed on the
+      modification times of the module files; with `cache_dir` the index is
+      also persisted so that a warm start skips the scan entirely.
+    - raise_import_errors: raise instead of warning when a module cannot be
+      imported.
+    - workers: import the modules with a thread pool of this size.
+    - subprocess_prescan: import the package in a child interpreter that
+      reports the matching class paths, then import only those modules here;
+      after `prescan_timeout` seconds the child is killed and the modules are
+      imported in this process.
+    """
+    modules = iter_package_modules(package, recursive=recursive)
+
+    cache_key = None
+    signature = None
+    if cached or cache_dir:
+        cache_key = (package.__name__, _qualified_name(meta), recursive, static_scan)
+        signature = _files_signature(modules)
+        class_paths = _load_cached_index(cache_key, signature, cache_dir)
+        if class_paths is not None:
+            found_classes = _resolve_class_paths(class_paths, meta)
+            if found_classes is not None:
+                return found_classes
+
+    module_names = [name for name, _ in modules]
+    if static_scan:
+        module_names = scan_candidate_modules(modules, meta.__name__, package.__name__)
+
+    found_classes = None
+    if subprocess_prescan:
+        class_paths = prescan_in_subprocess(package.__name__, meta,
+                recursive=recursive, static_scan=static_scan, workers=workers,
+                timeout=prescan_timeout)
+        if class_paths is not None:
+            found_classes = _resolve_class_paths(class_paths, meta)
+    if found_classes is None:
+        found_classes = _import_classes(module_names, meta, raise_import_errors, workers=workers)
+
+    if cache_key is not None:
+        _store_cached_index(cache_key, signature, cache_dir,
+                [_class_path(cls) for cls in found_classes])
+
+    return found_classes
+
+
+def iter_package_modules(package, recursive: bool = False) -> List[Tuple[str, Optional[str]]]:
+    """List (module name, source file) of a package without importing anything."""
+    modules = []
+
+    def walk(paths, prefix):
+        for finder, name, ispkg in pkgutil.iter_modules(paths, prefix):
+            base = os.path.join(getattr(finder, "path", ""), name.rsplit(".", 1)[-1])
+            if ispkg:
+                source = os.path.join(base, "__init__.py")
+                modules.append((name, source if os.path.exists(source) else None))
+                if recursive:
+                    walk([base], name + ".")
+            else:
+                source = base + ".py"
+                modules.append((name, source if os.path.exists(source) else None))
+
+    walk(package.__path__, package.__name__ + ".")
+    return modules
+
+
+def scan_candidate_modules(modules, meta_name: str, package_name: Optional[str] = None) -> List[str]:
+    """
+    Static pre-scan: keep the modules that mention `meta_name` (also through
+    `import ... as`), define a class deriving from a candidate class found in
+    the scanned modules, or subclass a name imported from outside the package
+    (its metaclass cannot be known without importing it). Modules without a
+    readable source are always kept.
+    """
+    if package_name is None and modules:
+        package_name = modules[0][0].split(".", 1)[0]
+
+    candidates = set()
+    class_bases: Dict[str, List[Tuple[str, List[str]]]] = dict()
+    candidate_class_names = set()
+
+    for module_name, source_file in modules:
+        if source_file is None:
+            candidates.add(module_name)
+            continue
+        try:
+            with open(source_file, "rb") as f:
+                tree = ast.parse(f.read(), filename=source_file)
+        except (OSError, SyntaxError, ValueError):
+            candidates.add(module_name)
+            continue
+
+        nodes = list(ast.walk(tree))
+        # Tên được import: tên cục bộ → (tên gốc, import từ ngoài package?)
+        imported = _imported_names(nodes, package_name, _package_of(module_name, source_file))
+
+        classes = []
+        for node in nodes:
+            if isinstance(node, ast.ClassDef):
+                bases = []
+                for base in node.bases:
+                    name, external = _resolve_base(base, imported)
+                    if external:
+                        candidates.add(module_name)  # class cha ngoài package: phải import để biết
+                    bases.append(name)
+                metaclasses = [_resolve_base(k.value, imported)[0] for k in node.keywords if k.arg == "metaclass"]
+                if meta_name in metaclasses:
+                    candidates.add(module_name)
+                    candidate_class_names.add(node.name)
+                classes.append((node.name, bases))
+            elif isinstance(node, (ast.Name, ast.Attribute, ast.alias)) and module_name not in candidates:
+                if _terminal_name(node) == meta_name:
+                    candidates.add(module_name)
+        class_bases[module_name] = classes
+
+    # Kế thừa metaclass qua class cha: lan truyền tới khi không còn thay đổi
+    changed = True
+    while changed:
+        changed = False
+        for module_name, classes in class_bases.items():
+            for class_name, bases in classes:
+                if class_name not in candidate_class_names and candidate_class_names.intersection(bases):
+                    candidate_class_names.add(class_name)
+                    candidates.add(module_name)
+                    changed = True
+
+    return [name for name, _ in modules if name in candidates]
+
+
+def _is_inside(module_name: Optional[str], package_name: Optional[str]) -> bool:
+    if not module_name or not package_name:
+        return False
+    return module_name == package_name or module_name.startswith(package_name + ".")
+
+
+def _package_of(module_name: str, source_file: Optional[str]) -> str:
+    # Package chứa module (với __init__.py là chính package đó)
+    if source_file is not None and os.path.basename(source_file) == "__init__.py":
+        return module_name
+    return module_name.rpartition(".")[0]
+
+
+def _absolute_module(node: ast.ImportFrom, current_package: str) -> Optional[str]:
+    if node.level == 0:
+        return node.module
+    parts = current_package.split(".") if current_package else []
+    if node.level - 1 > len(parts):
+        return None
+    base = ".".join(parts[:len(parts) - (node.level - 1)])
+    return f"{base}.{node.module}" if node.module else base
 
-def find_classes_with_metaclass(package, meta):
-    found_classes = []
 
-    # Loop through all modules in the package
-    for _, module_name, _ in pkgutil.iter_modules(package.__path__, package.__name__ + "."):
+def _imported_names(nodes, package_name: Optional[str], current_package: str = "") -> Dict[str, Tuple[str, bool]]:
+    imported = dict()
+    for node in nodes:
+        if isinstance(node, ast.ImportFrom):
+            # Import tương đối có thể trỏ ra ngoài package đang quét (vd. package cha)
+            external = not _is_inside(_absolute_module(node, current_package), package_name)
+            for alias in node.names:
+                imported[alias.asname or alias.name] = (alias.name, external)
+        elif isinstance(node, ast.Import):
+            for alias in node.names:
+                local = alias.asname or alias.name.split(".", 1)[0]
+                imported[local] = (alias.name, not _is_inside(alias.name, package_name))
+    return imported
+
+
+def _resolve_base(node, imported: Dict[str, Tuple[str, bool]]) -> Tuple[Optional[str], bool]:
+    """(original class name, imported from outside the package) of a base class expression."""
+    if isinstance(node, (ast.Subscript, ast.Call)):
+        return _resolve_base(node.value if isinstance(node, ast.Subscript) else node.func, imported)
+    root = node
+    while isinstance(root, ast.Attribute):
+        root = root.value
+    if not isinstance(root, ast.Name) or root.id not in imported:
+        return _terminal_name(node), False
+    original, external = imported[root.id]
+    if root is node:
+        return original.rsplit(".", 1)[-1], external
+    return _terminal_name(node), external
+
+
+def _terminal_name(node) -> Optional[str]:
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    if isinstance(node, ast.alias):
+        return node.name.rsplit(".", 1)[-1]  # tên gốc, kể cả khi import ... as
+    if isinstance(node, ast.Subscript):
+        return _terminal_name(node.value)
+    if isinstance(node, ast.Call):
+        return _terminal_name(node.func)
+    return None
+
+
+def _import_classes(module_names, meta, raise_import_errors: bool = False, workers: int = 0):
+    def load(module_name):
         try:
-            module = importlib.import_module(module_name)
+            return _classes_of_module(importlib.import_module(module_name), meta)
         except Exception as e:
+            if raise_import_errors:
+                raise
+            warnings.warn(f"Cannot import module '{module_name}': {e}", RuntimeWarning)
+            return []
+
+    if workers and workers > 1 and len(module_names) > 1:
+        # import lock của Python là theo từng module nên các module khác nhau
+        # có thể được nạp song song; map() giữ nguyên thứ tự kết quả
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="clsutil-import") as pool:
+            results = list(pool.map(load, module_names))
+    else:
+        results = [load(module_name) for module_name in module_names]
+
+    return [cls for classes in results for cls in classes]
+
+
+def _classes_of_module(module, meta):
+    found_classes = []
+    # Inspect all classes defined in the module
+    for name, obj in inspect.getmembers(module, inspect.isclass):
+        # Make sure the class is defined in the current module
+        if obj.__module__ != module.__name__:
             continue
+        # Check if it uses the target metaclass
+        if type(obj) is meta:
+            found_classes.append(obj)
+    return found_classes
+
+
+# --- Subprocess pre-scan ---
+def prescan_in_subprocess(package_name: str, meta,
+        recursive: bool = False,
+        static_scan: bool = False,
+        workers: int = 0,
+        timeout: Optional[float] = PRESCAN_TIMEOUT) -> Optional[List[str]]:
+    """
+    Run the discovery in a child interpreter (same sys.path) and return the
+    class paths ("module:QualName") it found, or None if the child failed or
+    did not finish within `timeout` seconds (the caller then imports the
+    modules itself).
+    """
+    request = json.dumps(dict(package=package_name, meta=_qualified_name(meta),
+            recursive=recursive, static_scan=static_scan, workers=workers))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+    try:
+        completed = subprocess.run(
+                [sys.executable, "-c", "from apibean.core.utils.clsutil import _prescan_main; _prescan_main()"],
+                input=request, capture_output=True, text=True, env=env, timeout=timeout)
+    except (OSError, subprocess.SubprocessError) as e:
+        warnings.warn(f"Subprocess pre-scan failed: {e}", RuntimeWarning)
+        return None
+    if completed.returncode != 0:
+        warnings.warn(f"Subprocess pre-scan failed: {completed.stderr.strip()}", RuntimeWarning)
+        return None
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def _prescan_main():
+    request = json.loads(sys.stdin.read())
+    module_name, qualname = request["meta"].split(":", 1)
+    meta = importlib.import_module(module_name)
+    for part in qualname.split("."):
+        meta = getattr(meta, part)
+    classes = find_classes_with_metaclass(importlib.import_module(request["package"]), meta,
+            recursive=request["recursive"],
+            static_scan=request["static_scan"],
+            workers=request["workers"])
+    print(json.dumps([_class_path(cls) for cls in classes]))
+
 
-        # Inspect all classes defined in the module
-        for name, obj in inspect.getmembers(module, inspect.isclass):
-            # Make sure the class is defined in the current module
-            if obj.__module__ != module.__name__:
-                continue
-            # Check if it uses the target metaclass
-            if type(obj) is meta:
-                found_classes.append(obj)
+# --- Discovery index cache ---
+def _qualified_name(obj) -> str:
+    return f"{obj.__module__}:{obj.__qualname__}"
 
+
+def _class_path(cls) -> str:
+    return _qualified_name(cls)
+
+
+def _files_signature(modules) -> Dict[str, int]:
+    signature = dict()
+    for _, source_file in modules:
+        if source_file is not None:
+            try:
+                signature[source_file] = os.stat(source_file).st_mtime_ns
+            except OSError:
+                signature[source_file] = -1
+    return signature
+
+
+def _index_file(cache_dir: str, cache_key) -> str:
+    digest = hashlib.sha1(json.dumps(list(cache_key)).encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f"{cache_key[0]}-{digest}.json")
+
+
+def _load_cached_index(cache_key, signature, cache_dir: Optional[str]) -> Optional[List[str]]:
+    entry = _discovery_cache.get(cache_key)
+    if entry is not None and entry[0] == signature:
+        return entry[1]
+
+    if not cache_dir:
+        return None
+    try:
+        with open(_index_file(cache_dir, cache_key), "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index.get("version") != _CACHE_FORMAT_VERSION or index.get("files") != signature:
+        return None
+
+    class_paths = index.get("classes", [])
+    _discovery_cache[cache_key] = (signature, class_paths)
+    return class_paths
+
+
+def _store_cached_index(cache_key, signature, cache_dir: Optional[str], class_paths: List[str]):
+    _discovery_cache[cache_key] = (signature, class_paths)
+    if not cache_dir:
+        return
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        index_file = _index_file(cache_dir, cache_key)
+        tmp_file = f"{index_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(dict(version=_CACHE_FORMAT_VERSION, key=list(cache_key),
+                    files=signature, classes=class_paths), f)
+        os.replace(tmp_file, index_file)
+    except OSError as e:
+        warnings.warn(f"Cannot persist the discovery index: {e}", RuntimeWarning)
+
+
+def _resolve_class_paths(class_paths: List[str], meta):
+    """Import only the cached modules; None if the index is stale."""
+    found_classes = []
+    for class_path in class_paths:
+        module_name, qualname = class_path.split(":", 1)
+        try:
+            obj = importlib.import_module(module_name)
+            for part in qualname.split("."):
+                obj = getattr(obj, part)
+        except Exception:
+            return None
+        if type(obj) is not meta:
+            return None
+        found_classes.append(obj)
     return found_classes
+
+
+def invalidate_discovery_cache():
+    _discovery_cache.clear()
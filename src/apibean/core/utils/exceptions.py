@@ -1,8 +1,28 @@
+import json
+import threading
 from typing import Optional
 
 exceptions_by_name = dict()
 exceptions_by_code = dict()
 
+# Thông tin của mỗi exception được tạo một lần lúc khai báo class (chỉ trả ra bản sao)
+exceptions_info_by_class = dict()
+
+_store_lock = threading.Lock()
+_store_version = 0
+_catalog_cache = dict()
+
+
+def _bump_store_version():
+    global _store_version
+    with _store_lock:
+        _store_version += 1
+        _catalog_cache.clear()
+
+
+def exceptions_store_version() -> int:
+    return _store_version
+
 
 class ExceptionMeta(type):
     def __new__(cls, name, bases, dct,
@@ -29,15 +49,13 @@ class ExceptionMeta(type):
             if error_description is not None:
                 new_class.error_description = error_description
 
-        return new_class
+            exceptions_info_by_class[new_class] = _build_exception_info(new_class)
+            _bump_store_version()
 
+        return new_class
 
-def __extract_exception_info(exc: Exception, docstring_to_list:bool=True):
-    if exc is None:
-        raise Exception("The first argument must be an Exception class")
-    if not issubclass(type(exc), ExceptionMeta):
-        raise Exception(f"This class is not created by '{ExceptionMeta.__name__}'")
 
+def _build_exception_info(exc) -> dict:
     mc = type(exc)
     return dict(
         error_code=getattr(exc, "error_code", None),
@@ -45,10 +63,35 @@ def __extract_exception_info(exc: Exception, docstring_to_list:bool=True):
         name=exc.__name__,
         module=exc.__module__,
         metaclass=dict(name=mc.__name__, module=mc.__module__) if mc else None,
-        doc=exc.__doc__.split("\n") if exc.__doc__ is not None and docstring_to_list else exc.__doc__,
+        doc=exc.__doc__.split("\n") if exc.__doc__ is not None else None,
     )
 
 
+def _copy_info(info: dict, doc) -> dict:
+    # Bản sao cho caller: sửa kết quả không làm hỏng thông tin đã tính sẵn
+    metaclass = info["metaclass"]
+    return dict(info,
+        metaclass=dict(metaclass) if metaclass is not None else None,
+        doc=list(doc) if isinstance(doc, list) else doc)
+
+
+def _stored_info(exc) -> dict:
+    info = exceptions_info_by_class.get(exc)
+    if info is None:
+        info = exceptions_info_by_class[exc] = _build_exception_info(exc)
+    return info
+
+
+def __extract_exception_info(exc: Exception, docstring_to_list:bool=True):
+    if exc is None:
+        raise Exception("The first argument must be an Exception class")
+    if not issubclass(type(exc), ExceptionMeta):
+        raise Exception(f"This class is not created by '{ExceptionMeta.__name__}'")
+
+    info = _stored_info(exc)
+    return _copy_info(info, info["doc"] if docstring_to_list else exc.__doc__)
+
+
 def read_exception_by_name(name: str, docstring_to_list:bool=True) -> dict:
     return __extract_exception_info(exceptions_by_name[name], docstring_to_list)
 
@@ -57,15 +100,37 @@ def read_exception_by_code(code: str, docstring_to_list:bool=True) -> dict:
     return __extract_exception_info(exceptions_by_code[code], docstring_to_list)
 
 
+def _cached_catalog(key, build):
+    version = _store_version
+    cached = _catalog_cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    value = build()
+    _catalog_cache[key] = (version, value)
+    return value
+
+
+def _catalog_infos():
+    return _cached_catalog("list", lambda: tuple(
+            _stored_info(e) for e in exceptions_by_name.values()))
+
+
 def get_exceptions_list(iterator_as_output: bool=False):
-    iterator = map(lambda e: read_exception_by_name(e, True), exceptions_by_name.keys())
+    iterator = map(lambda info: _copy_info(info, info["doc"]), _catalog_infos())
     return iterator if iterator_as_output else list(iterator)
 
 
 def get_exceptions_dict():
-    return {e: read_exception_by_name(e) for e in exceptions_by_name }
+    return {info["name"]: _copy_info(info, info["doc"]) for info in _catalog_infos()}
+
+
+def get_exceptions_json() -> str:
+    """The exceptions list pre-serialized as JSON, rebuilt only after the store changes."""
+    return _cached_catalog("json", lambda: json.dumps(list(_catalog_infos()), ensure_ascii=False))
 
 
 def reset_exceptions_store():
     exceptions_by_name.clear()
     exceptions_by_code.clear()
+    exceptions_info_by_class.clear()
+    _bump_store_version()
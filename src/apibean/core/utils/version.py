@@ -1,64 +1,127 @@
 import os
-from typing import Optional, Callable
+import re
+import threading
+from typing import Dict, Optional, Callable, Tuple
 
 try:
     import tomllib  # Python >= 3.11
 except ImportError:
     import tomli as tomllib  # Python < 3.11
 
-# Global cache
-_version_cache = None
+from importlib import metadata as importlib_metadata
+
+# Cache theo nguồn: (VERSION file, distribution, pyproject.toml) → version
+_version_cache: Dict[Tuple, str] = dict()
+_version_cache_lock = threading.Lock()
+
+# Header của một bảng TOML bất kỳ: [table], [[array.of.tables]]
+_TABLE_HEADER = re.compile(rb"^\s*\[")
+_PROJECT_HEADER = re.compile(rb"^\s*\[\s*project\s*\]\s*(#.*)?$")
+
 
 def get_app_version(pyproject_path: str = None, version_file_path: str = None,
-        debuglog: Optional[Callable] = None) -> str:
+        debuglog: Optional[Callable] = None,
+        distribution_name: Optional[str] = None,
+        refresh: bool = False) -> str:
     """
-    Multi-source version detection (cached):
-    - Priority 1: ENV variable APP_VERSION
+    Multi-source version detection (cached per source):
+    - Priority 1: ENV variable APP_VERSION (never cached)
     - Priority 2: VERSION file
-    - Priority 3: pyproject.toml [project.version]
+    - Priority 3: installed package metadata of `distribution_name`
+    - Priority 4: pyproject.toml [project.version]
+
+    Pass `refresh=True` (or call `invalidate_version_cache()`) to read the
+    sources again.
 
     Raises:
         RuntimeError if no version source is found.
     """
-    global _version_cache
-    if _version_cache is not None:
-        return _version_cache
-
     # Use provided logger or fallback to default
     if not callable(debuglog):
         debuglog = lambda _: None
 
     # Priority 1: ENV
     env_version = os.getenv("APP_VERSION")
-    if env_version:
+    if env_version and env_version.strip():
         env_version = env_version.strip()
-        _version_cache = env_version
-        debuglog(f"[get_app_version] Using version from ENV APP_VERSION: {_version_cache}")
-        return _version_cache
+        debuglog(f"[get_app_version] Using version from ENV APP_VERSION: {env_version}")
+        return env_version
 
-    # Priority 2: VERSION file
     if version_file_path:
         version_file_path = os.path.abspath(version_file_path)
-        if os.path.exists(version_file_path):
-            with open(version_file_path, "r", encoding="utf-8") as vf:
-                file_version = vf.read().strip()
-                if file_version:
-                    _version_cache = file_version
-                    debuglog(f"[get_app_version] Using version from VERSION file: {_version_cache}")
-                    return _version_cache
-
-    # Priority 3: pyproject.toml
     if pyproject_path:
         pyproject_path = os.path.abspath(pyproject_path)
-        if os.path.exists(pyproject_path):
-            with open(pyproject_path, "rb") as f:
-                pyproject = tomllib.load(f)
-            try:
-                _version_cache = pyproject.get("project", {}).get("version")
-                debuglog(f"[get_app_version] Using version from pyproject.toml: {_version_cache}")
-                return _version_cache
-            except KeyError:
-                raise RuntimeError(f"Could not find 'project.version' in {pyproject_path}")
+
+    cache_key = (version_file_path, distribution_name, pyproject_path)
+    if not refresh:
+        cached_version = _version_cache.get(cache_key)
+        if cached_version is not None:
+            return cached_version
+
+    version = _resolve_version(version_file_path, distribution_name, pyproject_path, debuglog)
+    with _version_cache_lock:
+        _version_cache[cache_key] = version
+    return version
+
+
+def invalidate_version_cache():
+    """Forget every cached version, the next call reads its sources again."""
+    with _version_cache_lock:
+        _version_cache.clear()
+
+
+def _resolve_version(version_file_path: Optional[str], distribution_name: Optional[str],
+        pyproject_path: Optional[str], debuglog: Callable) -> str:
+    # Priority 2: VERSION file
+    if version_file_path and os.path.exists(version_file_path):
+        with open(version_file_path, "r", encoding="utf-8") as vf:
+            file_version = vf.read().strip()
+        if file_version:
+            debuglog(f"[get_app_version] Using version from VERSION file: {file_version}")
+            return file_version
+
+    # Priority 3: installed distribution metadata (không cần parse file)
+    if distribution_name:
+        try:
+            dist_version = importlib_metadata.version(distribution_name)
+        except importlib_metadata.PackageNotFoundError:
+            dist_version = None
+        if dist_version:
+            debuglog(f"[get_app_version] Using version from package metadata: {dist_version}")
+            return dist_version
+
+    # Priority 4: pyproject.toml
+    if pyproject_path and os.path.exists(pyproject_path):
+        project = read_pyproject_project_table(pyproject_path)
+        project_version = project.get("version")
+        if not project_version:
+            raise RuntimeError(f"Could not find 'project.version' in {pyproject_path}")
+        debuglog(f"[get_app_version] Using version from pyproject.toml: {project_version}")
+        return project_version
 
     # If all sources fail
-    raise RuntimeError("Could not determine version from ENV APP_VERSION, VERSION file, or pyproject.toml")
+    raise RuntimeError("Could not determine version from ENV APP_VERSION, VERSION file, "
+            "package metadata, or pyproject.toml")
+
+
+def read_pyproject_project_table(pyproject_path: str) -> Dict:
+    """
+    Return the [project] table of a pyproject.toml, parsing only that table.
+    Falls back to parsing the whole file when the table cannot be isolated.
+    """
+    with open(pyproject_path, "rb") as f:
+        content = f.read()
+
+    lines = content.splitlines(keepends=True)
+    start = next((i for i, line in enumerate(lines) if _PROJECT_HEADER.match(line)), None)
+    if start is None:
+        return tomllib.loads(content.decode("utf-8")).get("project", {})
+
+    end = start + 1
+    while end < len(lines) and not _TABLE_HEADER.match(lines[end]):
+        end += 1
+    try:
+        return tomllib.loads(b"".join(lines[start:end]).decode("utf-8")).get("project", {})
+    except tomllib.TOMLDecodeError:
+        # Ví dụ mảng nhiều dòng có dòng bắt đầu bằng "[" → parse toàn bộ file
+        return tomllib.loads(content.decode("utf-8")).get("project", {})
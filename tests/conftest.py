@@ -1,3 +1,5 @@
+import asyncio
+import hashlib
 import os
 
 import pytest
@@ -21,3 +23,127 @@ def client(data_initializer):
 @pytest.fixture
 def container():
     return {}
+
+
+class NoScriptError(Exception):
+    pass
+
+
+class FakeRedis:
+    """
+    Minimal in-memory stand-in for a redis-py client (bytes values), counting
+    the network round trips: one per command, one per pipeline execute().
+    """
+    def __init__(self):
+        self.store = {}
+        self.round_trips = 0
+        self.scripts = set()
+
+    def _encode(self, value):
+        return value if isinstance(value, bytes) else str(value).encode()
+
+    def _call(self, name, *args):
+        self.round_trips += 1
+        return getattr(self, "_" + name)(*args)
+
+    def _get(self, key):
+        return self.store.get(key)
+
+    def _mget(self, *keys):
+        return [self.store.get(key) for key in keys]
+
+    def _setnx(self, key, value):
+        if key in self.store:
+            return False
+        self.store[key] = self._encode(value)
+        return True
+
+    def _expire(self, key, seconds):
+        return key in self.store
+
+    def _incrby(self, key, amount=1):
+        value = int(self.store.get(key, b"0")) + amount
+        self.store[key] = self._encode(value)
+        return value
+
+    def _incr(self, key, amount=1):
+        return self._incrby(key, amount)
+
+    def _decrby(self, key, amount=1):
+        return self._incrby(key, -amount)
+
+    def _decr(self, key, amount=1):
+        return self._incrby(key, -amount)
+
+    def _script_load(self, source):
+        sha = hashlib.sha1(source.encode()).hexdigest()
+        self.scripts.add(sha)
+        return sha
+
+    def _evalsha(self, sha, numkeys, *keys_and_args):
+        from apibean.core.commons.tracking.decorators import reserve_slots_script
+        if sha not in self.scripts:
+            raise NoScriptError("NOSCRIPT No matching script")
+        assert sha == reserve_slots_script.sha
+        (limit_key, count_key), (default_limit, default_count, slots) = \
+                keys_and_args[:numkeys], keys_and_args[numkeys:]
+        self._setnx(limit_key, default_limit)
+        self._setnx(count_key, default_count)
+        limit, count = int(self.store[limit_key]), int(self.store[count_key])
+        granted = max(0, min(limit - count, int(slots)))
+        return [granted, self._incrby(count_key, granted), limit]
+
+    def __getattr__(self, name):
+        if not hasattr(type(self), "_" + name):
+            raise AttributeError(name)
+        return lambda *args: self._call(name, *args)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args):
+            self.commands.append((name, args))
+            return self
+        return queue
+
+    def execute(self):
+        self.client.round_trips += 1
+        results = [getattr(self.client, "_" + name)(*args) for name, args in self.commands]
+        self.commands = []
+        return results
+
+
+class FakeAsyncRedis(FakeRedis):
+    """Same store as FakeRedis, every command is awaitable (redis.asyncio style)."""
+    def __getattr__(self, name):
+        command = super().__getattr__(name)
+        async def call(*args):
+            await asyncio.sleep(0)
+            return command(*args)
+        return call
+
+    def pipeline(self, transaction=True):
+        return FakeAsyncPipeline(self)
+
+
+class FakeAsyncPipeline(FakePipeline):
+    async def execute(self):
+        await asyncio.sleep(0)
+        return super().execute()
+
+
+@pytest.fixture
+def redis_client():
+    return FakeRedis()
+
+
+@pytest.fixture
+def async_redis_client():
+    return FakeAsyncRedis()
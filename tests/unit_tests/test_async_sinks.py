@@ -0,0 +1,132 @@
+import asyncio
+
+import httpx
+import pytest
+from loguru import logger
+
+from apibean.core.commons.logging.async_sinks import AsyncNetworkSink, AsyncOpensearchSink
+
+
+def test_async_network_sink_sends_over_stream():
+    received = []
+
+    async def main():
+        async def on_client(reader, writer):
+            received.append(await reader.read())
+            writer.close()
+
+        server = await asyncio.start_server(on_client, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+
+        sink = AsyncNetworkSink("127.0.0.1", port)
+        handler_id = logger.add(sink, format="{message}", enqueue=False)
+        logger.info("hello")
+        logger.info("world")
+        await logger.complete()
+        logger.remove(handler_id)
+
+        await sink.aclose()
+        await asyncio.sleep(0.05)
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(main())
+    assert received == [b"hello\nworld\n"]
+
+
+def test_async_opensearch_sink_posts_documents():
+    documents = []
+
+    async def handler(request):
+        documents.append(request.read())
+        return httpx.Response(201, json={})
+
+    async def main():
+        sink = AsyncOpensearchSink("http://opensearch:9200/logs/_doc",
+                transport=httpx.MockTransport(handler))
+        handler_id = logger.add(sink, format="{message}", enqueue=False)
+        logger.warning("async record")
+        await logger.complete()
+        logger.remove(handler_id)
+        await sink.aclose()
+
+    asyncio.run(main())
+    assert len(documents) == 1
+    assert b'"message":"async record"' in documents[0].replace(b": ", b":")
+
+
+def _opensearch_sink(documents, **kwargs):
+    async def handler(request):
+        documents.append(request.read())
+        return httpx.Response(201, json={})
+
+    return AsyncOpensearchSink("http://opensearch:9200/logs/_doc",
+            transport=httpx.MockTransport(handler), **kwargs)
+
+
+def test_async_sink_delivers_records_logged_from_threads():
+    documents = []
+
+    async def main():
+        sink = _opensearch_sink(documents)
+        handler_id = logger.add(sink, format="{message}", enqueue=False)
+        await asyncio.to_thread(lambda: logger.info("from threadpool"))
+        logger.info("from loop")
+        await logger.complete()
+        logger.remove(handler_id)
+
+    asyncio.run(main())
+    assert len(documents) == 2
+
+
+def test_async_sink_without_running_loop():
+    documents = []
+    sink = _opensearch_sink(documents)
+    handler_id = logger.add(sink, format="{message}", enqueue=False)
+    logger.info("no loop")
+    logger.remove(handler_id)  # gửi nốt hàng đợi rồi đóng client
+    assert len(documents) == 1
+    assert sink._client is None
+
+
+def test_async_sink_is_bounded_and_closed_on_remove():
+    documents = []
+
+    async def main():
+        sink = _opensearch_sink(documents, capacity=5, concurrency=2)
+        handler_id = logger.add(sink, format="{message}", enqueue=False)
+        for i in range(20):
+            logger.info(f"record {i}")
+        assert len(sink._tasks) <= 2
+        await asyncio.to_thread(logger.remove, handler_id)
+        return sink
+
+    sink = asyncio.run(main())
+    assert sink.dropped == 15
+    assert len(documents) == 5
+    assert sink._client is None
+
+
+def test_async_opensearch_sink_verifies_certificates_by_default(monkeypatch):
+    created = []
+
+    class RecordingClient(httpx.AsyncClient):
+        def __init__(self, **kwargs):
+            created.append(kwargs)
+            super().__init__(**kwargs)
+
+    monkeypatch.setattr(httpx, "AsyncClient", RecordingClient)
+
+    async def main():
+        AsyncOpensearchSink("https://opensearch:9200/logs/_doc")._get_client()
+        AsyncOpensearchSink("https://opensearch:9200/logs/_doc", verify_certs=False)._get_client()
+
+    asyncio.run(main())
+    assert [kwargs["verify"] for kwargs in created] == [True, False]
+
+
+def test_async_sink_requires_send():
+    from apibean.core.commons.logging.async_sinks import _AsyncLoopSink
+
+    with pytest.raises(TypeError):
+        _AsyncLoopSink()
@@ -3,6 +3,7 @@ from apibean.core.utils.clsutil import find_classes_with_metaclass
 from example.metaclasses.my_meta import MyMeta
 import example.metaclasses
 import pydash
+import sys
 
 def test_filter_classes_from_package_with_metaclass():
     classes = find_classes_with_metaclass(example.metaclasses, MyMeta)
@@ -11,3 +12,111 @@ def test_filter_classes_from_package_with_metaclass():
     assert len(cls_map) == 2
     assert cls_map.get("example.metaclasses.module_a.A") is example.metaclasses.module_a.A
     assert cls_map.get("example.metaclasses.module_b.B") is example.metaclasses.module_b.B
+
+
+def _class_names(classes):
+    return sorted(f"{cls.__module__}.{cls.__name__}" for cls in classes)
+
+
+def test_filter_classes_recursively_with_static_scan():
+    sys.modules.pop("example.metaclasses.nested.plain", None)
+
+    classes = find_classes_with_metaclass(example.metaclasses, MyMeta,
+            recursive=True, static_scan=True)
+
+    assert _class_names(classes) == [
+        "example.metaclasses.module_a.A",
+        "example.metaclasses.module_b.B",
+        "example.metaclasses.nested.module_d.D",
+    ]
+    assert "example.metaclasses.nested.plain" not in sys.modules
+
+
+def test_discovery_index_is_persisted_and_invalidated_by_mtime(tmp_path):
+    import os
+    from apibean.core.utils import clsutil
+
+    first = find_classes_with_metaclass(example.metaclasses, MyMeta,
+            recursive=True, static_scan=True, cache_dir=str(tmp_path))
+    assert len(list(tmp_path.iterdir())) == 1
+
+    # Warm start from the persisted index: no scan is needed
+    clsutil.invalidate_discovery_cache()
+    scans = []
+    original_scan = clsutil.scan_candidate_modules
+    clsutil.scan_candidate_modules = lambda *args: scans.append(args) or original_scan(*args)
+    try:
+        warm = find_classes_with_metaclass(example.metaclasses, MyMeta,
+                recursive=True, static_scan=True, cache_dir=str(tmp_path))
+        assert warm == first
+        assert scans == []
+
+        # Touching a module file makes the index stale
+        module_file = example.metaclasses.module_b.__file__
+        stat = os.stat(module_file)
+        os.utime(module_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+        try:
+            rescanned = find_classes_with_metaclass(example.metaclasses, MyMeta,
+                    recursive=True, static_scan=True, cache_dir=str(tmp_path))
+        finally:
+            os.utime(module_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        assert rescanned == first
+        assert len(scans) == 1
+    finally:
+        clsutil.scan_candidate_modules = original_scan
+        clsutil.invalidate_discovery_cache()
+
+
+def test_parallel_and_subprocess_discovery_match_sequential():
+    sequential = find_classes_with_metaclass(example.metaclasses, MyMeta, recursive=True)
+    threaded = find_classes_with_metaclass(example.metaclasses, MyMeta, recursive=True, workers=4)
+    prescanned = find_classes_with_metaclass(example.metaclasses, MyMeta, recursive=True,
+            subprocess_prescan=True)
+
+    assert threaded == sequential
+    assert prescanned == sequential
+    assert len(sequential) == 3
+
+
+def test_static_scan_keeps_external_bases_and_aliased_metaclasses(tmp_path, monkeypatch):
+    import importlib
+
+    (tmp_path / "extframework.py").write_text(
+            "from example.metaclasses.my_meta import MyMeta\n\n"
+            "class FrameworkBase(metaclass=MyMeta):\n    pass\n")
+    package_dir = tmp_path / "plugpkg"
+    package_dir.mkdir()
+    (package_dir / "__init__.py").write_text("")
+    (package_dir / "plugin.py").write_text(
+            "from extframework import FrameworkBase\n\n"
+            "class Plugin(FrameworkBase):\n    pass\n")
+    (package_dir / "aliased.py").write_text(
+            "from example.metaclasses.my_meta import MyMeta as M\n\n"
+            "class Aliased(metaclass=M):\n    pass\n")
+    (package_dir / "plain.py").write_text("class Plain:\n    pass\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    plugpkg = importlib.import_module("plugpkg")
+
+    static = find_classes_with_metaclass(plugpkg, MyMeta, static_scan=True)
+    assert "plugpkg.plain" not in sys.modules
+    full = find_classes_with_metaclass(plugpkg, MyMeta)
+    assert _class_names(static) == _class_names(full) == ["plugpkg.aliased.Aliased", "plugpkg.plugin.Plugin"]
+
+
+def test_static_scan_of_subpackage_keeps_bases_from_parent_package():
+    import example.metaclasses.nested
+
+    dynamic = find_classes_with_metaclass(example.metaclasses.nested, MyMeta)
+    static = find_classes_with_metaclass(example.metaclasses.nested, MyMeta, static_scan=True)
+    assert _class_names(static) == _class_names(dynamic) == ["example.metaclasses.nested.module_d.D"]
+
+
+def test_subprocess_prescan_timeout_falls_back_to_import():
+    import warnings
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        classes = find_classes_with_metaclass(example.metaclasses, MyMeta,
+                subprocess_prescan=True, prescan_timeout=0.001)
+    assert _class_names(classes) == ["example.metaclasses.module_a.A", "example.metaclasses.module_b.B"]
+    assert any("timed out" in str(w.message) for w in caught)
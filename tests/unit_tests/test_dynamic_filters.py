@@ -0,0 +1,100 @@
+import contextvars
+
+from loguru import logger
+
+from apibean.core.commons.logging import context as ctx
+from apibean.core.commons.logging.dynamic_level import (set_request_log_level,
+        install_logging_support_patcher)
+from apibean.core.commons.logging.dynamic_sinks import (dyna_log_sinks_filter_of,
+        resolve_sinks_header, set_default_log_sinks)
+
+
+def _capture(level, message):
+    records = []
+    handler_id = logger.add(lambda m: records.append(m.record), format="{message}")
+    logger.log(level, message)
+    logger.remove(handler_id)
+    return records[0]
+
+
+def test_set_request_log_level_resolves_numeric_threshold():
+    contextvars.copy_context().run(_check_set_request_log_level)
+
+
+def _check_set_request_log_level():
+    set_request_log_level("warning")
+    assert ctx.request_log_level.get() == "WARNING"
+    assert ctx.request_log_level_no.get() == 30
+
+    set_request_log_level("not-a-level")
+    assert ctx.request_log_level.get() == ctx.default_log_level
+    assert ctx.request_log_level_no.get() == ctx.default_log_level_no
+
+
+def test_sinks_filter_checks_sink_name_and_level():
+    contextvars.copy_context().run(_check_sinks_filter)
+
+
+def _check_sinks_filter():
+    ctx.request_set_sinks.set({"stdout"})
+    set_request_log_level("INFO")
+
+    stdout_filter = dyna_log_sinks_filter_of("stdout")
+    file_filter = dyna_log_sinks_filter_of("file")
+
+    assert stdout_filter(_capture("INFO", "kept")) is True
+    assert stdout_filter(_capture("DEBUG", "dropped")) is False
+    assert file_filter(_capture("ERROR", "not selected")) is False
+
+
+def test_resolve_sinks_header_is_memoized_until_defaults_change():
+    sinks = resolve_sinks_header("file, null, unknown")
+    assert sinks == frozenset({"file", "null"})
+    assert resolve_sinks_header("file, null, unknown") is sinks
+
+    previous = ctx.default_str_sinks
+    try:
+        set_default_log_sinks("file")
+        assert resolve_sinks_header("unknown") == frozenset({"file"})
+        set_default_log_sinks("stdout")
+        assert resolve_sinks_header("unknown") == frozenset({"stdout"})
+    finally:
+        set_default_log_sinks(previous)
+
+
+def test_sinks_filter_adds_correlation_id_without_patcher():
+    contextvars.copy_context().run(_check_filter_without_patcher)
+
+
+def _check_filter_without_patcher():
+    ctx.request_set_sinks.set({"plain"})
+    set_request_log_level("INFO")
+
+    messages = []
+    handler_id = logger.add(messages.append, format="[{correlation_id}] {message}",
+            filter=dyna_log_sinks_filter_of("plain"))
+    try:
+        logger.info("no patcher")
+    finally:
+        logger.remove(handler_id)
+    assert [str(m) for m in messages] == ["[None] no patcher\n"]
+
+
+def test_support_patcher_chains_after_app_patcher():
+    def app_patcher(record):
+        record["extra"]["app"] = "patched"
+
+    logger.configure(patcher=app_patcher)
+    try:
+        install_logging_support_patcher()
+        install_logging_support_patcher()  # không nối thêm lần nữa
+
+        records = []
+        handler_id = logger.add(lambda m: records.append(m.record), format="{message}")
+        logger.info("chained")
+        logger.remove(handler_id)
+    finally:
+        logger.configure(patcher=None)
+
+    assert records[0]["extra"]["app"] == "patched"
+    assert "correlation_id" in records[0]
@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from apibean.core.utils import exceptions as store
+from apibean.core.utils.exceptions import (ExceptionMeta,
+        get_exceptions_list, get_exceptions_dict, get_exceptions_json,
+        read_exception_by_code, read_exception_by_name,
+        reset_exceptions_store, exceptions_store_version)
+
+
+@pytest.fixture(autouse=True)
+def empty_store():
+    reset_exceptions_store()
+    yield
+    reset_exceptions_store()
+
+
+def test_exception_info_is_precomputed_and_copied():
+    class NotFoundError(Exception, metaclass=ExceptionMeta, error_code="E404",
+            error_description="Resource not found"):
+        """Raised when a resource is missing.
+        Second line."""
+
+    info = read_exception_by_code("E404")
+    assert info == read_exception_by_name("NotFoundError")
+    assert info["name"] == "NotFoundError"
+    assert info["error_description"] == "Resource not found"
+    assert info["metaclass"]["name"] == "ExceptionMeta"
+    assert info["doc"][0] == "Raised when a resource is missing."
+    assert read_exception_by_name("NotFoundError", docstring_to_list=False)["doc"] == NotFoundError.__doc__
+
+    # Kết quả là dict thường: sửa được, không ảnh hưởng tới store
+    info["name"] = "Other"
+    info["metaclass"]["name"] = "Other"
+    info["doc"].append("extra")
+    again = read_exception_by_name("NotFoundError")
+    assert again["name"] == "NotFoundError"
+    assert again["metaclass"]["name"] == "ExceptionMeta"
+    assert len(again["doc"]) == 2
+
+
+def test_catalog_results_are_json_serializable():
+    class FirstError(Exception, metaclass=ExceptionMeta, error_code="E1"):
+        """First."""
+
+    assert json.loads(json.dumps(get_exceptions_list())) == json.loads(get_exceptions_json())
+    assert json.loads(json.dumps(get_exceptions_dict()))["FirstError"]["doc"] == ["First."]
+
+    listed = get_exceptions_list()
+    listed[0]["error_code"] = "changed"
+    assert get_exceptions_list()[0]["error_code"] == "E1"
+
+
+def test_catalog_views_are_cached_until_the_store_changes():
+    class FirstError(Exception, metaclass=ExceptionMeta, error_code="E1"):
+        pass
+
+    version = exceptions_store_version()
+    payload = get_exceptions_json()
+    assert get_exceptions_json() is payload
+    assert get_exceptions_dict() == get_exceptions_dict()
+    assert [e["name"] for e in json.loads(payload)] == ["FirstError"]
+
+    class SecondError(FirstError, error_code="E2"):
+        pass
+
+    assert exceptions_store_version() > version
+    assert [e["name"] for e in get_exceptions_list()] == ["FirstError", "SecondError"]
+    assert [e["error_code"] for e in json.loads(get_exceptions_json())] == ["E1", "E2"]
+
+    reset_exceptions_store()
+    assert get_exceptions_json() == "[]"
+    assert store.exceptions_info_by_class == {}
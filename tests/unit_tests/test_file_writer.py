@@ -0,0 +1,83 @@
+import gzip
+import os
+import tempfile
+
+from loguru import logger
+
+from apibean.core.commons.logging.file_writer import FileWriter, MultiprocessFileSink, parse_size
+
+
+def test_file_writer_rotates_and_compresses(tmp_path):
+    path = tmp_path / "app.log"
+    writer = FileWriter(str(path), rotation=100, retention=2, compression="gz", write_buffer=40)
+    for i in range(20):
+        writer.append(f"record {i:02d} ..........\n".encode())
+    writer.close()
+
+    rotated = sorted(f for f in os.listdir(tmp_path) if f != "app.log")
+    assert len(rotated) == 2
+    assert all(f.startswith("app.") and f.endswith(".log.gz") for f in rotated)
+    with gzip.open(tmp_path / rotated[-1]) as f:
+        assert f.read().startswith(b"record ")
+    assert path.read_bytes().endswith(b"record 19 ..........\n")
+    assert parse_size("1.5 KB") == 1536
+
+
+def test_workers_share_one_writer_process(tmp_path):
+    path = str(tmp_path / "shared.log")
+    socket_path = os.path.join(tempfile.mkdtemp(prefix="log"), "writer.sock")
+    options = dict(socket_path=socket_path, flush_interval=0.05, idle_timeout=0.2)
+
+    # Hai sink trỏ cùng một file mô phỏng hai worker
+    workers = [MultiprocessFileSink(path, **options), MultiprocessFileSink(path, **options)]
+    handler_ids = [logger.add(sink, format="{extra[worker]} {message}") for sink in workers]
+    for i in range(50):
+        for worker in range(2):
+            logger.bind(worker=worker).info(f"record {i}")
+    for handler_id in handler_ids:
+        logger.remove(handler_id)
+
+    processes = [sink.writer_process for sink in workers if sink.writer_process is not None]
+    assert len(processes) == 1
+    assert processes[0].wait(timeout=10) == 0
+
+    with open(path) as f:
+        lines = f.read().splitlines()
+    # mỗi record được ghi một lần (mỗi handler nhận record của cả hai worker)
+    assert len(lines) == 200
+    assert lines.count("0 record 7") == 2
+
+
+def test_multiprocess_sink_rejects_unsupported_options(tmp_path):
+    import pytest
+
+    path = str(tmp_path / "app.log")
+    for options in [dict(compression="bz2"), dict(compression="tar.xz"),
+            dict(rotation="00:00"), dict(retention="1 week")]:
+        with pytest.raises(ValueError):
+            MultiprocessFileSink(path, **options)
+
+
+def test_writer_server_idle_exit_waits_for_receivers(tmp_path):
+    import socket
+    import threading
+
+    from apibean.core.commons.logging.dynamic_sinks import _LENGTH_PREFIX
+    from apibean.core.commons.logging.file_writer import FileWriterServer
+
+    path = tmp_path / "server.log"
+    socket_path = os.path.join(tempfile.mkdtemp(prefix="log"), "writer.sock")
+    writer = FileWriter(str(path))
+    server = FileWriterServer(writer, socket_path, flush_interval=0.02, idle_timeout=0.05)
+    serving = threading.Thread(target=server.serve)
+    serving.start()
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(socket_path)
+    client.sendall(_LENGTH_PREFIX.pack(6) + b"hello\n")
+    client.close()
+    serving.join(timeout=5)
+
+    assert not serving.is_alive()
+    assert path.read_bytes() == b"hello\n"
+    assert not os.path.exists(socket_path)
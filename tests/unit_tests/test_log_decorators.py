@@ -0,0 +1,164 @@
+import pytest
+from loguru import logger
+
+from apibean.core.commons.logging import (log_function, log_method,
+        log_function_with, get_caller_info)
+
+
+@log_function
+def add(a, b):
+    return a + b
+
+
+@log_function
+def fail():
+    raise ValueError("boom")
+
+
+class Calculator:
+    @log_method
+    def mul(self, a, b):
+        return a * b
+
+
+def _collect(level):
+    records = []
+    handler_id = logger.add(lambda m: records.append(m.record), level=level, format="{message}")
+    return records, handler_id
+
+
+def test_decorators_emit_begin_and_end_records_when_enabled():
+    records, handler_id = _collect("DEBUG")
+    try:
+        assert add(1, 2) == 3
+        assert Calculator().mul(2, 3) == 6
+    finally:
+        logger.remove(handler_id)
+
+    assert [r["message"] for r in records] == [
+        "add function started",
+        "add ... done",
+        "Calculator.mul method started",
+        "Calculator.mul ... done",
+    ]
+
+
+def test_decorators_skip_disabled_level_but_keep_exceptions():
+    records, handler_id = _collect("INFO")
+    try:
+        assert add(1, 2) == 3
+        with pytest.raises(ValueError):
+            fail()
+    finally:
+        logger.remove(handler_id)
+
+    assert [(r["level"].name, r["message"]) for r in records] == [
+        ("ERROR", "fail failed with exception"),
+    ]
+
+
+def test_log_function_with_captures_caller_info_at_decoration_time():
+    decorated_at = get_caller_info()["line"] + 1
+    @log_function_with(auto_caller_info=True)
+    def sub(a, b):
+        return a - b
+
+    records, handler_id = _collect("DEBUG")
+    try:
+        assert sub(3, 1) == 2
+        assert sub(5, 1) == 4
+    finally:
+        logger.remove(handler_id)
+
+    assert len(records) == 4
+    assert {r["extra"]["caller_info"]["line"] for r in records} == {decorated_at}
+    assert {r["extra"]["caller_info"]["name"] for r in records} == {__name__}
+
+
+def test_decorators_wrap_coroutines_and_generators():
+    import asyncio
+
+    @log_function
+    async def fetch(value):
+        await asyncio.sleep(0)
+        return value
+
+    @log_function
+    async def broken():
+        await asyncio.sleep(0)
+        raise RuntimeError("async boom")
+
+    @log_function
+    def count(n):
+        yield from range(n)
+
+    @log_function
+    async def acount(n):
+        for i in range(n):
+            await asyncio.sleep(0)
+            yield i
+
+    async def consume():
+        assert await fetch(7) == 7
+        with pytest.raises(RuntimeError):
+            await broken()
+        return [i async for i in acount(2)]
+
+    records, handler_id = _collect("DEBUG")
+    try:
+        assert list(count(3)) == [0, 1, 2]
+        assert asyncio.run(consume()) == [0, 1]
+    finally:
+        logger.remove(handler_id)
+
+    messages = [r["message"].split("<locals>.")[-1] for r in records]
+    assert messages == [
+        "count function started", "count ... done",
+        "fetch function started", "fetch ... done",
+        "broken function started", "broken failed with exception",
+        "acount function started", "acount ... done",
+    ]
+
+
+def test_timing_mode_records_elapsed_time_and_histogram():
+    import asyncio
+    import httpx
+    from fastapi import FastAPI
+    from apibean.core.commons.logging import logging_router
+
+    @log_function_with(timing=True)
+    def timed(x):
+        return x * 2
+
+    records, handler_id = _collect("DEBUG")
+    try:
+        for i in range(10):
+            timed(i)
+    finally:
+        logger.remove(handler_id)
+
+    end_records = [r for r in records if r["message"].endswith("... done")]
+    assert len(end_records) == 10
+    assert all(r["extra"]["elapsed_ns"] > 0 for r in end_records)
+
+    app = FastAPI()
+    app.include_router(logging_router)
+
+    async def get_histograms():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return (await client.get("/loggers/metrics/latency")).json()["histograms"]
+
+    histograms = asyncio.run(get_histograms())
+    snapshot = histograms[timed.__qualname__]
+    assert snapshot["count"] == 10
+    assert 0 < snapshot["p50_ms"] <= snapshot["p99_ms"] <= snapshot["max_ms"]
+
+
+def test_level_check_does_not_depend_on_loguru_internals(monkeypatch):
+    from types import SimpleNamespace
+    from apibean.core.commons.logging.decorators import is_log_level_enabled
+
+    # Không có min_level (loguru khác phiên bản): chỉ còn so với level của request
+    monkeypatch.setattr(logger, "_core", SimpleNamespace())
+    assert is_log_level_enabled(50)
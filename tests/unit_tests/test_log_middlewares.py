@@ -0,0 +1,45 @@
+import asyncio
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from apibean.core.commons.logging import context as ctx
+from apibean.core.commons.logging import (DynaLogSinksMiddleware,
+        DynaLogSinksASGIMiddleware)
+
+
+async def _echo_log_context(request):
+    return JSONResponse({
+        "level": ctx.request_log_level.get(),
+        "level_no": ctx.request_log_level_no.get(),
+        "sinks": sorted(ctx.request_set_sinks.get()),
+    })
+
+
+def _request(middleware_class, headers):
+    app = Starlette(routes=[Route("/", _echo_log_context)],
+            middleware=[Middleware(middleware_class, default_level="INFO", default_sinks="stdout")])
+
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return (await client.get("/", headers=headers)).json()
+
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("middleware_class", [DynaLogSinksMiddleware, DynaLogSinksASGIMiddleware])
+def test_sinks_middlewares_share_header_semantics(middleware_class):
+    assert _request(middleware_class, {}) == {"level": "INFO", "level_no": 20, "sinks": ["stdout"]}
+
+    assert _request(middleware_class, {"X-Log-Level": "error", "X-Log-Sinks": "file, null"}) == {
+        "level": "ERROR", "level_no": 40, "sinks": ["file", "null"]}
+
+    assert _request(middleware_class, {"X-Log-Targets": "unknown"})["sinks"] == ["stdout"]
+
+    assert _request(middleware_class, {"X-Log-Level": "bogus", "X-Log-Targets": "file"}) == {
+        "level": "INFO", "level_no": 20, "sinks": ["file"]}
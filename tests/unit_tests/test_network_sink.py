@@ -0,0 +1,76 @@
+import socket
+import struct
+import threading
+import time
+
+from apibean.core.commons.logging.dynamic_sinks import NetworkSink
+
+
+class _TcpServer:
+    def __init__(self, port=0):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(("127.0.0.1", port))
+        self.sock.listen()
+        self.port = self.sock.getsockname()[1]
+        self.data = b""
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        conn, _ = self.sock.accept()
+        with conn:
+            while True:
+                chunk = conn.recv(65536)
+                if not chunk:
+                    break
+                self.data += chunk
+
+    def close(self):
+        self.thread.join(timeout=5)
+        self.sock.close()
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _decode_length_frames(data):
+    records = []
+    while data:
+        (size,) = struct.unpack(">I", data[:4])
+        records.append(data[4:4 + size].decode())
+        data = data[4 + size:]
+    return records
+
+
+def test_network_sink_sends_length_prefixed_frames():
+    server = _TcpServer()
+    sink = NetworkSink("127.0.0.1", server.port, framing="length")
+    for i in range(200):
+        sink.write(f"record {i}\n")
+    sink.stop()
+    server.close()
+
+    assert _decode_length_frames(server.data) == [f"record {i}\n" for i in range(200)]
+    assert sink.stats()["sent"] == 200
+
+
+def test_network_sink_buffers_and_reconnects():
+    port = _free_port()
+    sink = NetworkSink("127.0.0.1", port, framing="newline",
+            buffer_size=3, backoff_initial=0.05, backoff_max=0.1)
+    for i in range(5):
+        sink.write(f"record {i}")
+
+    server = _TcpServer(port)
+    deadline = time.time() + 5
+    while sink.stats()["sent"] < 3 and time.time() < deadline:
+        time.sleep(0.02)
+    sink.stop()
+    server.close()
+
+    assert server.data.decode().splitlines() == ["record 2", "record 3", "record 4"]
+    assert sink.stats()["dropped"] == 2
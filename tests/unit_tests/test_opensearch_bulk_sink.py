@@ -0,0 +1,114 @@
+import json
+import threading
+import time
+
+import httpx
+from loguru import logger
+
+from apibean.core.commons.logging.dynamic_sinks import OpensearchBulkSink
+
+
+def _bulk_transport(requests, status_code=200, errors=False):
+    def handler(request):
+        lines = request.content.decode().splitlines()
+        requests.append((str(request.url), lines))
+        items = [{"index": {"status": 400 if errors else 201}} for _ in lines[1::2]]
+        return httpx.Response(status_code, json={"errors": errors, "items": items})
+    return httpx.MockTransport(handler)
+
+
+def test_bulk_sink_flushes_on_batch_size_and_stop():
+    requests = []
+    sink = OpensearchBulkSink("http://opensearch:9200/logs/_doc",
+            batch_size=2, flush_interval=0,
+            transport=_bulk_transport(requests))
+
+    handler_id = logger.add(sink, format="{message}")
+    try:
+        for i in range(5):
+            logger.info(f"message {i}")
+        assert len(requests) == 2
+    finally:
+        logger.remove(handler_id)
+
+    assert len(requests) == 3
+    url, lines = requests[0]
+    assert url == "http://opensearch:9200/logs/_bulk"
+    assert json.loads(lines[0]) == {"index": {}}
+    assert json.loads(lines[1])["message"] == "message 0"
+
+    stats = sink.stats()
+    assert stats["batches"] == 3
+    assert stats["documents"] == 5
+    assert stats["failed_documents"] == 0
+    assert stats["pending_documents"] == 0
+
+
+def test_bulk_sink_reports_failed_items():
+    requests, reports = [], []
+    sink = OpensearchBulkSink("http://opensearch:9200/logs/_doc",
+            batch_size=100, flush_interval=0,
+            on_flush=reports.append,
+            transport=_bulk_transport(requests, errors=True))
+
+    handler_id = logger.add(sink, format="{message}")
+    logger.info("first")
+    logger.info("second")
+    logger.remove(handler_id)
+
+    assert len(reports) == 1
+    assert reports[0]["documents"] == 2
+    assert reports[0]["failed"] == 2
+    assert sink.stats()["failed_batches"] == 1
+
+
+def test_bulk_sink_verifies_certificates_by_default(monkeypatch):
+    created = []
+
+    class RecordingClient(httpx.Client):
+        def __init__(self, **kwargs):
+            created.append(kwargs)
+            super().__init__(**kwargs)
+
+    monkeypatch.setattr(httpx, "Client", RecordingClient)
+    OpensearchBulkSink("https://opensearch:9200/logs/_doc", flush_interval=0).stop()
+    OpensearchBulkSink("https://opensearch:9200/logs/_doc", flush_interval=0, verify_certs=False).stop()
+
+    assert [kwargs["verify"] for kwargs in created] == [True, False]
+
+
+def test_bulk_sink_sends_full_batches_from_the_flusher():
+    gate = threading.Event()
+    threads = []
+
+    def handler(request):
+        threads.append(threading.current_thread().name)
+        gate.wait(5)
+        lines = request.content.decode().splitlines()
+        return httpx.Response(200, json={"errors": False,
+                "items": [{"index": {"status": 201}} for _ in lines[1::2]]})
+
+    sink = OpensearchBulkSink("http://opensearch:9200/logs/_doc",
+            batch_size=1, flush_interval=60, max_pending=2,
+            transport=httpx.MockTransport(handler))
+    assert sink.buffered
+
+    handler_id = logger.add(sink, format="{message}")
+    try:
+        logger.info("message 0")
+        for _ in range(500):
+            if threads:
+                break
+            time.sleep(0.01)
+        for i in range(1, 6):
+            logger.info(f"message {i}")  # không chờ Opensearch
+    finally:
+        gate.set()
+        logger.remove(handler_id)
+
+    # Batch đầu do thread flush gửi; chỉ 2 batch được chờ, 3 batch cũ nhất bị bỏ
+    assert threads[0] == "opensearch-bulk-flusher"
+    stats = sink.stats()
+    assert stats["documents"] == 3
+    assert stats["dropped_documents"] == 3
+    assert stats["pending_documents"] == 0
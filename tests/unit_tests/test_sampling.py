@@ -0,0 +1,108 @@
+import asyncio
+import contextvars
+
+import httpx
+import pytest
+from asgi_correlation_id.context import correlation_id
+from loguru import logger
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from apibean.core.commons.logging import context as ctx
+from apibean.core.commons.logging import DynaLogSinksMiddleware, DynaLogSinksASGIMiddleware
+from apibean.core.commons.logging.dynamic_level import logging_support_patcher
+from apibean.core.commons.logging.dynamic_sinks import dyna_log_sinks_filter_of
+from apibean.core.commons.logging.sampling import configure_sampling, log_sampler
+
+
+@pytest.fixture
+def captured():
+    records = []
+    logger.configure(patcher=logging_support_patcher)
+    handler_id = logger.add(lambda m: records.append(m.record), format="{message}",
+            filter=dyna_log_sinks_filter_of("capture"))
+    yield records
+    logger.remove(handler_id)
+    logger.configure(patcher=None)
+    configure_sampling(sample_rate=1.0, rate_limit=0, burst=10)
+
+
+def _in_request(cid, emit, level_no=0):
+    def run():
+        ctx.request_set_sinks.set(frozenset({"capture"}))
+        ctx.request_log_level_no.set(level_no)
+        correlation_id.set(cid)
+        emit()
+    contextvars.copy_context().run(run)
+
+
+def test_head_sampling_keeps_or_drops_whole_requests(captured):
+    configure_sampling(sample_rate=0.5, report_interval=0)
+
+    def emit():
+        for i in range(3):
+            logger.debug(f"step {i}")
+        logger.warning("always kept")
+
+    for i in range(200):
+        _in_request(f"request-{i}", emit)
+
+    per_request = {}
+    for record in captured:
+        if record["level"].name == "DEBUG":
+            per_request[record["correlation_id"]] = per_request.get(record["correlation_id"], 0) + 1
+    assert set(per_request.values()) == {3}
+    assert 60 < len(per_request) < 140
+    assert sum(1 for r in captured if r["level"].name == "WARNING") == 200
+
+
+def test_rate_limit_per_call_site_and_report(captured):
+    configure_sampling(rate_limit=0.001, burst=5, report_interval=0)
+
+    def emit():
+        for i in range(20):
+            logger.info(f"hot loop {i}")
+        logger.info("other call site")
+
+    _in_request("request-1", emit)
+    assert [r["message"] for r in captured] == [f"hot loop {i}" for i in range(5)] + ["other call site"]
+
+    reports = []
+    _in_request(None, lambda: reports.append(log_sampler.report()))
+    suppressed = reports[0]
+    assert list(suppressed.values()) == [15]
+    assert captured[-1]["message"].startswith("Log sampling suppressed 15 records")
+    assert log_sampler.stats()["pending_call_sites"] == {}
+
+
+def test_rate_limit_ignores_records_below_request_level(captured):
+    configure_sampling(rate_limit=0.001, burst=5, report_interval=0)
+
+    def emit():
+        for i in range(20):
+            logger.debug(f"detail {i}")
+            logger.info(f"step {i}")
+
+    _in_request("request-1", emit, level_no=20)
+    assert [r["message"] for r in captured] == [f"step {i}" for i in range(5)]
+    assert list(log_sampler.stats()["pending_call_sites"].values()) == [15]
+    log_sampler.report()
+
+
+@pytest.mark.parametrize("middleware_class", [DynaLogSinksMiddleware, DynaLogSinksASGIMiddleware])
+def test_sample_rate_header(middleware_class):
+    async def echo(request):
+        return JSONResponse({"sample_rate": ctx.request_sample_rate.get()})
+
+    app = Starlette(routes=[Route("/", echo)], middleware=[Middleware(middleware_class)])
+
+    async def main(headers):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return (await client.get("/", headers=headers)).json()["sample_rate"]
+
+    assert asyncio.run(main({})) is None
+    assert asyncio.run(main({"X-Log-Sample-Rate": "0.25"})) == 0.25
+    assert asyncio.run(main({"X-Log-Sample-Rate": "2"})) is None
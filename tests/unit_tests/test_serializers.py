@@ -0,0 +1,78 @@
+import io
+import json
+
+import pytest
+from loguru import logger
+
+from apibean.core.commons.logging import serializers
+from apibean.core.commons.logging.serializers import (RecordSerializer,
+        serialized_format, resolve_format, JSON_FORMAT)
+
+
+def _capture_records(emit):
+    records = []
+    handler_id = logger.add(lambda message: records.append(message.record), format="{message}")
+    try:
+        emit()
+    finally:
+        logger.remove(handler_id)
+    return records
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_record_serializer_backends_agree(monkeypatch, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr(serializers, "orjson", None)
+    elif serializers.orjson is None:
+        pytest.skip("orjson is not installed")
+
+    def emit():
+        logger.patch(lambda r: r.update(correlation_id="abc")).info("xin chào \"quoted\"")
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            logger.exception("boom")
+
+    info, error = _capture_records(emit)
+    serializer = RecordSerializer(log_file_function=True, log_proc_thread=True)
+
+    document = json.loads(serializer.dumps(info))
+    assert document == json.loads(json.dumps(serializer.to_dict(info), default=str))
+    assert list(document) == ["requestId", "timestamp", "level", "message", "logger",
+            "line", "file", "function", "process", "thread"]
+    assert document["requestId"] == "abc"
+    assert document["message"] == "xin chào \"quoted\""
+
+    document = json.loads(serializer.dumps(error))
+    assert document["level"] == "ERROR"
+    assert document["exception"]["type"] == "ZeroDivisionError"
+
+
+def test_serialized_format_matches_loguru_serialize():
+    native, ours = io.StringIO(), io.StringIO()
+    native_id = logger.add(native, format="{message}", serialize=True)
+    ours_id = logger.add(ours, format=resolve_format(JSON_FORMAT))
+    logger.bind(user="u1").warning("hello")
+    logger.remove(native_id)
+    logger.remove(ours_id)
+
+    expected = json.loads(native.getvalue())
+    actual = json.loads(ours.getvalue())
+    assert resolve_format(JSON_FORMAT) is serialized_format
+    assert actual["text"] == "hello"
+    assert actual["record"].keys() == expected["record"].keys()
+    assert actual["record"]["extra"] == {"user": "u1"}
+    for key in ("level", "message", "line", "function", "name", "time", "process", "thread"):
+        assert actual["record"][key] == expected["record"][key]
+
+
+def test_serialized_format_does_not_leak_into_other_handlers():
+    ours, other = io.StringIO(), io.StringIO()
+    ours_id = logger.add(ours, format=serialized_format)
+    other_id = logger.add(other, format="{message} {extra}")
+    logger.bind(user="u1").info("hello <b>{braces}</b>")
+    logger.remove(ours_id)
+    logger.remove(other_id)
+
+    assert json.loads(ours.getvalue())["text"] == "hello <b>{braces}</b>"
+    assert other.getvalue() == "hello <b>{braces}</b> {'user': 'u1'}\n"
@@ -0,0 +1,131 @@
+import contextvars
+import threading
+
+import pytest
+from loguru import logger
+
+from apibean.core.commons.logging import context as ctx
+from apibean.core.commons.logging.dynamic_sinks import setup_dynamic_loggers
+from apibean.core.commons.logging.shipping import LogShipper, log_shipping_stats
+
+
+class GatedTarget:
+    def __init__(self):
+        self.gate = threading.Event()
+        self.started = threading.Event()
+        self.messages = []
+
+    def __call__(self, message):
+        self.started.set()
+        self.gate.wait(5)
+        self.messages.append(str(message).strip())
+
+
+def _ship(shipper, target, emit):
+    handler_id = logger.add(shipper.wrap("remote", target), format="{message}", enqueue=False)
+    try:
+        emit()
+    finally:
+        target.gate.set()
+        logger.remove(handler_id)
+
+
+@pytest.mark.parametrize("overflow, expected", [
+    ("drop-oldest", ["m0", "m3", "m4"]),
+    ("drop-newest", ["m0", "m1", "m2"]),
+])
+def test_shipper_overflow_drops(overflow, expected):
+    shipper = LogShipper(capacity=2, overflow=overflow, max_batch=1)
+    target = GatedTarget()
+
+    def emit():
+        logger.info("m0")
+        assert target.started.wait(5)  # m0 đang được ship, buffer còn trống
+        for i in range(1, 5):
+            logger.info(f"m{i}")
+        stats = shipper.stats()
+        assert stats["queued"] == 2
+        assert stats["dropped"] == 2
+
+    _ship(shipper, target, emit)
+    assert target.messages == expected
+    assert shipper.stats()["shipped"] == 3
+
+
+def test_shipper_sample_keeps_important_records():
+    shipper = LogShipper(capacity=2, overflow="sample", keep_level="WARNING", max_batch=1)
+    target = GatedTarget()
+
+    def emit():
+        logger.info("m0")
+        assert target.started.wait(5)
+        logger.info("m1")
+        logger.info("m2")
+        logger.debug("dropped")
+        logger.error("m3")
+
+    _ship(shipper, target, emit)
+    assert target.messages == ["m0", "m2", "m3"]
+
+
+def test_shipper_block_waits_for_room():
+    shipper = LogShipper(capacity=1, overflow="block", block_timeout=5, max_batch=1)
+    target = GatedTarget()
+
+    def emit():
+        logger.info("m0")
+        assert target.started.wait(5)
+        logger.info("m1")
+        threading.Timer(0.05, target.gate.set).start()
+        logger.info("m2")  # chờ tới khi worker lấy m1 khỏi buffer
+
+    _ship(shipper, target, emit)
+    assert target.messages == ["m0", "m1", "m2"]
+    assert shipper.stats()["dropped"] == 0
+
+
+def test_remote_sinks_share_one_shipper():
+    received = []
+    setup_dynamic_loggers({
+        "stdout": {"enabled": False},
+        "file": {"enabled": False},
+        "network": {"enabled": True, "target": lambda m: received.append(("network", m.strip()))},
+        "syslog": {"enabled": True, "target": lambda m: received.append(("syslog", m.strip()))},
+    }, shipping={"capacity": 100})
+
+    def emit():
+        ctx.request_set_sinks.set(frozenset({"network", "syslog"}))
+        logger.info("shipped")
+
+    try:
+        contextvars.copy_context().run(emit)
+        stats = log_shipping_stats()
+        assert stats["capacity"] == 100
+        assert set(stats["sinks"]) == {"network", "syslog"}
+    finally:
+        logger.remove()
+        ctx.CURRENT_SINKS.clear()
+
+    assert sorted(received) == [("network", "shipped"), ("syslog", "INFO: shipped")]
+
+
+def test_buffered_remote_sinks_are_not_shipped_again():
+    from apibean.core.commons.logging.dynamic_sinks import live_sinks, remove_sink
+
+    setup_dynamic_loggers({
+        "stdout": {"enabled": False},
+        "file": {"enabled": False},
+        "opensearch": {"enabled": True, "params": {"url": "http://opensearch:9200/logs/_doc",
+                "bulk": True, "flush_interval": 5}},
+    })
+    try:
+        live = live_sinks()["opensearch"]
+    finally:
+        remove_sink("opensearch")
+        ctx.CURRENT_SINKS.clear()
+
+    # Bulk sink có thread flush riêng: không qua LogShipper, không enqueue
+    assert live["sink"] == "OpensearchBulkSink"
+    assert live["shipped"] is False
+    assert live["enqueue"] is False
+    assert "opensearch" not in log_shipping_stats()["sinks"]
@@ -0,0 +1,233 @@
+import threading
+import time
+
+import pytest
+from loguru import logger
+
+from apibean.core.commons.logging import context as ctx
+from apibean.core.commons.logging.context import CURRENT_SINKS
+from apibean.core.commons.logging.dynamic_level import HANDLER_RETIRE_DELAY
+from apibean.core.commons.logging.dynamic_sinks import (
+    setup_dynamic_loggers, update_sink_config, remove_sink, live_sinks,
+)
+
+
+@pytest.fixture
+def memory_sink():
+    messages = []
+    setup_dynamic_loggers({
+        "stdout": {"enabled": False},
+        "file": {"enabled": False},
+        "memory": {"target": messages.append, "format": "{message}", "level": "INFO", "enqueue": False},
+    })
+    token = ctx.request_set_sinks.set(frozenset({"memory"}))
+    yield messages
+    ctx.request_set_sinks.reset(token)
+    remove_sink("memory")
+    CURRENT_SINKS.pop("memory", None)
+
+
+def _texts(messages):
+    return [str(m).rstrip("\n") for m in messages]
+
+
+def test_same_config_keeps_handlers(memory_sink):
+    before = live_sinks()
+    actions = setup_dynamic_loggers(None)
+    assert actions["memory"] == "unchanged"
+    assert live_sinks() == before
+
+
+def test_raising_level_keeps_handler(memory_sink):
+    handler_id = live_sinks()["memory"]["handler_id"]
+    assert update_sink_config("memory", {"level": "WARNING"}) == "level"
+    assert live_sinks()["memory"]["handler_id"] == handler_id
+
+    logger.info("hidden")
+    logger.warning("shown")
+    assert _texts(memory_sink) == ["shown"]
+
+
+def test_lowering_level_replaces_handler(memory_sink):
+    handler_id = live_sinks()["memory"]["handler_id"]
+    assert update_sink_config("memory", {"level": "DEBUG"}) == "replaced"
+    assert live_sinks()["memory"]["handler_id"] != handler_id
+
+    logger.debug("detail")
+    assert _texts(memory_sink) == ["detail"]
+
+    # Handler cũ được giữ thêm một lúc rồi mới bị xoá
+    time.sleep(HANDLER_RETIRE_DELAY + 0.2)
+    assert handler_id not in logger._core.handlers
+
+
+def test_invalid_level_is_rejected(memory_sink):
+    handler_id = live_sinks()["memory"]["handler_id"]
+    with pytest.raises(ValueError):
+        update_sink_config("memory", {"level": "NOPE"})
+    assert CURRENT_SINKS["memory"]["level"] == "INFO"
+    assert live_sinks()["memory"]["handler_id"] == handler_id
+
+
+def test_format_change_swaps_handler(memory_sink):
+    logger.info("one")
+    assert update_sink_config("memory", {"format": "[{level}] {message}"}) == "replaced"
+    logger.info("two")
+    assert _texts(memory_sink) == ["one", "[INFO] two"]
+
+
+def test_swaps_neither_lose_nor_duplicate_records(memory_sink):
+    stop = threading.Event()
+    sent = []
+
+    def produce():
+        ctx.request_set_sinks.set(frozenset({"memory"}))
+        i = 0
+        while not stop.is_set():
+            logger.info(f"{i}")
+            sent.append(i)
+            i += 1
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    for i in range(30):
+        update_sink_config("memory", {"format": "{message}" + " " * (i % 2)})
+    stop.set()
+    producer.join()
+
+    received = [int(text) for text in _texts(memory_sink)]
+    assert sorted(received) == sent
+
+
+def test_remove_sink(memory_sink):
+    handler_id = live_sinks()["memory"]["handler_id"]
+    assert remove_sink("memory")
+    assert "memory" not in live_sinks()
+    assert handler_id not in logger._core.handlers
+
+    logger.info("dropped")
+    assert memory_sink == []
+    assert not remove_sink("unknown")
+
+
+def test_rejected_change_leaves_defaults_untouched(memory_sink):
+    from apibean.core.commons.logging.context import AVAILABLE_SINKS
+    rotation = AVAILABLE_SINKS["file"]["rotation"]
+
+    with pytest.raises(ValueError):
+        update_sink_config("file", {"enabled": True, "target": "/tmp/reconfigure.log", "rotation": "bogus"})
+    assert AVAILABLE_SINKS["file"]["rotation"] == rotation
+    assert CURRENT_SINKS["file"]["rotation"] == rotation
+    assert CURRENT_SINKS["file"] is not AVAILABLE_SINKS["file"]
+    setup_dynamic_loggers({"file": {"enabled": False}})
+
+
+def test_sink_routes_only_accept_std_targets(memory_sink):
+    import asyncio
+
+    import httpx
+    from fastapi import FastAPI
+    from apibean.core.commons.logging.routes import router
+
+    app = FastAPI()
+    app.include_router(router)
+
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            statuses = [
+                (await client.put("/loggers/sinks/other", json={"target": "/tmp/other.log"})).status_code,
+                (await client.put("/loggers/sinks/memory", json={"target": "/tmp/other.log"})).status_code,
+                (await client.put("/loggers/sinks/unknown", json={"level": "INFO"})).status_code,
+                (await client.put("/loggers/sinks/memory", json={"level": "warning"})).status_code,
+            ]
+            listed = (await client.get("/loggers/sinks")).json()
+            return statuses, listed
+
+    statuses, listed = asyncio.run(main())
+    assert statuses == [400, 400, 404, 200]
+    assert "other" not in CURRENT_SINKS
+    assert listed["sinks"]["memory"]["level"] == "WARNING"
+
+
+def test_switch_between_filters_does_not_duplicate():
+    from datetime import datetime, timezone
+    from types import SimpleNamespace
+    from apibean.core.commons.logging.dynamic_sinks import dyna_log_sinks_filter_of, _sink_state_of
+
+    state = _sink_state_of("switching")
+    old_filter = dyna_log_sinks_filter_of("switching", state.generation)
+    new_filter = dyna_log_sinks_filter_of("switching", state.generation + 1)
+    token = ctx.request_set_sinks.set(frozenset({"switching"}))
+    try:
+        record = {"level": SimpleNamespace(no=20), "time": datetime.now(timezone.utc), "extra": {}}
+        assert old_filter(record)
+        state.switch(state.generation + 1)  # giữa filter của handler cũ và handler mới
+        assert not new_filter(record)
+
+        record = {"level": SimpleNamespace(no=20), "time": datetime.now(timezone.utc), "extra": {}}
+        assert not old_filter(record)
+        assert new_filter(record)
+    finally:
+        ctx.request_set_sinks.reset(token)
+
+
+def test_sink_routes_reject_destination_params(memory_sink):
+    import asyncio
+
+    import httpx
+    from fastapi import FastAPI
+    from apibean.core.commons.logging.routes import router
+
+    app = FastAPI()
+    app.include_router(router)
+    requests = [
+        ("opensearch", {"url": "http://attacker:9200/logs/_doc"}),
+        ("opensearch", {"username": "admin", "password": "x"}),
+        ("network", {"host": "attacker", "port": 9009}),
+        ("network", {"protocol": "unix"}),
+        ("syslog", {"address": "/tmp/other.sock"}),
+        ("file", {"socket_path": "/tmp/other.sock"}),
+        ("memory", {"anything": 1}),
+    ]
+    opensearch = dict(CURRENT_SINKS["opensearch"]["params"])
+
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return [(await client.put(f"/loggers/sinks/{name}", json={"params": params})).status_code
+                    for name, params in requests]
+
+    assert asyncio.run(main()) == [400] * len(requests)
+    assert CURRENT_SINKS["opensearch"]["params"] == opensearch
+
+
+def test_loggers_route_reports_remote_sink_destination(memory_sink):
+    import asyncio
+
+    import httpx
+    from fastapi import FastAPI
+    from apibean.core.commons.logging.routes import router
+
+    app = FastAPI()
+    app.include_router(router)
+    update_sink_config("opensearch", {"enabled": True, "params": {"url": "http://opensearch:9200/logs/_doc"}})
+
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return (await client.get("/loggers/opensearch")).json(), (await client.get("/loggers/memory")).json()
+
+    try:
+        opensearch, memory = asyncio.run(main())
+    finally:
+        remove_sink("opensearch")
+
+    # Sink từ xa được ship bởi LogShipper: handler không dùng enqueue
+    assert opensearch["type"] == "opensearch"
+    assert opensearch["target"] == "http://opensearch:9200/logs/_doc"
+    assert opensearch["enqueue"] is False
+    assert opensearch["handler"]["shipped"] is True
+    assert opensearch["handler"]["sink"] == "OpensearchSink"
+    assert memory["type"] == "function"
+    assert memory["enqueue"] is False
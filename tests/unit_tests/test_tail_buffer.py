@@ -0,0 +1,120 @@
+import asyncio
+
+import httpx
+import pytest
+from loguru import logger
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from apibean.core.commons.logging import DynaLogSinksMiddleware, DynaLogSinksASGIMiddleware
+from apibean.core.commons.logging.decorators import log_function
+from apibean.core.commons.logging.dynamic_level import logging_support_patcher
+from apibean.core.commons.logging.dynamic_sinks import dyna_log_sinks_filter_of
+from apibean.core.commons.logging.tail_buffer import configure_tail_buffer, tail_buffer_stats
+
+
+async def ok(request):
+    logger.debug("ok detail")
+    logger.info("ok done")
+    return PlainTextResponse("ok")
+
+
+async def fail(request):
+    logger.debug("fail detail")
+    return PlainTextResponse("fail", status_code=503)
+
+
+async def boom(request):
+    logger.debug("boom detail")
+    raise RuntimeError("boom")
+
+
+@log_function
+def compute(value):
+    return value * 2
+
+
+async def decorated(request):
+    compute(21)
+    return PlainTextResponse("decorated", status_code=500)
+
+
+async def error(request):
+    logger.debug("error detail 1")
+    logger.error("error logged")
+    logger.debug("error detail 2")
+    return PlainTextResponse("handled")
+
+
+@pytest.fixture
+def captured():
+    records = []
+    logger.configure(patcher=logging_support_patcher)
+    handler_id = logger.add(lambda m: records.append(m.record), format="{message}",
+            filter=dyna_log_sinks_filter_of("capture"))
+    configure_tail_buffer(enabled=True, max_records=100)
+    yield records
+    configure_tail_buffer(enabled=False)
+    logger.remove(handler_id)
+    logger.configure(patcher=None)
+
+
+def _get(middleware_class, path, headers=None):
+    app = Starlette(routes=[Route(f"/{name}", fn) for name, fn in
+                [("ok", ok), ("fail", fail), ("boom", boom), ("error", error),
+                    ("decorated", decorated)]],
+            middleware=[Middleware(middleware_class, default_level="INFO", default_sinks="capture")])
+
+    async def main():
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return (await client.get(path, headers=headers)).status_code
+
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("middleware_class", [DynaLogSinksMiddleware, DynaLogSinksASGIMiddleware])
+def test_tail_buffer_flushes_only_failed_requests(captured, middleware_class):
+    assert _get(middleware_class, "/ok") == 200
+    assert [r["message"] for r in captured] == ["ok done"]
+
+    assert _get(middleware_class, "/fail") == 503
+    assert [r["message"] for r in captured[1:]] == ["fail detail"]
+    assert captured[-1]["function"] == "fail"
+    assert captured[-1]["level"].name == "DEBUG"
+
+    assert _get(middleware_class, "/boom") == 500
+    assert captured[2]["message"] == "boom detail"
+
+    assert _get(middleware_class, "/error") == 200
+    assert [r["message"] for r in captured[3:]] == ["error detail 1", "error logged", "error detail 2"]
+
+    # X-Log-Sinks vẫn quyết định sink nhận các record phát lại
+    count = len(captured)
+    assert _get(middleware_class, "/fail", {"X-Log-Sinks": "null"}) == 503
+    assert len(captured) == count
+
+    stats = tail_buffer_stats()
+    assert stats["buffered"] == 0
+    assert stats["active_requests"] == 0
+
+
+@pytest.mark.parametrize("middleware_class", [DynaLogSinksMiddleware, DynaLogSinksASGIMiddleware])
+def test_tail_buffer_keeps_decorator_records(captured, middleware_class):
+    assert _get(middleware_class, "/decorated") == 500
+    messages = [r["message"] for r in captured]
+    assert len(messages) == 2
+    assert "compute function started" in messages[0]
+    assert "compute ... done" in messages[1]
+
+
+def test_tail_buffer_global_cap(captured):
+    configure_tail_buffer(max_total_records=0)
+    try:
+        assert _get(DynaLogSinksASGIMiddleware, "/fail") == 503
+    finally:
+        configure_tail_buffer(max_total_records=100000)
+    assert captured == []
+    assert tail_buffer_stats()["dropped"] >= 1
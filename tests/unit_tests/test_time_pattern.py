@@ -0,0 +1,31 @@
+import time
+
+from apibean.core.commons.logging import utils
+from apibean.core.commons.logging.utils import compile_time_pattern, format_time_pattern
+
+# 2024-03-09 23:59:59 UTC
+BEFORE_MIDNIGHT = 1710028799.5
+
+
+def test_compile_time_pattern():
+    assert compile_time_pattern("http://host/logs/_doc") == (None, 0)
+    assert compile_time_pattern("http://host/logs-{time:YYYY.MM.DD}/_doc?q=100%") == \
+            ("http://host/logs-%Y.%m.%d/_doc?q=100%%", 86400)
+    assert compile_time_pattern("logs-{time:YYYY.MM.DD-HH}")[1] == 3600
+
+
+def test_templates_are_cached_separately_and_roll_over(monkeypatch):
+    utils._time_pattern_cache.clear()
+    clock = [BEFORE_MIDNIGHT]
+    monkeypatch.setattr(time, "time", lambda: clock[0])
+
+    daily = "http://host/app-{time:YYYY.MM.DD}/_doc"
+    monthly = "http://host/audit-{time:YYYY-MM}/_doc"
+    assert format_time_pattern(daily) == "http://host/app-2024.03.09/_doc"
+    assert format_time_pattern(monthly) == "http://host/audit-2024-03/_doc"
+    assert format_time_pattern(daily) == "http://host/app-2024.03.09/_doc"
+
+    clock[0] += 1
+    assert format_time_pattern(daily) == "http://host/app-2024.03.10/_doc"
+    assert format_time_pattern(monthly) == "http://host/audit-2024-03/_doc"
+    assert format_time_pattern("http://host/plain") == "http://host/plain"
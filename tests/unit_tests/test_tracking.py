@@ -0,0 +1,224 @@
+from types import SimpleNamespace
+
+import pytest
+
+from apibean.core.commons.tracking.decorators import (track_creations_on_service,
+        LimitExceededError)
+
+
+class ProductService:
+    def __init__(self, tenant_code):
+        self.api_invoker = SimpleNamespace(tenant_code=tenant_code)
+
+
+def _tracked_create(redis_client, **options):
+    @track_creations_on_service("product", redis_client=redis_client,
+            default_limit_value=3, **options)
+    def create(service, name):
+        return name
+    return create
+
+
+def test_tracking_counts_creations_until_the_limit(redis_client):
+    create = _tracked_create(redis_client)
+    service = ProductService("acme")
+
+    assert [create(service, f"p{i}") for i in range(3)] == ["p0", "p1", "p2"]
+    with pytest.raises(LimitExceededError):
+        create(service, "p3")
+    assert redis_client.store["limitation_acme_product_count"] == b"3"
+
+
+def test_tracking_pipelined_reads_with_cached_limit(redis_client):
+    create = _tracked_create(redis_client, limit_cache_ttl=60)
+    service = ProductService("acme")
+
+    create(service, "p0")  # MGET, SETNX pipeline, INCR
+    assert redis_client.round_trips == 3
+
+    redis_client.round_trips = 0
+    create(service, "p1")  # GET count + INCR
+    assert redis_client.round_trips == 2
+
+    create(service, "p2")
+    with pytest.raises(LimitExceededError):
+        create(service, "p3")
+    assert redis_client.store["limitation_acme_product_count"] == b"3"
+
+
+def test_tracking_atomic_reservation_releases_slot_on_failure(redis_client):
+    calls = []
+
+    @track_creations_on_service("product", redis_client=redis_client,
+            default_limit_value=2, atomic=True)
+    def create(service, name):
+        calls.append(name)
+        if name == "bad":
+            raise ValueError(name)
+        return name
+
+    service = ProductService("acme")
+    with pytest.raises(ValueError):
+        create(service, "bad")
+    assert redis_client.store["limitation_acme_product_count"] == b"0"
+
+    redis_client.round_trips = 0
+    assert create(service, "p0") == "p0"
+    assert redis_client.round_trips == 1  # EVALSHA only
+
+    create(service, "p1")
+    with pytest.raises(LimitExceededError):
+        create(service, "p2")
+    assert calls == ["bad", "p0", "p1"]
+    assert redis_client.store["limitation_acme_product_count"] == b"2"
+
+
+def test_tracking_atomic_reservation_releases_slot_on_interrupt(redis_client):
+    @track_creations_on_service("product", redis_client=redis_client,
+            default_limit_value=1, atomic=True)
+    def create(service, name):
+        raise KeyboardInterrupt()
+
+    with pytest.raises(KeyboardInterrupt):
+        create(ProductService("acme"), "p0")
+    assert redis_client.store["limitation_acme_product_count"] == b"0"
+
+
+@pytest.mark.parametrize("options", [{}, {"limit_cache_ttl": 60}, {"atomic": True}])
+def test_tracking_async_service_uses_async_client(async_redis_client, options):
+    import asyncio
+
+    @track_creations_on_service("product", redis_client=async_redis_client,
+            default_limit_value=2, **options)
+    async def create(service, name):
+        await asyncio.sleep(0)
+        return name
+
+    async def main():
+        service = ProductService("acme")
+        assert await create(service, "p0") == "p0"
+        assert await create(service, "p1") == "p1"
+        with pytest.raises(LimitExceededError):
+            await create(service, "p2")
+
+    asyncio.run(main())
+    assert async_redis_client.store["limitation_acme_product_count"] == b"2"
+
+
+def test_tracking_leases_blocks_of_slots(redis_client):
+    @track_creations_on_service("product", redis_client=redis_client,
+            default_limit_value=7, lease_size=5, lease_flush_interval=60)
+    def create(service, name):
+        return name
+
+    service = ProductService("acme")
+    count_key = "limitation_acme_product_count"
+
+    create(service, "p0")
+    assert redis_client.store[count_key] == b"5"
+    redis_client.round_trips = 0
+    for i in range(1, 5):
+        create(service, f"p{i}")
+    assert redis_client.round_trips == 0
+
+    create(service, "p5")  # the next lease only gets the 2 remaining slots
+    assert redis_client.store[count_key] == b"7"
+    create(service, "p6")
+    with pytest.raises(LimitExceededError):
+        create(service, "p7")
+
+    create.leases.flush()
+    assert redis_client.store[count_key] == b"7"
+
+
+def test_tracking_leases_release_slot_on_interrupt(redis_client):
+    @track_creations_on_service("product", redis_client=redis_client,
+            default_limit_value=1, lease_size=1, lease_flush_interval=60)
+    def create(service, name):
+        raise KeyboardInterrupt()
+
+    with pytest.raises(KeyboardInterrupt):
+        create(ProductService("acme"), "p0")
+    create.leases.flush()  # slot trả về lease được trả lại Redis
+    assert redis_client.store["limitation_acme_product_count"] == b"0"
+
+
+def test_tracking_leases_return_unused_slots_on_flush(redis_client):
+    @track_creations_on_service("product", redis_client=redis_client,
+            lease_size=10, lease_flush_interval=60)
+    def create(service, name):
+        return name
+
+    create(ProductService("acme"), "p0")
+    assert redis_client.store["limitation_acme_product_count"] == b"10"
+    create.leases.flush()
+    assert redis_client.store["limitation_acme_product_count"] == b"1"
+
+
+class CommandAsyncRedis:
+    """redis.asyncio style: commands are plain methods returning awaitables."""
+    def __init__(self, client):
+        self.client = client
+        self.store = client.store
+
+    def __getattr__(self, name):
+        command = getattr(self.client, name)
+        if name == "pipeline":
+            return command
+        def call(*args):
+            return command(*args)
+        return call
+
+
+@pytest.mark.parametrize("wrap", [False, True])
+def test_tracking_async_leases_are_returned(async_redis_client, wrap):
+    import asyncio
+
+    client = CommandAsyncRedis(async_redis_client) if wrap else async_redis_client
+
+    @track_creations_on_service("product", redis_client=client,
+            lease_size=10, lease_flush_interval=60)
+    async def create(service, name):
+        return name
+
+    count_key = "limitation_acme_product_count"
+
+    async def main():
+        await create(ProductService("acme"), "p0")
+        assert client.store[count_key] == b"10"
+        create.leases.flush()  # không thể chờ loop của chính thread này: lease được giữ lại
+        assert client.store[count_key] == b"10"
+        assert create.leases._leases
+
+        # Từ thread khác, slot được trả lại trên event loop của lease
+        await asyncio.to_thread(create.leases.flush)
+        assert client.store[count_key] == b"1"
+
+        await create(ProductService("acme"), "p1")
+        await create.leases.aclose()
+
+    asyncio.run(main())
+    assert client.store[count_key] == b"2"
+
+
+@pytest.mark.parametrize("options", [{"atomic": True}, {"lease_size": 1}])
+def test_tracking_cancelled_request_releases_its_slot(async_redis_client, options):
+    import asyncio
+
+    @track_creations_on_service("product", redis_client=async_redis_client,
+            default_limit_value=1, **options)
+    async def create(service, name):
+        await asyncio.sleep(10)
+        return name
+
+    async def main():
+        task = asyncio.create_task(create(ProductService("acme"), "p0"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        if create.leases is not None:
+            await create.leases.aclose()  # slot trả về lease được trả lại Redis
+
+    asyncio.run(main())
+    assert async_redis_client.store["limitation_acme_product_count"] == b"0"
@@ -0,0 +1,75 @@
+import pytest
+
+from apibean.core.utils.version import (get_app_version, invalidate_version_cache,
+        read_pyproject_project_table)
+
+PYPROJECT = """\
+[build-system]
+requires = ["setuptools"]
+
+[project]
+name = "{name}"
+version = "{version}"
+dependencies = [
+    "loguru",
+]
+
+[tool.pytest.ini_options]
+pythonpath = ["src"]
+"""
+
+
+@pytest.fixture(autouse=True)
+def clean_cache(monkeypatch):
+    monkeypatch.delenv("APP_VERSION", raising=False)
+    invalidate_version_cache()
+    yield
+    invalidate_version_cache()
+
+
+def _write_pyproject(path, name, version):
+    path.write_text(PYPROJECT.format(name=name, version=version))
+    return str(path)
+
+
+def test_version_is_cached_per_source(tmp_path):
+    first = _write_pyproject(tmp_path / "first.toml", "first", "1.0.0")
+    second = _write_pyproject(tmp_path / "second.toml", "second", "2.0.0")
+
+    assert get_app_version(pyproject_path=first) == "1.0.0"
+    assert get_app_version(pyproject_path=second) == "2.0.0"
+
+    _write_pyproject(tmp_path / "first.toml", "first", "1.1.0")
+    assert get_app_version(pyproject_path=first) == "1.0.0"
+    assert get_app_version(pyproject_path=first, refresh=True) == "1.1.0"
+
+    _write_pyproject(tmp_path / "second.toml", "second", "2.1.0")
+    invalidate_version_cache()
+    assert get_app_version(pyproject_path=second) == "2.1.0"
+
+
+def test_version_sources_priority(tmp_path, monkeypatch):
+    pyproject = _write_pyproject(tmp_path / "pyproject.toml", "app", "0.0.1")
+    version_file = tmp_path / "VERSION"
+    version_file.write_text("3.0.0\n")
+
+    assert get_app_version(pyproject_path=pyproject,
+            distribution_name="loguru") not in ("0.0.1", None)
+    assert get_app_version(pyproject_path=pyproject, version_file_path=str(version_file),
+            distribution_name="loguru") == "3.0.0"
+    assert get_app_version(pyproject_path=pyproject,
+            distribution_name="no-such-distribution-xyz") == "0.0.1"
+
+    monkeypatch.setenv("APP_VERSION", " 9.9.9 ")
+    assert get_app_version(pyproject_path=pyproject) == "9.9.9"
+
+
+def test_read_only_project_table(tmp_path):
+    path = tmp_path / "pyproject.toml"
+    path.write_text(PYPROJECT.format(name="app", version="1.2.3") + "[tool.broken]\nkey = = 1\n")
+
+    project = read_pyproject_project_table(str(path))
+    assert project == {"name": "app", "version": "1.2.3", "dependencies": ["loguru"]}
+
+    with pytest.raises(RuntimeError):
+        get_app_version()